@@ -0,0 +1,80 @@
+"""
+Benchmark: pure-Python vs NumPy backends of the Monte Carlo simulations
+in probability/montecarlo_nelson.py.
+
+Runs simulate_rating_geq_k and simulate_customer_rents_geq_2 with every
+backend ("python", "numpy", "binomial") for 10^3 ... 10^8 trials and prints
+the time per call, the trials per second and the speedup over "python". The pure-Python backend is
+skipped above --max-python trials (it runs at roughly a million trials per
+second, so 10^8 would take minutes).
+
+By default the data is synthetic, shaped like public.rentings (no database
+needed). Use --db to load the real rentings instead.
+
+Usage:
+    python benchmarks/bench_montecarlo.py [--max-exp 8] [--max-python 10000000] [--db]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "probability"))
+
+import montecarlo_nelson as mc  # noqa: E402
+
+
+def synthetic_rentings(n=20_000, customers=12_000, seed=42):
+    rnd = random.Random(seed)
+    ratings = [None if rnd.random() < 0.16 else rnd.randint(1, 10) for _ in range(n)]
+    customer_ids = [rnd.randint(1, customers) for _ in range(n)]
+    return ratings, customer_ids
+
+
+def time_call(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-exp", type=int, default=8, help="largest run is 10^max-exp trials")
+    parser.add_argument("--max-python", type=int, default=10_000_000, help="skip the python backend above this")
+    parser.add_argument("--db", action="store_true", help="use public.rentings instead of synthetic data")
+    args = parser.parse_args()
+
+    ratings, customer_ids = mc.load_rentings_data() if args.db else synthetic_rentings()
+    print(f"{len(ratings)} rentings, {len(set(customer_ids))} customers\n")
+
+    simulations = {
+        "rating_geq_4": lambda n, backend: mc.simulate_rating_geq_k(ratings, n, 4, 42, backend),
+        "customer_geq_2": lambda n, backend: mc.simulate_customer_rents_geq_2(customer_ids, n, 42, backend),
+    }
+    for simulate in simulations.values():
+        for backend in mc.BACKENDS:
+            simulate(10, backend)   # warm-up (imports NumPy)
+
+    print(f"{'simulation':<16} {'trials':>11} {'backend':<8} {'seconds':>9} {'trials/s':>14} {'p_hat':>8} {'speedup':>8}")
+    for name, simulate in simulations.items():
+        for exp in range(3, args.max_exp + 1):
+            n = 10 ** exp
+            seconds = {}
+            for backend in mc.BACKENDS:
+                if backend == "python" and n > args.max_python:
+                    print(f"{name:<16} {n:>11,} {backend:<8} {'skipped':>9}")
+                    continue
+                seconds[backend], (p_hat, _, _) = time_call(simulate, n, backend)
+                speedup = ""
+                if backend != "python" and "python" in seconds:
+                    speedup = f"{seconds['python'] / seconds[backend]:.1f}x"
+                print(f"{name:<16} {n:>11,} {backend:<8} {seconds[backend]:>9.4f}"
+                      f" {n / seconds[backend]:>14,.0f} {p_hat:>8.4f} {speedup:>8}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark: multi-process scaling of the Monte Carlo simulation
+in numpy/montecarlonumpyT5_nelson.py.
+
+Runs simulate_event_chunked for a fixed number of draws with 1, 2, 4, ...
+workers (up to --max-workers, default: all cores) and prints wall time,
+draws per second, speedup and parallel efficiency against one worker.
+Every worker count is run twice with the same seed to check that the
+result is bit-for-bit the same.
+
+The data is synthetic, shaped like the rated rentings (no database needed).
+
+Usage:
+    python benchmarks/bench_montecarlo_parallel.py [--trials 1000000000] [--max-workers 32]
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "numpy"))
+
+import numpy as np  # noqa: E402
+
+import montecarlonumpyT5_nelson as t5  # noqa: E402
+
+
+def worker_counts(max_workers):
+    counts, k = [], 1
+    while k < max_workers:
+        counts.append(k)
+        k *= 2
+    return counts + [max_workers]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--trials", type=int, default=10**9)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    ratings = np.random.default_rng(0).integers(1, 11, size=16_800, dtype=np.int16)
+    hit = ratings >= 4
+    print(f"{args.trials:,} draws, {os.cpu_count()} cores\n")
+
+    print(f"{'workers':>7} {'seconds':>9} {'draws/s':>14} {'speedup':>8} {'efficiency':>10} {'p_hat':>10} {'repeatable':>10}")
+    base = None
+    for workers in worker_counts(args.max_workers):
+        start = time.perf_counter()
+        p_hat, _, trace = t5.simulate_event_chunked(hit, args.trials, args.seed, workers=workers)
+        seconds = time.perf_counter() - start
+
+        p_again, _, trace_again = t5.simulate_event_chunked(hit, args.trials, args.seed, workers=workers)
+        same = p_hat == p_again and np.array_equal(trace, trace_again)
+
+        base = base or seconds
+        print(f"{workers:>7} {seconds:>9.3f} {args.trials / seconds:>14,.0f} {base / seconds:>7.2f}x"
+              f" {base / seconds / workers:>10.0%} {p_hat:>10.6f} {'yes' if same else 'NO':>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark: per-query latency with and without the connection pool.
+
+Runs the same small catalog of menu queries N times:
+- "fresh":  get_connection() + query + close()   (old behaviour of _fetch_all)
+- "pooled": pooled_connection() + query           (current behaviour)
+
+Usage:
+    python benchmarks/bench_pool.py [--repeat 50]
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from server import ConnectionPool, get_connection  # noqa: E402
+
+QUERIES = {
+    "task4_total_movies": "SELECT COUNT(movie_id) AS total_movies FROM public.movies;",
+    "task4_avg_rating": "SELECT AVG(rating) AS avg_rating FROM public.rentings WHERE rating IS NOT NULL;",
+    "task5_movies_per_genre": """
+        SELECT genre, COUNT(movie_id) AS movie_count
+        FROM public.movies
+        GROUP BY genre
+        ORDER BY movie_count DESC;
+    """,
+}
+
+
+def _run(conn, query):
+    with conn.cursor() as cur:
+        cur.execute(query)
+        cur.fetchall()
+
+
+def bench_fresh(query, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn = get_connection()
+        try:
+            _run(conn, query)
+        finally:
+            conn.close()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def bench_pooled(pool, query, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn = pool.getconn()
+        try:
+            _run(conn, query)
+        finally:
+            pool.putconn(conn)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summary(timings):
+    ordered = sorted(timings)
+    p95 = ordered[max(0, int(round(0.95 * len(ordered))) - 1)]
+    return statistics.mean(ordered), statistics.median(ordered), p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    pool = ConnectionPool(min_size=1, max_size=2)
+    try:
+        print(f"{'query':<26} {'mode':<7} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+        for label, query in QUERIES.items():
+            for mode, timings in (
+                ("fresh", bench_fresh(query, args.repeat)),
+                ("pooled", bench_pooled(pool, query, args.repeat)),
+            ):
+                mean, p50, p95 = summary(timings)
+                print(f"{label:<26} {mode:<7} {mean:>9.2f} {p50:>9.2f} {p95:>9.2f}")
+        print(f"\nPool stats: {pool.stats}")
+    finally:
+        pool.closeall()
+
+
+if __name__ == "__main__":
+    main()
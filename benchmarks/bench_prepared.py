@@ -0,0 +1,89 @@
+"""
+Benchmark: simple-protocol queries vs server-side prepared statements.
+
+Each Task 3–7 statement is run N times with varying parameters
+(release years, countries, ratings, HAVING thresholds) on a plain connection,
+so the query cache is not involved:
+- "simple":   cursor.execute(sql, params)  -> parsed and planned on every call
+- "prepared": EXECUTE name (params)        -> parsed once per connection
+
+Planning time per call is taken from EXPLAIN (SUMMARY, FORMAT JSON).
+
+Usage:
+    python benchmarks/bench_prepared.py [--repeat 200]
+"""
+import argparse
+import itertools
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from server import QUERY_CATALOG, _ensure_prepared, get_connection  # noqa: E402
+
+YEARS = [1995, 2000, 2005, 2010, 2015, 2018]
+COUNTRIES = ["Canada", "USA", "Germany", "France", "Spain", "Italy"]
+
+# statement name -> parameter tuples to cycle through
+PARAMS = {
+    "task3_movies_released_after": [(y,) for y in YEARS],
+    "task3_customers_from_country": [(c,) for c in COUNTRIES],
+    "task3_rentings_rating_at_least": [(r,) for r in range(1, 11)],
+    "task7_genres_with_more_than": [(n,) for n in range(1, 6)],
+    "task7_movies_avg_rating_above": [(r,) for r in range(1, 8)],
+    "task7_customers_with_more_than": [(n,) for n in range(1, 10)],
+}
+
+
+def _time_calls(conn, sql, param_sets, repeat):
+    timings = []
+    params = itertools.cycle(param_sets)
+    with conn.cursor() as cur:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cur.execute(sql, next(params))
+            cur.fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+    conn.rollback()
+    return timings
+
+
+def _planning_ms(conn, sql, params):
+    with conn.cursor() as cur:
+        cur.execute(f"EXPLAIN (SUMMARY, FORMAT JSON) {sql}", params)
+        plan = cur.fetchone()[0]
+    conn.rollback()
+    return plan[0]["Planning Time"]
+
+
+def summary(timings):
+    ordered = sorted(timings)
+    p95 = ordered[max(0, int(round(0.95 * len(ordered))) - 1)]
+    return statistics.mean(ordered), statistics.median(ordered), p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    conn = get_connection()
+    try:
+        print(f"{'statement':<32} {'mode':<9} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'plan ms':>9}")
+        for name, stmt in QUERY_CATALOG.items():
+            param_sets = PARAMS.get(name, [None])
+            _ensure_prepared(conn, stmt)
+            conn.commit()
+            for mode, sql in (("simple", stmt.sql), ("prepared", stmt.execute_sql)):
+                timings = _time_calls(conn, sql, param_sets, args.repeat)
+                plan_ms = _planning_ms(conn, sql, param_sets[0])
+                mean, p50, p95 = summary(timings)
+                print(f"{name:<32} {mode:<9} {mean:>9.3f} {p50:>9.3f} {p95:>9.3f} {plan_ms:>9.3f}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark: list-of-dicts result vs the columnar QueryResult.
+
+Builds a `rentings`-shaped result (renting_id, customer_id, movie_id,
+rating with NULLs, date_renting) and compares, for both layouts:
+- memory kept alive by the result (tracemalloc)
+- build time from raw rows
+- time to print the first 20 rows and to save as CSV / JSON
+
+By default the rows are synthetic (no database needed). Use --db to pull
+them from public.rentings instead.
+
+Usage:
+    python benchmarks/bench_result.py [--rows 1000000] [--db]
+"""
+import argparse
+import csv
+import gc
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+from server import QueryResult  # noqa: E402
+
+COLUMNS = ["renting_id", "customer_id", "movie_id", "rating", "date_renting"]
+
+
+def synthetic_rows(n, seed=42):
+    rnd = random.Random(seed)
+    base = date(2018, 1, 1).toordinal()
+    return [
+        (
+            i + 1,
+            rnd.randint(1, 120),
+            rnd.randint(1, 80),
+            rnd.choice((None, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10)),
+            date.fromordinal(base + rnd.randint(0, 700)),
+        )
+        for i in range(n)
+    ]
+
+
+def db_rows(n):
+    with server.pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {', '.join(COLUMNS)} FROM public.rentings LIMIT %s;", (n,))
+            return cur.fetchall()
+
+
+def build_dicts(rows):
+    return [dict(zip(COLUMNS, r)) for r in rows]
+
+
+def build_columnar(rows):
+    return QueryResult.from_rows(COLUMNS, rows)
+
+
+def retained_mb(build, rows):
+    gc.collect()
+    tracemalloc.start()
+    result = build(rows)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current / 1024 ** 2, peak / 1024 ** 2
+
+
+def timed(fn, *args):
+    gc.collect()
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, (time.perf_counter() - start) * 1000
+
+
+def save_csv_dicts(rows, path):
+    # the previous save_last_result_csv: header scan + DictWriter
+    headers = sorted({k for row in rows for k in row.keys()})
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=headers)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--db", action="store_true", help="read rows from public.rentings")
+    args = parser.parse_args()
+
+    rows = db_rows(args.rows) if args.db else synthetic_rows(args.rows)
+    print(f"Rows: {len(rows):,} ({'database' if args.db else 'synthetic'})\n")
+
+    tmp = tempfile.mkdtemp()
+    report = []
+    for label, build in (("list of dicts", build_dicts), ("QueryResult", build_columnar)):
+        kept, peak = retained_mb(build, rows)
+        result, build_ms = timed(build, rows)
+
+        with redirect_stdout(io.StringIO()):
+            _, print_ms = timed(server._print_rows, "RENTINGS", result)
+            csv_path = os.path.join(tmp, f"{label.replace(' ', '_')}.csv")
+            if isinstance(result, QueryResult):
+                _, csv_ms = timed(server.save_last_result_csv, csv_path, result)
+            else:
+                _, csv_ms = timed(save_csv_dicts, result, csv_path)
+        # json needs date -> str, same for both layouts
+        dicts = result.iter_dicts() if isinstance(result, QueryResult) else result
+        _, json_ms = timed(lambda: [json.dumps(d, default=str) for d in dicts])
+
+        report.append((label, kept, peak, build_ms, print_ms, csv_ms, json_ms))
+        del result, dicts
+
+    print(f"{'layout':<14} {'kept MB':>9} {'peak MB':>9} {'build ms':>9} {'print ms':>9} {'csv ms':>9} {'json ms':>9}")
+    for label, kept, peak, build_ms, print_ms, csv_ms, json_ms in report:
+        print(f"{label:<14} {kept:>9.1f} {peak:>9.1f} {build_ms:>9.0f} {print_ms:>9.0f} {csv_ms:>9.0f} {json_ms:>9.0f}")
+    print("\nkept MB excludes the raw rows both layouts are built from.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark: cold-start import time of the menu and of every task script.
+
+Each target is imported in a fresh interpreter under `python -X importtime`:
+- "menu":          import server                      (what `python server.py` pays before the menu shows)
+- numpy/, probability/ scripts: the script's own top-level imports only,
+  so nothing touches the database and the numbers are reproducible.
+
+The total is the sum of the self times reported by -X importtime, minus the
+modules a bare `python -c pass` already imports (site, encodings, ...).
+Bytecode for the repo is compiled first, so a missing or stale .pyc does not
+count as import time.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 7] [--top 5] [--json startup.json]
+"""
+import argparse
+import ast
+import compileall
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SCRIPT_DIRS = ("numpy", "probability")
+
+
+def script_imports(path: Path) -> str:
+    """The top-level import statements of a script, as source code."""
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    lines = [
+        ast.unparse(node)
+        for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom))
+    ]
+    return "\n".join(lines) or "pass"
+
+
+def targets():
+    yield "menu (import server)", "import server"
+    for folder in SCRIPT_DIRS:
+        for path in sorted((ROOT / folder).glob("*.py")):
+            yield f"{folder}/{path.name}", script_imports(path)
+
+
+def import_profile(code: str) -> dict:
+    """Run `code` under -X importtime in a fresh interpreter; returns {module: (self_us, cumulative_us, depth)}."""
+    env = dict(os.environ, PYTHONPATH=str(ROOT), MPLBACKEND="Agg")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    profile = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        profile[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--top", type=int, default=5, help="slowest top-level imports to list per target")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    compileall.compile_file(str(ROOT / "server.py"), quiet=1)
+    for folder in SCRIPT_DIRS:
+        compileall.compile_dir(str(ROOT / folder), quiet=1)
+
+    baseline = set(import_profile("pass"))
+    results = {}
+    print(f"{'target':<58} {'p50 ms':>9} {'min ms':>9} {'max ms':>9}")
+    for name, code in targets():
+        totals, last = [], {}
+        try:
+            for _ in range(args.repeat):
+                last = {mod: v for mod, v in import_profile(code).items() if mod not in baseline}
+                totals.append(sum(s for s, _, _ in last.values()) / 1000)
+        except RuntimeError as e:
+            print(f"{name:<58} failed: {e}")
+            continue
+
+        top = sorted(
+            ((mod, cum) for mod, (_, cum, depth) in last.items() if depth == 0),
+            key=lambda item: item[1],
+            reverse=True,
+        )[: args.top]
+        results[name] = {
+            "p50_ms": statistics.median(totals),
+            "min_ms": min(totals),
+            "max_ms": max(totals),
+            "top": {mod: cum / 1000 for mod, cum in top},
+        }
+        print(f"{name:<58} {statistics.median(totals):>9.1f} {min(totals):>9.1f} {max(totals):>9.1f}")
+        print("    " + ", ".join(f"{mod} {cum / 1000:.1f}" for mod, cum in top))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"\nSaved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
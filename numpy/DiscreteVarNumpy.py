@@ -1,27 +1,14 @@
 import numpy as np
-from psycopg2.extras import RealDictCursor
 
-from server import get_connection, run_query, format_probability, format_number
+from server import load_table, format_probability, format_number
 
 # =====================================================
 # PART 1: RANDOM VARIABLE X — MOVIE RATINGS (FROM DB)
 # =====================================================
 
 def load_ratings_from_db():
-    conn = None
-    try:
-        conn = get_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            rows = run_query(cur, """
-                SELECT rating
-                FROM public.rentings
-                WHERE rating IS NOT NULL;
-            """)
-        ratings_arr = np.fromiter((r["rating"] for r in rows), dtype=float)
-        return ratings_arr
-    finally:
-        if conn:
-            conn.close()
+    rating = load_table("rentings", {"rating": "float64"})["rating"]
+    return rating.values[rating.valid]   # WHERE rating IS NOT NULL
 
 ratings = load_ratings_from_db()
 
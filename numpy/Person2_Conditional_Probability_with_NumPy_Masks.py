@@ -1,6 +1,5 @@
 import numpy as np
-from psycopg2.extras import RealDictCursor
-from server import get_connection, run_query
+from server import join_columns, load_table
 
 """
 Task 2 – Conditional Probability using NumPy Boolean Masks
@@ -12,49 +11,30 @@ Data source: Supabase PostgreSQL (rentings + movies)
 # --------------------------------------------------
 
 def load_data():
-    conn = None
-    try:
-        conn = get_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            rows = run_query(cur, """
-                SELECT
-                    m.genre,
-                    m.runtime,
-                    r.rating
-                FROM public.rentings r
-                JOIN public.movies m
-                    ON r.movie_id = m.movie_id;
-            """)
-
-        genres = np.array([row["genre"] for row in rows], dtype=str)
-        runtimes = np.array([row["runtime"] for row in rows], dtype=int)
-        ratings = np.array(
-            [row["rating"] if row["rating"] is not None else np.nan for row in rows],
-            dtype=float
-        )
-
-        return genres, runtimes, ratings
-
-    finally:
-        if conn:
-            conn.close()
+    # rentings r JOIN movies m ON r.movie_id = m.movie_id
+    data = join_columns(
+        load_table("rentings", {"movie_id": "int32", "rating": "float64"}),
+        load_table("movies", {"movie_id": "int32", "genre": "category", "runtime": "int32"}),
+        on="movie_id",
+    )
+    return data["genre"], data["runtime"], data["rating"].values
 
 
 genres, runtimes, ratings = load_data()
 
 print("Array shapes and dtypes:")
-print("genres:", genres.shape, genres.dtype)
-print("runtimes:", runtimes.shape, runtimes.dtype)
+print("genres:", genres.values.shape, genres.values.dtype, f"({len(genres.categories)} categories)")
+print("runtimes:", runtimes.values.shape, runtimes.values.dtype)
 print("ratings:", ratings.shape, ratings.dtype)
 
 # --------------------------------------------------
 # Define events
 # --------------------------------------------------
 
-A = (genres == "Comedy")          
-B = (ratings >= 4)                
-C = (runtimes > 120)             
-D = np.isnan(ratings)             
+A = genres.eq("Comedy")
+B = (ratings >= 4)
+C = runtimes.valid & (runtimes.values > 120)
+D = np.isnan(ratings)
 
 # --------------------------------------------------
 # Conditional probability function
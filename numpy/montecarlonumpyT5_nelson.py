@@ -1,41 +1,40 @@
 from __future__ import annotations
 
+import os
+
 import numpy as np
-import matplotlib.pyplot as plt
-from typing import Tuple
+from typing import Callable, Optional, Tuple
 
 
-from server import get_connection, format_probability
+from server import load_table, format_probability
+from probability.mc_stats import (
+    MC_ADAPTIVE,
+    MC_CONFIDENCE,
+    MC_HALF_WIDTH,
+    MC_TIME_BUDGET,
+    format_ci_report,
+    run_until_precise,
+)
 
 
 # -----------------------------
 # Raw data extraction ONLY
 # -----------------------------
 
-def load_ratings_and_customers() -> Tuple[np.ndarray, np.ndarray]:
-    
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT rating, customer_id FROM public.rentings;")
-            rows = cur.fetchall()
-    finally:
-        conn.close()
-
-    ratings_obj = np.array([r[0] for r in rows], dtype=object)
-    customer_ids = np.array([r[1] for r in rows], dtype=np.int32)
+def load_ratings_and_customers() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
 
-    return ratings_obj, customer_ids
+    data = load_table("rentings", {"rating": "int16", "customer_id": "int32"})
+    ratings = data["rating"]
+    return ratings.values, ratings.null, data["customer_id"].values
 
 
 # -----------------------------
 # Theoretical results (empirical exact from DB)
 # -----------------------------
 
-def theoretical_p_rating_ge_4(ratings_obj: np.ndarray) -> Tuple[float, np.ndarray]:
+def theoretical_p_rating_ge_4(ratings: np.ndarray, rating_null: np.ndarray) -> Tuple[float, np.ndarray]:
 
-    mask = ratings_obj != None  # object array safe check
-    rated = ratings_obj[mask].astype(np.int16)  # compact
+    rated = ratings[~rating_null]  # int16 already, NULLs dropped via the mask
     p_exact = np.mean(rated >= 4)  # NumPy numeric work
     return float(p_exact), rated
 
@@ -49,44 +48,236 @@ def theoretical_p_customer_ge_2(customer_ids: np.ndarray) -> Tuple[float, np.nda
 
 # -----------------------------
 # Monte Carlo (>=500,000) using NumPy RNG
+# Streaming: n draws are processed CHUNK_SIZE at a time, only running counts
+# and a downsampled convergence trace are kept, so memory does not grow with n.
+#
+# Samplers:
+# "index":    draw row positions and look the rows up (the original approach)
+# "pmf":      draw from the event's PMF, built with np.unique(..., return_counts=True);
+#             for a yes/no event the CDF has one step, so searchsorted is one comparison
+# "binomial": only the number of hits matters, so each stretch of draws between two
+#             trace points is one Binomial draw (cost depends on TRACE_POINTS, not n)
+# All three have the same distribution; only "index" reproduces the original numbers.
 # -----------------------------
 
-def simulate_rating_ge_4(rated_ratings: np.ndarray, n: int = 500_000, seed: int = 42) -> Tuple[float, np.ndarray]:
-
+CHUNK_SIZE = 1 << 20      # draws per block
+TRACE_POINTS = 2_000      # points kept for the convergence plot
+WORKERS = int(os.environ.get("MC_WORKERS", "1"))   # processes for the simulations (1 = in-process)
+SAMPLERS = ("index", "pmf", "binomial")
+SAMPLER = os.environ.get("MC_SAMPLER", "index")
+
+
+def chunk_working_bytes(chunk_size: int = CHUNK_SIZE, sampler: str = "index") -> int:
+    if sampler == "binomial":
+        return 0
+    # per block: int32 indices (int64 for "pmf"), int32 events and their int32 running sum
+    return chunk_size * ((8 if sampler == "pmf" else 4) + 4 + 4)
+
+
+def event_pmf(values: np.ndarray, threshold: int) -> Tuple[int, int]:
+    """(favorable, total): how many of `values` are >= threshold, from the value counts."""
+    support, counts = np.unique(values, return_counts=True)
+    return int(counts[support >= threshold].sum()), int(counts.sum())
+
+
+def _stream_hits(
+    hit: Optional[np.ndarray],
+    n: int,
+    seed,
+    trace_at: np.ndarray,
+    chunk_size: int = CHUNK_SIZE,
+    pmf: Optional[Tuple[int, int]] = None,
+) -> Tuple[int, np.ndarray]:
+    """
+    Draw n positions of the int32 lookup `hit` from default_rng(seed), CHUNK_SIZE at a time.
+    With pmf=(favorable, total) the draws come from the event PMF instead and `hit` is not used.
+
+    Returns (hits, trace_hits): the total and the running hit count after
+    trace_at[i] draws (trace_at sorted, each in 1..n).
+    """
+    rng = np.random.default_rng(seed)
+    trace_hits = np.zeros(trace_at.size, dtype=np.int64)
+
+    hits = 0
+    done = 0
+    while done < n:
+        m = min(chunk_size, n - done)
+        if pmf is None:
+            idx = rng.integers(0, hit.size, size=m, dtype=np.int32)
+            running = np.cumsum(hit[idx], dtype=np.int32)
+        else:
+            # position in the sorted outcomes: the first `favorable` of `total` are hits
+            favorable, total = pmf
+            running = np.cumsum(rng.integers(0, total, size=m) < favorable, dtype=np.int32)
+
+        # trace points that fall inside this block
+        lo, hi = np.searchsorted(trace_at, [done + 1, done + m + 1])
+        trace_hits[lo:hi] = hits + running[trace_at[lo:hi] - done - 1]
+
+        hits += int(running[-1])
+        done += m
+
+    return hits, trace_hits
+
+
+def _trace_grid(n: int, trace_points: int) -> np.ndarray:
+    return np.unique(np.linspace(1, n, min(n, trace_points)).astype(np.int64))
+
+
+def simulate_event_chunked(
+    hit: Optional[np.ndarray],
+    n: int,
+    seed: int = 42,
+    chunk_size: int = CHUNK_SIZE,
+    trace_points: int = TRACE_POINTS,
+    workers: int = 1,
+    pmf: Optional[Tuple[int, int]] = None,
+) -> Tuple[float, np.ndarray, np.ndarray]:
+    """
+    Draw n uniform positions of the boolean lookup `hit` and estimate P(hit).
+    With pmf=(favorable, total) (see event_pmf) the draws come from the PMF and `hit` may be None.
+
+    Returns (p_hat, trace_n, trace_p): the running estimate trace_p[i] after the
+    first trace_n[i] draws, on a grid of about `trace_points` evenly spaced draws.
+
+    workers > 1 splits the draws into `workers` equal shares, run in a process
+    pool, each on its own stream from SeedSequence(seed).spawn(workers). The
+    shares are merged in worker order (as if drawn one after another), so for a
+    fixed seed and worker count the result is the same on every run. It is not
+    the same as workers=1, which draws from default_rng(seed) directly.
+    """
+    if pmf is None:
+        # int32 lookup, so the per-block cumsum needs no int64 cast buffer (blocks stay < 2**31)
+        hit = hit.astype(np.int32)
+    trace_n = _trace_grid(n, trace_points)
+
+    workers = max(1, min(workers, n))
+    if workers == 1:
+        hits, trace_hits = _stream_hits(hit, n, seed, trace_n, chunk_size, pmf)
+    else:
+        shares = [n // workers + (i < n % workers) for i in range(workers)]
+        starts = np.cumsum([0] + shares[:-1])
+        streams = np.random.SeedSequence(seed).spawn(workers)
+        bounds = [np.searchsorted(trace_n, [a + 1, a + m + 1]) for a, m in zip(starts, shares)]
+        trace_parts = [trace_n[lo:hi] - a for (lo, hi), a in zip(bounds, starts)]
+
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(
+                _stream_hits,
+                [hit] * workers, shares, streams, trace_parts, [chunk_size] * workers, [pmf] * workers,
+            ))
+
+        # merge in worker order: share i continues from the hits of shares 0..i-1
+        hits = 0
+        trace_hits = np.zeros(trace_n.size, dtype=np.int64)
+        for (lo, hi), (share_hits, share_trace) in zip(bounds, results):
+            trace_hits[lo:hi] = hits + share_trace
+            hits += share_hits
+
+    p_hat = hits / n if n else 0.0
+    return p_hat, trace_n, trace_hits / np.maximum(trace_n, 1)
+
+
+def simulate_event_binomial(
+    pmf: Tuple[int, int],
+    n: int,
+    seed: int = 42,
+    trace_points: int = TRACE_POINTS,
+) -> Tuple[float, np.ndarray, np.ndarray]:
+    """
+    Same result shape as simulate_event_chunked, without drawing single events:
+    the hits between two trace points are Binomial(gap, favorable / total).
+    """
+    favorable, total = pmf
+    rng = np.random.default_rng(seed)
+    trace_n = _trace_grid(n, trace_points)
+    gaps = np.diff(trace_n, prepend=0)
+    trace_hits = np.cumsum(rng.binomial(gaps, favorable / total if total else 0.0))
+
+    p_hat = int(trace_hits[-1]) / n if n else 0.0
+    return p_hat, trace_n, trace_hits / np.maximum(trace_n, 1)
+
+
+def simulate_event(
+    values: np.ndarray,
+    threshold: int,
+    n: int,
+    seed: int = 42,
+    sampler: str = "index",
+    chunk_size: int = CHUNK_SIZE,
+    workers: int = 1,
+) -> Tuple[float, np.ndarray, np.ndarray]:
+    """Estimate P(value >= threshold) for a value drawn uniformly from `values`, with one of SAMPLERS."""
+    if sampler not in SAMPLERS:
+        raise ValueError(f"sampler must be one of {SAMPLERS}, not {sampler!r}")
+    if sampler == "index":
+        return simulate_event_chunked(values >= threshold, n, seed, chunk_size, workers=workers)
+
+    pmf = event_pmf(values, threshold)
+    if n > 0 and pmf[1] == 0:
+        raise ValueError("Cannot sample from an empty array")
+    if sampler == "pmf":
+        return simulate_event_chunked(None, n, seed, chunk_size, workers=workers, pmf=pmf)
+    return simulate_event_binomial(pmf, n, seed)
+
+
+def simulate_rating_ge_4(rated_ratings: np.ndarray, n: int = 500_000, seed: int = 42,
+                         chunk_size: int = CHUNK_SIZE, workers: int = 1,
+                         sampler: str = "index") -> Tuple[float, np.ndarray, np.ndarray]:
+
+    return simulate_event(rated_ratings, 4, n, seed, sampler, chunk_size, workers)
+
+
+def simulate_customer_ge_2(counts_per_customer: np.ndarray, n: int = 500_000, seed: int = 42,
+                           chunk_size: int = CHUNK_SIZE, workers: int = 1,
+                           sampler: str = "index") -> Tuple[float, np.ndarray, np.ndarray]:
+
+    return simulate_event(counts_per_customer, 2, n, seed, sampler, chunk_size, workers)
+
+
+def batch_sampler(values: np.ndarray, threshold: int, seed: int = 42, sampler: str = "index",
+                  chunk_size: int = CHUNK_SIZE) -> Callable[[int], int]:
+    """
+    draw_batch(m) for run_until_precise: m more draws (value >= threshold?) from one
+    default_rng(seed) stream, CHUNK_SIZE at a time; returns the number of hits.
+    """
+    if sampler not in SAMPLERS:
+        raise ValueError(f"sampler must be one of {SAMPLERS}, not {sampler!r}")
+    favorable, total = event_pmf(values, threshold)
+    if total == 0:
+        raise ValueError("Cannot sample from an empty array")
     rng = np.random.default_rng(seed)
 
-    idx = rng.integers(0, rated_ratings.size, size=n, dtype=np.int32)
-    samples = rated_ratings[idx]  
-    event = samples >= 4          
-    p_hat = np.mean(event)
-    return float(p_hat), event
-
+    if sampler == "binomial":
+        return lambda m: int(rng.binomial(m, favorable / total))
 
-def simulate_customer_ge_2(counts_per_customer: np.ndarray, n: int = 500_000, seed: int = 42) -> Tuple[float, np.ndarray]:
+    hit = values >= threshold
 
-    rng = np.random.default_rng(seed)
+    def draw_batch(m: int) -> int:
+        hits = 0
+        for done in range(0, m, chunk_size):
+            k = min(chunk_size, m - done)
+            if sampler == "pmf":
+                hits += int(np.count_nonzero(rng.integers(0, total, size=k) < favorable))
+            else:
+                hits += int(np.count_nonzero(hit[rng.integers(0, hit.size, size=k, dtype=np.int32)]))
+        return hits
 
-    idx = rng.integers(0, counts_per_customer.size, size=n, dtype=np.int32)
-    samples = counts_per_customer[idx]
-    event = samples >= 2
-    p_hat = np.mean(event)
-    return float(p_hat), event
+    return draw_batch
 
 
 # -----------------------------
-# Convergence plot (no Python loop)
+# Convergence plot (downsampled trace)
 # -----------------------------
 
-def convergence_curve(event_bool: np.ndarray) -> np.ndarray:
-
-    cum = np.cumsum(event_bool, dtype=np.int64)
-    t = np.arange(1, event_bool.size + 1, dtype=np.int64)
-    return cum / t
-
+def plot_convergence(trace_n: np.ndarray, trace_p: np.ndarray, p_theoretical: float, title: str) -> None:
+    import matplotlib.pyplot as plt
 
-def plot_convergence(running: np.ndarray, p_theoretical: float, title: str) -> None:
     plt.figure(figsize=(10, 5))
-    plt.plot(running)               
+    plt.plot(trace_n, trace_p)
     plt.axhline(p_theoretical, linestyle="--")
     plt.xlabel("Iteration")
     plt.ylabel("Running estimate")
@@ -99,7 +290,7 @@ def plot_convergence(running: np.ndarray, p_theoretical: float, title: str) -> N
 # Memory usage reporting
 # -----------------------------
 
-def print_memory_report(**arrays) -> None:
+def print_memory_report(n: int = 0, chunk_size: int = CHUNK_SIZE, sampler: str = "index", **arrays) -> None:
 
     print("\nMemory usage (approx, from NumPy .nbytes):")
     total = 0
@@ -110,6 +301,18 @@ def print_memory_report(**arrays) -> None:
             print(f"- {name}: {mb:.2f} MB (dtype={arr.dtype}, shape={arr.shape})")
     print(f"- TOTAL shown: {total / (1024**2):.2f} MB")
 
+    if n:
+        if sampler == "binomial":
+            print("- Working memory per simulation: one Binomial draw per trace point "
+                  "('binomial' sampler; the same for any n)")
+        else:
+            block = chunk_working_bytes(min(chunk_size, n), sampler)
+            print(f"- Working memory per simulation: {block / (1024**2):.2f} MB "
+                  f"(blocks of {min(chunk_size, n):,} draws, {sampler!r} sampler; the same for any n)")
+        # the unchunked version kept int32 indices, int16 samples, bool events and two float64/int64 curves
+        unchunked = n * (4 + 2 + 1 + 8 + 8)
+        print(f"- Without chunking, {n:,} draws would need about {unchunked / (1024**2):,.0f} MB per simulation")
+
 
 # -----------------------------
 # Main execution + explanations
@@ -117,10 +320,10 @@ def print_memory_report(**arrays) -> None:
 
 def main() -> None:
     # Load raw data
-    ratings_obj, customer_ids = load_ratings_and_customers()
+    ratings, rating_null, customer_ids = load_ratings_and_customers()
 
     # --- Theoretical (exact from DB data) ---
-    p_exact_rating, rated_ratings = theoretical_p_rating_ge_4(ratings_obj)
+    p_exact_rating, rated_ratings = theoretical_p_rating_ge_4(ratings, rating_null)
     p_exact_customer, unique_customers, counts = theoretical_p_customer_ge_2(customer_ids)
 
     print("=== Task 5 – Monte Carlo Simulation (NumPy) ===")
@@ -133,8 +336,9 @@ def main() -> None:
     print("Explanation: This is the share of customers (who appear in rentings) that have 2+ rentals in the database.")
 
     # --- Simulations (>=500,000) ---
-    p_sim_rating, event_rating = simulate_rating_ge_4(rated_ratings, n=500_000, seed=42)
-    p_sim_customer, event_customer = simulate_customer_ge_2(counts, n=500_000, seed=42)
+    n_trials = 500_000
+    p_sim_rating, trace_n_rating, trace_rating = simulate_rating_ge_4(rated_ratings, n=n_trials, seed=42, workers=WORKERS, sampler=SAMPLER)
+    p_sim_customer, trace_n_customer, trace_customer = simulate_customer_ge_2(counts, n=n_trials, seed=42, workers=WORKERS, sampler=SAMPLER)
 
     print("\nSimulation results (500,000 events each):")
     print(f"1) Simulated P(rating ≥ 4 | rating exists) = {format_probability(p_sim_rating)}")
@@ -152,22 +356,30 @@ def main() -> None:
     print(f"- Customer probability absolute difference: {format_probability(diff_customer)}")
     print("Explanation: With many simulations, the estimates should get closer to the theoretical values.")
 
-    # --- Convergence curves + plots ---
-    running_rating = convergence_curve(event_rating)
-    running_customer = convergence_curve(event_customer)
+    # --- Adaptive runs (MC_ADAPTIVE=1): only as many trials as the target precision needs ---
+    if MC_ADAPTIVE:
+        print(f"\nAdaptive runs (until the {MC_CONFIDENCE:.0%} Wilson CI is ±{MC_HALF_WIDTH * 100:.2f} pp, "
+              f"at most {MC_TIME_BUDGET:g}s each):")
+        adaptive_rating = run_until_precise(batch_sampler(rated_ratings, 4, seed=42, sampler=SAMPLER))
+        adaptive_customer = run_until_precise(batch_sampler(counts, 2, seed=42, sampler=SAMPLER))
+        print(f"1) P(rating ≥ 4 | rating exists) = {format_ci_report(adaptive_rating)}")
+        print(f"2) P(customer rented ≥ 2) = {format_ci_report(adaptive_customer)}")
+        print("Explanation: Batches are drawn until the interval is narrow enough, so a probability near 0% or 100% "
+              "stops early and one near 50% gets the most trials.")
 
-    plot_convergence(running_rating, p_exact_rating, "Convergence: P(rating ≥ 4 | rating exists)")
-    plot_convergence(running_customer, p_exact_customer, "Convergence: P(customer rented ≥ 2)")
+    # --- Convergence curves + plots ---
+    plot_convergence(trace_n_rating, trace_rating, p_exact_rating, "Convergence: P(rating ≥ 4 | rating exists)")
+    plot_convergence(trace_n_customer, trace_customer, p_exact_customer, "Convergence: P(customer rented ≥ 2)")
 
     # --- Memory usage considerations ---
     print_memory_report(
+        n=n_trials,
+        sampler=SAMPLER,
         rated_ratings=rated_ratings,
         customer_ids=customer_ids,
         counts_per_customer=counts,
-        event_rating=event_rating,
-        event_customer=event_customer,
-        running_rating=running_rating,
-        running_customer=running_customer,
+        trace_rating=trace_rating,
+        trace_customer=trace_customer,
     )
 
     # --- LLN (simple explanation) ---
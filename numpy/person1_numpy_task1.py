@@ -1,45 +1,26 @@
 import numpy as np
-from server import get_connection
-
-def fetch_array(cursor, query):
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    return np.array(rows, dtype=object)
+from server import join_columns, load_table
 
 def show_info(name, arr):
     print(f"{name} shape: {arr.shape} dtype: {arr.dtype}")
 
 def main():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    data = fetch_array(
-        cursor,
-        """
-        SELECT
-            m.runtime,
-            m.genre,
-            r.rating
-        FROM rentings r
-        JOIN movies m
-            ON m.movie_id = r.movie_id
-        """
+    # rentings r JOIN movies m ON m.movie_id = r.movie_id
+    data = join_columns(
+        load_table("rentings", {"movie_id": "int32", "rating": "float64"}),
+        load_table("movies", {"movie_id": "int32", "runtime": "float64", "genre": "category"}),
+        on="movie_id",
     )
 
-    if data.size == 0:
+    if len(data["runtime"]) == 0:
         print("Not enough data to run Task 1 (no rows returned).")
-        cursor.close()
-        conn.close()
         return
 
-    runtime_obj = data[:, 0]
-    genre = data[:, 1].astype(str)
-    rating_obj = data[:, 2]
+    # NULLs come back as NaN in float columns
+    runtime = data["runtime"].values
+    genre = data["genre"].values
+    rating = data["rating"].values
 
-    runtime = np.where(runtime_obj == None, np.nan, runtime_obj).astype(float)
-    rating = np.where(rating_obj == None, np.nan, rating_obj).astype(float)
-
-    show_info("data", data)
     show_info("runtime", runtime)
     show_info("genre", genre)
     show_info("rating", rating)
@@ -78,8 +59,5 @@ def main():
     print(f"Manual probability: {manual_prob:.2f}%")
     print(f"Vectorized probability: {func_prob:.2f}%")
 
-    cursor.close()
-    conn.close()
-
 if __name__ == "__main__":
     main()
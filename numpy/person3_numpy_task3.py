@@ -1,10 +1,5 @@
 import numpy as np
-from server import get_connection
-
-def fetch_array(cursor, query):
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    return np.array(rows, dtype=object)
+from server import join_columns, load_table
 
 def show_info(name, arr):
     print(f"{name} shape: {arr.shape} dtype: {arr.dtype}")
@@ -17,55 +12,36 @@ def prob(mask):
     return np.count_nonzero(mask) / n
 
 def main():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    data = fetch_array(
-        cursor,
-        """
-        SELECT
-            m.genre,
-            m.runtime,
-            r.rating,
-            c.gender
-        FROM rentings r
-        JOIN movies m
-            ON m.movie_id = r.movie_id
-        JOIN customers c
-            ON c.customer_id = r.customer_id
-        """
-    )
-
-    if data.size == 0:
+    # rentings r JOIN movies m ON m.movie_id = r.movie_id JOIN customers c ON c.customer_id = r.customer_id
+    rentings = load_table("rentings", {"movie_id": "int32", "customer_id": "int32", "rating": "float64"})
+    movies = load_table("movies", {"movie_id": "int32", "genre": "category", "runtime": "float64"})
+    customers = load_table("customers", {"customer_id": "int32", "gender": "category"})
+    data = join_columns(join_columns(rentings, movies, on="movie_id"), customers, on="customer_id")
+
+    if len(data["genre"]) == 0:
         print("Not enough data to run Task 3 (no rows returned).")
-        cursor.close()
-        conn.close()
         return
 
-    genre = np.char.lower(data[:, 0].astype(str))
-    runtime_obj = data[:, 1]
-    rating_obj = data[:, 2]
-    gender = np.char.lower(data[:, 3].astype(str))
+    genre = data["genre"].lower()
+    runtime = data["runtime"].values
+    rating = data["rating"].values
+    gender = data["gender"].lower()
 
-    runtime = np.where(runtime_obj == None, np.nan, runtime_obj).astype(float)
-    rating = np.where(rating_obj == None, np.nan, rating_obj).astype(float)
-
-    show_info("data", data)
-    show_info("genre", genre)
+    show_info("genre", genre.values)
     show_info("runtime", runtime)
     show_info("rating", rating)
-    show_info("gender", gender)
+    show_info("gender", gender.values)
 
     tol = 0.01
 
     valid_rating = ~np.isnan(rating)
     valid_runtime = ~np.isnan(runtime)
 
-    A1 = (genre == "action")
+    A1 = genre.eq("action")
     B1 = valid_rating & (rating >= 4)
 
     A2 = valid_runtime & (runtime >= 150)
-    B2 = (genre == "drama")
+    B2 = genre.eq("drama")
 
     rated = valid_rating
     A_dep = rated & (rating >= 4)
@@ -105,9 +81,6 @@ def main():
     print(f"Tolerance used: {tol:.2f}% as a probability difference threshold.")
     print("Pair 3 is designed to be dependent because every rating >= 4 is also >= 3.")
 
-    cursor.close()
-    conn.close()
-
 if __name__ == "__main__":
     main()
 
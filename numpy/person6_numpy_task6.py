@@ -1,10 +1,5 @@
 import numpy as np
-from server import get_connection
-
-def fetch_array(cursor, query):
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    return np.array(rows)
+from server import join_columns, load_table, select_rows
 
 def show_info(name, arr):
     print(f"{name} shape: {arr.shape} dtype: {arr.dtype}")
@@ -12,37 +7,30 @@ def show_info(name, arr):
 def safe_div(a, b):
     return a / b if b != 0 else 0.0
 
+def most_common(column):
+    categories, counts = column.counts()
+    return str(categories[np.argmax(counts)])
+
 def main():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    data1 = fetch_array(
-        cursor,
-        """
-        SELECT
-            m.genre,
-            r.rating
-        FROM rentings r
-        JOIN movies m
-            ON m.movie_id = r.movie_id
-        WHERE r.rating IS NOT NULL
-          AND m.genre IS NOT NULL
-        """
-    )
-
-    genre1 = np.char.lower(data1[:, 0].astype(str))
-    rating1 = data1[:, 1].astype(float)
-
-    show_info("data1", data1)
-    show_info("genre1", genre1)
+    rentings = load_table("rentings", {"movie_id": "int32", "customer_id": "int32", "rating": "float64"})
+    movies = load_table("movies", {"movie_id": "int32", "genre": "category"})
+    customers = load_table("customers", {"customer_id": "int32", "gender": "category"})
+
+    # rentings JOIN movies WHERE rating IS NOT NULL AND genre IS NOT NULL
+    data1 = join_columns(rentings, movies, on="movie_id")
+    data1 = select_rows(data1, data1["rating"].valid & data1["genre"].valid)
+
+    genre1 = data1["genre"].lower()
+    rating1 = data1["rating"].values
+
+    show_info("genre1", genre1.values)
     show_info("rating1", rating1)
 
     target_genre = "drama"
-    if np.count_nonzero(genre1 == target_genre) == 0:
-        unique, counts = np.unique(genre1, return_counts=True)
-        target_genre = unique[np.argmax(counts)]
+    if np.count_nonzero(genre1.eq(target_genre)) == 0:
+        target_genre = most_common(genre1)
 
-    A = (genre1 == target_genre)
+    A = genre1.eq(target_genre)
     B = (rating1 >= 4)
 
     prior = safe_div(np.count_nonzero(A), A.size)
@@ -60,40 +48,26 @@ def main():
     print(f"Posterior (Bayes): {posterior*100:.2f}%")
     print(f"Posterior (Direct check): {direct*100:.2f}%")
 
-    data2 = fetch_array(
-        cursor,
-        """
-        SELECT
-            c.gender,
-            m.genre
-        FROM rentings r
-        JOIN customers c
-            ON c.customer_id = r.customer_id
-        JOIN movies m
-            ON m.movie_id = r.movie_id
-        WHERE c.gender IS NOT NULL
-          AND m.genre IS NOT NULL
-        """
-    )
-
-    gender2 = np.char.lower(data2[:, 0].astype(str))
-    genre2 = np.char.lower(data2[:, 1].astype(str))
-
-    show_info("data2", data2)
-    show_info("gender2", gender2)
-    show_info("genre2", genre2)
-
-    male = np.count_nonzero(gender2 == "male")
-    female = np.count_nonzero(gender2 == "female")
+    # rentings JOIN customers JOIN movies WHERE gender IS NOT NULL AND genre IS NOT NULL
+    data2 = join_columns(join_columns(rentings, customers, on="customer_id"), movies, on="movie_id")
+    data2 = select_rows(data2, data2["gender"].valid & data2["genre"].valid)
+
+    gender2 = data2["gender"].lower()
+    genre2 = data2["genre"].lower()
+
+    show_info("gender2", gender2.values)
+    show_info("genre2", genre2.values)
+
+    male = np.count_nonzero(gender2.eq("male"))
+    female = np.count_nonzero(gender2.eq("female"))
     target_gender = "male" if male >= female else "female"
 
     target_genre2 = "action"
-    if np.count_nonzero(genre2 == target_genre2) == 0:
-        unique2, counts2 = np.unique(genre2, return_counts=True)
-        target_genre2 = unique2[np.argmax(counts2)]
+    if np.count_nonzero(genre2.eq(target_genre2)) == 0:
+        target_genre2 = most_common(genre2)
 
-    A2 = (genre2 == target_genre2)
-    B2 = (gender2 == target_gender)
+    A2 = genre2.eq(target_genre2)
+    B2 = gender2.eq(target_gender)
 
     prior2 = safe_div(np.count_nonzero(A2), A2.size)
     likelihood2 = safe_div(np.count_nonzero(A2 & B2), np.count_nonzero(A2))
@@ -109,8 +83,5 @@ def main():
     print(f"Posterior (Bayes): {posterior2*100:.2f}%")
     print(f"Posterior (Direct check): {direct2*100:.2f}%")
 
-    cursor.close()
-    conn.close()
-
 if __name__ == "__main__":
     main()
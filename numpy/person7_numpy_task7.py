@@ -1,48 +1,46 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from server import get_connection
-
-def fetch_array(cursor, query):
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    return np.array(rows)
+from server import load_table
+from probability.mc_stats import MC_ADAPTIVE, MC_HALF_WIDTH, format_ci_report, run_until_precise
 
 def show_info(name, arr):
     print(f"{name} shape: {arr.shape} dtype: {arr.dtype}")
 
-def estimate_prob_rating_ge_4(ratings, sample_size, rng):
-    idx = rng.integers(0, ratings.size, size=sample_size)
-    sample = ratings[idx]
-    return np.mean(sample >= 4)
+def convergence_estimates(ratings, checkpoints, rng):
+    """
+    Estimates of P(rating >= 4) after the first n draws, for every n in checkpoints,
+    from ONE sample of max(checkpoints) draws (running count of hits via cumsum).
+    """
+    checkpoints = np.asarray(checkpoints, dtype=np.int64)
+    idx = rng.integers(0, ratings.size, size=int(checkpoints.max()))
+    hits = np.cumsum(ratings[idx] >= 4)
+    return hits[checkpoints - 1] / checkpoints
+
+def count_hits(ratings, m, rng, chunk=1 << 20):
+    """Number of draws with rating >= 4 among m new draws (chunked, for run_until_precise)."""
+    hits = 0
+    for done in range(0, m, chunk):
+        idx = rng.integers(0, ratings.size, size=min(chunk, m - done))
+        hits += int(np.count_nonzero(ratings[idx] >= 4))
+    return hits
 
 def main():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    data = fetch_array(
-        cursor,
-        """
-        SELECT rating
-        FROM rentings
-        WHERE rating IS NOT NULL
-        """
-    )
-
-    ratings = data[:, 0].astype(float)
+    rating = load_table("rentings", {"rating": "float64"})["rating"]
+    ratings = rating.values[rating.valid]   # WHERE rating IS NOT NULL
 
-    show_info("data", data)
     show_info("ratings", ratings)
 
     if ratings.size == 0:
         print("Not enough data to run Task 7 (no ratings).")
-        cursor.close()
-        conn.close()
         return
 
     rng = np.random.default_rng()
 
     sizes = np.array([100, 500, 1000, 5000, 10000, 50000, 100000], dtype=int)
-    estimates = np.array([estimate_prob_rating_ge_4(ratings, int(s), rng) for s in sizes], dtype=float)
+    # one sample of 100000 draws serves every size, plus a dense log grid for the plot
+    grid = np.unique(np.geomspace(10, sizes.max(), 1000).astype(int))
+    all_sizes = np.union1d(sizes, grid)
+    all_estimates = convergence_estimates(ratings, all_sizes, rng)
+    estimates = all_estimates[np.searchsorted(all_sizes, sizes)]
 
     exact = np.mean(ratings >= 4)
 
@@ -52,8 +50,16 @@ def main():
 
     print(f"\nExact (from full rated data): {exact*100:.2f}%")
 
+    # MC_ADAPTIVE=1: instead of guessing a size, sample until the 95% CI is ±MC_HALF_WIDTH
+    # (or the time budget is used)
+    if MC_ADAPTIVE:
+        adaptive = run_until_precise(lambda m: count_hits(ratings, m, rng))
+        print(f"Adaptive (±{MC_HALF_WIDTH*100:.2f} pp): {format_ci_report(adaptive)}")
+
+    import matplotlib.pyplot as plt
+
     plt.figure()
-    plt.plot(sizes, estimates * 100)
+    plt.plot(all_sizes, all_estimates * 100)
     plt.axhline(exact * 100)
     plt.xscale("log")
     plt.xlabel("Sample size (log scale)")
@@ -61,8 +67,5 @@ def main():
     plt.title("Convergence of P(rating >= 4) with increasing sample sizes")
     plt.show()
 
-    cursor.close()
-    conn.close()
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,147 @@
+"""
+Confidence intervals and an adaptive runner for Monte Carlo estimates of a proportion.
+
+Used by the NumPy Monte Carlo tasks (numpy/montecarlonumpyT5_nelson.py,
+numpy/person7_numpy_task7.py); plain Python, no database or NumPy needed.
+It lives here and not in numpy/ because that folder cannot be imported as a
+package (`numpy.mc_stats` would resolve to NumPy itself), and the menu runs
+the scripts in-process, so a sibling `import mc_stats` would not be found.
+"""
+from __future__ import annotations
+
+import math
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# -----------------------------
+# Settings (environment / .env)
+# -----------------------------
+
+# the task scripts only run their adaptive estimates when MC_ADAPTIVE=1
+MC_ADAPTIVE = os.environ.get("MC_ADAPTIVE", "0") == "1"
+# stop at this CI half-width, or after this many seconds per run
+MC_HALF_WIDTH = float(os.environ.get("MC_HALF_WIDTH", "0.001"))
+MC_CONFIDENCE = float(os.environ.get("MC_CONFIDENCE", "0.95"))
+MC_TIME_BUDGET = float(os.environ.get("MC_TIME_BUDGET", "2"))
+
+# -----------------------------
+# Confidence intervals
+# -----------------------------
+
+CI_METHODS = ("wilson", "normal")
+
+
+def _z_score(confidence: float) -> float:
+    """Two-sided normal quantile for `confidence` (statistics is imported here: it is slow to import)."""
+    from statistics import NormalDist
+
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def proportion_ci(hits: int, n: int, confidence: float = MC_CONFIDENCE, method: str = "wilson") -> Tuple[float, float]:
+    """
+    Confidence interval for a proportion of hits out of n trials.
+
+    "normal" is p ± z·sqrt(p(1-p)/n); "wilson" is the Wilson score interval,
+    which stays sensible for p close to 0 or 1 (normal collapses to a width of 0 there).
+    """
+    if method not in CI_METHODS:
+        raise ValueError(f"method must be one of {CI_METHODS}, not {method!r}")
+    if n <= 0:
+        return 0.0, 1.0
+
+    z = _z_score(confidence)
+    p = hits / n
+    if method == "normal":
+        half = z * math.sqrt(p * (1 - p) / n)
+        return max(0.0, p - half), min(1.0, p + half)
+
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+# -----------------------------
+# Adaptive runner
+# -----------------------------
+
+def run_until_precise(
+    draw_batch: Callable[[int], int],
+    half_width: float = MC_HALF_WIDTH,
+    confidence: float = MC_CONFIDENCE,
+    method: str = "wilson",
+    time_budget: Optional[float] = MC_TIME_BUDGET,
+    first_batch: int = 10_000,
+    max_trials: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Run a Monte Carlo estimate of a proportion in batches until it is precise enough.
+
+    draw_batch(m) runs m new trials and returns how many were hits. After each
+    batch the CI is recomputed; the run stops when its half-width is <= half_width
+    ("precision"), when time_budget seconds are used up ("time") or when
+    max_trials is reached ("max_trials").
+
+    The next batch is sized from the current estimate (the n the normal
+    approximation says is still missing), at most doubling the trials so far,
+    and cut down to what fits in the remaining time at the measured rate.
+    """
+    z = _z_score(confidence)
+    start = time.perf_counter()
+    hits = trials = batches = 0
+    m = first_batch
+    stopped = "precision"
+
+    while True:
+        if max_trials is not None:
+            m = min(m, max_trials - trials)
+        hits += int(draw_batch(m))
+        trials += m
+        batches += 1
+
+        low, high = proportion_ci(hits, trials, confidence, method)
+        elapsed = time.perf_counter() - start
+        if (high - low) / 2 <= half_width:
+            break
+        if max_trials is not None and trials >= max_trials:
+            stopped = "max_trials"
+            break
+        if time_budget is not None and elapsed >= time_budget:
+            stopped = "time"
+            break
+
+        p = hits / trials
+        # at least one "success" and one "failure" worth of variance while p is still 0 or 1
+        var = max(p * (1 - p), 1 / trials)
+        needed = math.ceil(z * z * var / (half_width * half_width)) - trials
+        m = max(first_batch, min(needed, trials))
+        if time_budget is not None and elapsed > 0:
+            m = max(1, min(m, int((time_budget - elapsed) * trials / elapsed)))
+
+    low, high = proportion_ci(hits, trials, confidence, method)
+    return {
+        "p_hat": hits / trials if trials else 0.0,
+        "hits": hits,
+        "trials": trials,
+        "low": low,
+        "high": high,
+        "half_width": (high - low) / 2,
+        "confidence": confidence,
+        "method": method,
+        "seconds": time.perf_counter() - start,
+        "batches": batches,
+        "stopped": stopped,
+    }
+
+
+def format_ci_report(result: Dict[str, Any]) -> str:
+    """One line for a run_until_precise() result."""
+    return (
+        f"{result['p_hat'] * 100:.2f}% "
+        f"({result['confidence']:.0%} {result['method']} CI {result['low'] * 100:.2f}%"
+        f" – {result['high'] * 100:.2f}%, ±{result['half_width'] * 100:.2f} pp) "
+        f"after {result['trials']:,} trials in {result['seconds']:.3f}s"
+        f" [stopped: {result['stopped']}]"
+    )
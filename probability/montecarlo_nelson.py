@@ -2,10 +2,11 @@ from __future__ import annotations
 
 from server import format_probability
 
+import os
 import random
 from typing import Dict, List, Optional, Tuple
 
-from server import get_connection
+from server import load_rows
 
 # -----------------------------
 # Optional visualization (Bonus)
@@ -18,27 +19,78 @@ def _try_import_matplotlib():
     except Exception:
         return None
 
+def _try_import_numpy():
+    try:
+        import numpy as np
+        return np
+    except Exception:
+        return None
+
+# -----------------------------
+# Simulation backends
+# -----------------------------
+
+# "python":   random.choice in a loop (the original version)
+# "numpy":    np.random.default_rng draws, NUMPY_CHUNK trials at a time (constant memory)
+# "binomial": no single draws: the outcome counts (np.bincount of the codes) give the PMF,
+#             and the number of trials per outcome is one Binomial / Multinomial draw
+BACKENDS = ("python", "numpy", "binomial")
+NUMPY_CHUNK = 1 << 20
+# backend of the interactive menu (main); unset = "binomial", or "python" without NumPy
+MC_BACKEND = os.environ.get("MC_BACKEND", "")
+
+def _numpy_backend(backend: str):
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}, not {backend!r}")
+    if backend == "python":
+        return None
+    np = _try_import_numpy()
+    if np is None:
+        raise RuntimeError("The numpy backend needs NumPy: pip install numpy")
+    return np
+
+def _menu_backend() -> str:
+    if MC_BACKEND:
+        _numpy_backend(MC_BACKEND)  # unknown names / missing NumPy fail here, before the menu
+        return MC_BACKEND
+    return "binomial" if _try_import_numpy() is not None else "python"
+
+def _count_draws(np, codes, n_trials: int, seed: Optional[int], n_codes: int, backend: str = "numpy") -> List[int]:
+    """Draw n_trials uniform positions of `codes` (small ints) and count how often each code came up."""
+    if codes.size == 0:
+        # no data: like random.choice, fail only if a draw is actually needed
+        if n_trials > 0:
+            raise IndexError("Cannot choose from an empty sequence")
+        return [0] * n_codes
+
+    rng = np.random.default_rng(seed)
+    if backend == "binomial":
+        weights = np.bincount(codes, minlength=n_codes)
+        return [int(c) for c in rng.multinomial(n_trials, weights / weights.sum())]
+
+    counts = np.zeros(n_codes, dtype=np.int64)
+    done = 0
+    while done < n_trials:
+        m = min(NUMPY_CHUNK, n_trials - done)
+        counts += np.bincount(codes[rng.integers(0, codes.size, size=m)], minlength=n_codes)
+        done += m
+    return [int(c) for c in counts]
+
 # -----------------------------
 # Raw data extraction (SQL allowed only here)
 # -----------------------------
 
 def load_rentings_data() -> Tuple[List[Optional[int]], List[int]]:
 
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT rating, customer_id FROM public.rentings;")
-            rows = cur.fetchall()
+    rows = load_rows("SELECT rating, customer_id FROM public.rentings;")
 
-        ratings: List[Optional[int]] = []
-        customer_ids: List[int] = []
-        for rating, customer_id in rows:
-            ratings.append(rating)         # None if NULL
-            customer_ids.append(customer_id)
+    ratings: List[Optional[int]] = []
+    customer_ids: List[int] = []
+    for rating, customer_id in rows:
+        ratings.append(rating)         # None if NULL
+        customer_ids.append(customer_id)
 
-        return ratings, customer_ids
-    finally:
-        conn.close()
+    return ratings, customer_ids
 
 # -----------------------------
 # Exact probabilities (empirical baseline from DB)
@@ -79,9 +131,21 @@ def simulate_rating_geq_k(
     ratings: List[Optional[int]],
     n_trials: int = 10_000,
     k: int = 4,
-    seed: Optional[int] = 42
+    seed: Optional[int] = 42,
+    backend: str = "python"
 ) -> Tuple[float, int, int]:
 
+    np = _numpy_backend(backend)
+    if np is not None:
+        if not ratings and n_trials > 0:
+            raise IndexError("Cannot choose from an empty sequence")   # same as random.choice
+        # 0 = NULL rating, 1 = rated below k, 2 = rated k or more
+        codes = np.array([0 if r is None else (2 if r >= k else 1) for r in ratings], dtype=np.int8)
+        _, below, favorable_sim = _count_draws(np, codes, n_trials, seed, 3, backend)
+        total_rated_sim = below + favorable_sim
+        p_hat = favorable_sim / total_rated_sim if total_rated_sim else 0.0
+        return p_hat, favorable_sim, total_rated_sim
+
     if seed is not None:
         random.seed(seed)
 
@@ -102,10 +166,12 @@ def simulate_rating_geq_k(
 def simulate_customer_rents_geq_2(
     customer_ids: List[int],
     n_trials: int = 10_000,
-    seed: Optional[int] = 42
+    seed: Optional[int] = 42,
+    backend: str = "python"
 ) -> Tuple[float, int, int]:
 
-    if seed is not None:
+    np = _numpy_backend(backend)
+    if seed is not None and np is None:
         random.seed(seed)
 
     counts = rentals_per_customer(customer_ids)
@@ -113,6 +179,12 @@ def simulate_customer_rents_geq_2(
     if not customers:
         return 0.0, 0, 0
 
+    if np is not None:
+        # 1 = customer with at least 2 rentals
+        codes = np.array([1 if counts[c] >= 2 else 0 for c in customers], dtype=np.int8)
+        _, favorable = _count_draws(np, codes, n_trials, seed, 2, backend)
+        return favorable / n_trials, favorable, n_trials
+
     favorable = 0
     for _ in range(n_trials):
         c = random.choice(customers)
@@ -125,20 +197,83 @@ def simulate_customer_rents_geq_2(
 # Convergence + LLN
 # -----------------------------
 
+def log_spaced_sizes(n_max: int, points: int = 1_000, start: int = 10) -> List[int]:
+    """About `points` checkpoints from `start` to n_max, evenly spaced on a log scale."""
+    if n_max < 1:
+        return []
+    start = max(1, min(start, n_max))
+    if points < 2 or start == n_max:
+        return [n_max]
+    ratio = (n_max / start) ** (1 / (points - 1))
+    return sorted({min(n_max, round(start * ratio ** i)) for i in range(points)} | {n_max})
+
 def convergence_study(
     ratings: List[Optional[int]],
     k: int = 4,
-    sizes: Optional[List[int]] = None
+    sizes: Optional[List[int]] = None,
+    seed: Optional[int] = 42,
+    backend: str = "python"
 ) -> List[Tuple[int, float]]:
-
+    """
+    p̂ at every n in `sizes`, from ONE run of max(sizes) trials: the estimate at n
+    is read from the running counts after the first n draws, so the cost is
+    max(sizes) trials, not sum(sizes). Any grid works, e.g. log_spaced_sizes(50_000).
+    With the python backend the numbers equal separate simulate_rating_geq_k(n, seed)
+    runs, since every run with the same seed starts with the same draws.
+    """
     if sizes is None:
         sizes = [100, 500, 1_000, 5_000, 10_000, 50_000]
 
-    results: List[Tuple[int, float]] = []
-    for n in sizes:
-        p_hat, _, _ = simulate_rating_geq_k(ratings, n_trials=n, k=k, seed=42)
-        results.append((n, p_hat))
-    return results
+    checkpoints = sorted({n for n in sizes if n > 0})
+    estimates: Dict[int, float] = {n: 0.0 for n in sizes}
+    if not checkpoints:
+        return [(n, estimates[n]) for n in sizes]
+    n_max = checkpoints[-1]
+
+    np = _numpy_backend(backend)
+    if np is not None:
+        codes = np.array([0 if r is None else (2 if r >= k else 1) for r in ratings], dtype=np.int8)
+        rng = np.random.default_rng(seed)
+        marks = np.array(checkpoints, dtype=np.int64)
+        if backend == "binomial":
+            if codes.size == 0:
+                raise IndexError("Cannot choose from an empty sequence")
+            # trials between two checkpoints split over (NULL, below k, k or more) in one draw
+            weights = np.bincount(codes, minlength=3)
+            drawn = np.cumsum(rng.multinomial(np.diff(marks, prepend=0), weights / weights.sum()), axis=0)
+            for n, (_, below, fav) in zip(checkpoints, drawn.tolist()):
+                estimates[n] = fav / (below + fav) if below + fav else 0.0
+            return [(n, estimates[n]) for n in sizes]
+
+        favorable = rated = done = 0
+        while done < n_max:
+            m = min(NUMPY_CHUNK, n_max - done)
+            drawn = codes[rng.integers(0, codes.size, size=m)]
+            fav_cum = np.cumsum(drawn == 2) + favorable
+            rated_cum = np.cumsum(drawn > 0) + rated
+            inside = marks[(marks > done) & (marks <= done + m)]
+            for n, fav, tot in zip(inside.tolist(), fav_cum[inside - done - 1].tolist(), rated_cum[inside - done - 1].tolist()):
+                estimates[n] = fav / tot if tot else 0.0
+            favorable, rated = int(fav_cum[-1]), int(rated_cum[-1])
+            done += m
+        return [(n, estimates[n]) for n in sizes]
+
+    if seed is not None:
+        random.seed(seed)
+
+    favorable = rated = 0
+    marks = iter(checkpoints)
+    next_mark = next(marks)
+    for i in range(1, n_max + 1):
+        r = random.choice(ratings)
+        if r is not None:
+            rated += 1
+            if r >= k:
+                favorable += 1
+        if i == next_mark:
+            estimates[i] = favorable / rated if rated else 0.0
+            next_mark = next(marks, None)
+    return [(n, estimates[n]) for n in sizes]
 
 def explain_lln(exact_p: float, conv: List[Tuple[int, float]]) -> None:
 
@@ -229,6 +364,9 @@ def main() -> None:
     last_conv: Optional[List[Tuple[int, float]]] = None
     last_exact_p: Optional[float] = None
 
+    backend = _menu_backend()
+    print(f"Simulation backend: {backend} (set MC_BACKEND to one of {', '.join(BACKENDS)})")
+
     while True:
         print_menu()
         choice = input("Select an option: ").strip()
@@ -250,7 +388,7 @@ def main() -> None:
             if not ratings:
                 print("\nLoad data first (option 1).")
                 continue
-            p_hat, fav, total_rated_sim = simulate_rating_geq_k(ratings, n_trials=10_000, k=4, seed=42)
+            p_hat, fav, total_rated_sim = simulate_rating_geq_k(ratings, n_trials=10_000, k=4, seed=42, backend=backend)
             last_sim_rating = (p_hat, fav, total_rated_sim)
             print("\nSimulation (10,000 random rentals):")
             print(f"Estimated P(rating ≥ 4 | rating exists) = "f"{format_probability(p_hat)} = {fav}/{total_rated_sim}")
@@ -279,7 +417,7 @@ def main() -> None:
                 print("\nLoad data first (option 1).")
                 continue
 
-            sim_p, sim_fav, n = simulate_customer_rents_geq_2(customer_ids, n_trials=10_000, seed=42)
+            sim_p, sim_fav, n = simulate_customer_rents_geq_2(customer_ids, n_trials=10_000, seed=42, backend=backend)
             exact_p, efav, etotal = exact_probability_customer_rents_geq_2(customer_ids)
 
             print("\nCustomer behavior: P(customer rents ≥ 2 movies)")
@@ -295,7 +433,7 @@ def main() -> None:
                 continue
 
             exact_p, _, _ = exact_probability_rating_geq_k(ratings, k=4)
-            conv = convergence_study(ratings, k=4, sizes=[100, 500, 1_000, 5_000, 10_000, 50_000])
+            conv = convergence_study(ratings, k=4, sizes=[100, 500, 1_000, 5_000, 10_000, 50_000], backend=backend)
 
             last_exact_p = exact_p
             last_conv = conv
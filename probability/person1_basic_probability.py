@@ -1,8 +1,4 @@
-from server import get_connection
-
-def fetch_data(cursor, query):
-    cursor.execute(query)
-    return cursor.fetchall()
+from server import load_rows
 
 def percentage(part, total):
     if total == 0:
@@ -10,21 +6,15 @@ def percentage(part, total):
     return (part / total) * 100
 
 def main():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    movies = fetch_data(
-        cursor,
+    movies = load_rows(
         "SELECT genre, runtime, year_of_release FROM movies"
     )
 
-    rentings = fetch_data(
-        cursor,
+    rentings = load_rows(
         "SELECT rating FROM rentings"
     )
 
-    customers = fetch_data(
-        cursor,
+    customers = load_rows(
         "SELECT country, gender FROM customers"
     )
 
@@ -77,8 +67,6 @@ def main():
     for gender, count in genders.items():
         print(f"{gender}: {percentage(count, total_customers):.2f}%")
 
-    cursor.close()
-    conn.close()
 
 if __name__ == "__main__":
     main()
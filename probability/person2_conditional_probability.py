@@ -1,33 +1,4 @@
-import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from dotenv import load_dotenv
-
-from server import format_probability
-
-# ============================
-# Load Environment Variables
-# ============================
-
-load_dotenv()
-
-USER = os.getenv("USER")
-PASSWORD = os.getenv("PASSWORD")
-HOST = os.getenv("HOST")
-PORT = os.getenv("PORT")
-DBNAME = os.getenv("DBNAME")
-SSLMODE = os.getenv("SSLMODE", "require")
-
-
-def get_connection():
-    return psycopg2.connect(
-        user=USER,
-        password=PASSWORD,
-        host=HOST,
-        port=PORT,
-        dbname=DBNAME,
-        sslmode=SSLMODE
-    )
+from server import format_probability, load_rows
 
 # ============================
 # Helper Functions
@@ -35,13 +6,7 @@ def get_connection():
 
 
 def run_query(query):
-    conn = get_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query)
-            return cur.fetchall()
-    finally:
-        conn.close()
+    return load_rows(query, dicts=True)
 
 
 def conditional_probability(total_count, favorable_count):
@@ -1,8 +1,4 @@
-from server import get_connection
-
-def fetch_data(cursor, query):
-    cursor.execute(query)
-    return cursor.fetchall()
+from server import load_rows
 
 def percentage(part, total):
     if total == 0:
@@ -37,11 +33,7 @@ def independence_report(title, p_a, p_b, p_a_and_b, tolerance_pct=1.0):
     print("")
 
 def main():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    rentings_with_movie = fetch_data(
-        cursor,
+    rentings_with_movie = load_rows(
         """
         SELECT
             m.genre,
@@ -59,8 +51,6 @@ def main():
     total = len(rentings_with_movie)
     if total == 0 or chosen_genre is None:
         print("Not enough data to run Person 3 (no rated rentings or missing genres).")
-        cursor.close()
-        conn.close()
         return
 
     a_count = 0
@@ -90,8 +80,7 @@ def main():
         tolerance_pct=1.0
     )
 
-    customer_renting_gender = fetch_data(
-        cursor,
+    customer_renting_gender = load_rows(
         """
         SELECT
             c.gender,
@@ -105,23 +94,18 @@ def main():
 
     if not customer_renting_gender:
         print("Not enough data to run Experiment 2 (no customer gender data linked to rentings).")
-        cursor.close()
-        conn.close()
         return
 
     genders = [g for (g, _) in customer_renting_gender]
     chosen_gender = most_common_non_null(genders)
     if chosen_gender is None:
         print("Not enough data to run Experiment 2 (missing gender values).")
-        cursor.close()
-        conn.close()
         return
 
     customer_rent_count = {}
     customer_gender = {}
 
-    customers_full = fetch_data(
-        cursor,
+    customers_full = load_rows(
         """
         SELECT
             r.customer_id,
@@ -170,8 +154,6 @@ def main():
         tolerance_pct=1.0
     )
 
-    cursor.close()
-    conn.close()
 
 if __name__ == "__main__":
     main()
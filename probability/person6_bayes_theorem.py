@@ -1,8 +1,4 @@
-from server import get_connection
-
-def fetch_data(cursor, query):
-    cursor.execute(query)
-    return cursor.fetchall()
+from server import load_rows
 
 def percentage(part, total):
     if total == 0:
@@ -41,11 +37,7 @@ def print_bayes_block(title, prior, likelihood, evidence, posterior_bayes, poste
     print("")
 
 def main():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    rated_rentings = fetch_data(
-        cursor,
+    rated_rentings = load_rows(
         """
         SELECT
             m.genre,
@@ -59,8 +51,6 @@ def main():
 
     if not rated_rentings:
         print("Not enough data to run Person 6 (no rated rentings).")
-        cursor.close()
-        conn.close()
         return
 
     rated_genres = [normalize_text(g) for (g, _) in rated_rentings]
@@ -109,8 +99,7 @@ def main():
         posterior_direct
     )
 
-    rentings_with_gender_and_genre = fetch_data(
-        cursor,
+    rentings_with_gender_and_genre = load_rows(
         """
         SELECT
             c.gender,
@@ -127,8 +116,6 @@ def main():
 
     if not rentings_with_gender_and_genre:
         print("Not enough data to run Example 2 (missing gender or genre in rentings).")
-        cursor.close()
-        conn.close()
         return
 
     genders = [normalize_text(g) for (g, _) in rentings_with_gender_and_genre]
@@ -188,8 +175,6 @@ def main():
         posterior_direct2
     )
 
-    cursor.close()
-    conn.close()
 
 if __name__ == "__main__":
     main()
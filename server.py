@@ -1,15 +1,26 @@
 import os
+import re
+import sys
 import time
 import json
 import csv
+import io
+import atexit
+import itertools
+import math
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+import textwrap
+import threading
+import weakref
+from contextlib import contextmanager, redirect_stdout, redirect_stderr
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Iterable, Tuple
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
 
-import runpy
-
-import psycopg2
-from psycopg2 import Error as PsycopgError
-from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -24,9 +35,45 @@ PORT = os.getenv("PORT")
 DBNAME = os.getenv("DBNAME")
 SSLMODE = os.getenv("SSLMODE", "require")
 
+# Print a per-phase latency line after every query (the numbers come from the metrics registry)
 SHOW_QUERY_TIME = os.getenv("SHOW_QUERY_TIME", "0") == "1"
-
-_LAST_RESULT: List[Dict[str, Any]] = []
+# Latency samples kept per query label and phase for the p50/p95/p99 summaries
+QUERY_METRICS_SAMPLES = int(os.getenv("QUERY_METRICS_SAMPLES", "1000"))
+# Also run every SELECT under EXPLAIN (ANALYZE, BUFFERS) and keep the plan (see capture_plan)
+EXPLAIN_CAPTURE = os.getenv("EXPLAIN_CAPTURE", "0") == "1"
+
+# Connection pool settings (see ConnectionPool below)
+USE_POOL = os.getenv("USE_POOL", "1") == "1"
+POOL_MIN_SIZE = int(os.getenv("POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("POOL_MAX_SIZE", "5"))
+POOL_IDLE_TIMEOUT = float(os.getenv("POOL_IDLE_TIMEOUT", "300"))
+POOL_CHECK_AFTER = float(os.getenv("POOL_CHECK_AFTER", "30"))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("POOL_ACQUIRE_TIMEOUT", "30"))
+
+# asyncpg pool used by the async engine (run_concurrently / run_all_task4_7_reports)
+ASYNC_POOL_MIN_SIZE = int(os.getenv("ASYNC_POOL_MIN_SIZE", "1"))
+ASYNC_POOL_MAX_SIZE = int(os.getenv("ASYNC_POOL_MAX_SIZE", "8"))
+
+# Rows per page when browsing a table (menu choices 1–3 and the fetch_* helpers)
+BROWSE_PAGE_SIZE = int(os.getenv("BROWSE_PAGE_SIZE", "20"))
+
+# Local columnar snapshot (python server.py snapshot); USE_SNAPSHOT=1 makes load_table() read it
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshot")
+USE_SNAPSHOT = os.getenv("USE_SNAPSHOT", "0") == "1"
+# Keys per checksum range in the snapshot manifest (refresh_snapshot() spots updates and deletes with them)
+SNAPSHOT_KEY_RANGE = int(os.getenv("SNAPSHOT_KEY_RANGE", "1024"))
+
+# Rows fetched per round trip by the server-side (named) cursors in stream_query()
+STREAM_ITERSIZE = int(os.getenv("STREAM_ITERSIZE", "2000"))
+
+# Query result cache (see QueryCache below)
+QUERY_CACHE = os.getenv("QUERY_CACHE", "1") == "1"
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+QUERY_CACHE_LOG_POLL = float(os.getenv("QUERY_CACHE_LOG_POLL", "5"))
+
+# Keep load_columns() / load_rows() datasets for the whole session (see DatasetCache below)
+DATASET_CACHE = os.getenv("DATASET_CACHE", "1") == "1"
 
 def _require_env():
     missing = [k for k, v in {
@@ -43,10 +90,44 @@ def _require_env():
             + ". Please set them in your .env file."
         )
 
+# -------------------------------------------------------
+# psycopg2 is imported on first connect, so the menu starts without it.
+# Until then these names are placeholders: nothing can raise a psycopg2
+# error before a connection exists, so `except PsycopgError` is safe.
+# -------------------------------------------------------
+class _Psycopg2NotLoaded(Exception):
+    """Stand-in for psycopg2.Error before psycopg2 is imported (never raised)."""
+
+
+psycopg2 = None
+PsycopgError: Any = _Psycopg2NotLoaded
+PoolError: Any = _Psycopg2NotLoaded
+RealDictCursor: Any = None
+TRANSACTION_STATUS_IDLE = 0
+
+
+def _load_psycopg2():
+    """Import psycopg2 (and the bits of it server.py uses) on first use."""
+    global psycopg2, PsycopgError, PoolError, RealDictCursor, TRANSACTION_STATUS_IDLE
+    if psycopg2 is None:
+        import psycopg2 as _pg
+        import psycopg2.errors
+        import psycopg2.extensions
+        import psycopg2.extras
+        import psycopg2.pool
+
+        PsycopgError = _pg.Error
+        PoolError = _pg.pool.PoolError
+        RealDictCursor = _pg.extras.RealDictCursor
+        TRANSACTION_STATUS_IDLE = _pg.extensions.TRANSACTION_STATUS_IDLE
+        psycopg2 = _pg
+    return psycopg2
+
+
 def get_connection():
     """Create and return a DB connection."""
     _require_env()
-    return psycopg2.connect(
+    return _load_psycopg2().connect(
         user=USER,
         password=PASSWORD,
         host=HOST,
@@ -55,71 +136,2264 @@ def get_connection():
         sslmode=SSLMODE,
     )
 
-# -------------------------------------------------------
-# Task 1 – Generic Function (all queries go through here)
-# -------------------------------------------------------
-def run_query(cursor, query):
+# -------------------------------------------------------
+# Columnar query result (what run_query returns and _LAST_RESULT holds)
+# -------------------------------------------------------
+def _compact_column(values: list):
+    """Store all-int / all-float columns in a typed array (8 bytes per value, no per-row objects)."""
+    types = set(map(type, values))
+    if types == {int}:
+        try:
+            return array("q", values)
+        except OverflowError:
+            return values
+    if types == {float}:
+        return array("d", values)
+    return values
+
+
+class ResultRow(Mapping):
+    """Read-only dict-like view of one row of a QueryResult (row["title"], .items(), dict(row), ...)."""
+
+    __slots__ = ("_result", "_index")
+
+    def __init__(self, result: "QueryResult", index: int):
+        self._result = result
+        self._index = index
+
+    def __getitem__(self, key):
+        result = self._result
+        if isinstance(key, int):
+            return result.data[key][self._index]
+        try:
+            return result.data[result.positions[key]][self._index]
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return iter(self._result.columns)
+
+    def __len__(self):
+        return len(self._result.columns)
+
+    def values(self):
+        return [col[self._index] for col in self._result.data]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(zip(self._result.columns, self.values()))
+
+    def __repr__(self):
+        return f"ResultRow({self.to_dict()!r})"
+
+
+class QueryResult:
+    """
+    Column names stored once plus one array per column.
+
+    Behaves like the old list of dict rows for reading: len(), bool(),
+    iteration and indexing give ResultRow views; slicing gives a QueryResult.
+    """
+
+    __slots__ = ("columns", "data", "positions")
+
+    def __init__(self, columns: List[str], data: List[Any]):
+        self.columns = list(columns)
+        self.data = data
+        self.positions = {name: i for i, name in enumerate(self.columns)}
+
+    @classmethod
+    def empty(cls, columns: Iterable[str] = ()) -> "QueryResult":
+        columns = list(columns)
+        return cls(columns, [[] for _ in columns])
+
+    @classmethod
+    def from_rows(cls, columns: List[str], rows: Iterable[Any], chunk_size: int = 10_000) -> "QueryResult":
+        """Build from tuples or dict rows, transposing `chunk_size` rows at a time."""
+        columns = list(columns)
+        data: List[list] = [[] for _ in columns]
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            if isinstance(chunk[0], dict):
+                chunk = [tuple(r.values()) for r in chunk]
+            for col, values in zip(data, zip(*chunk)):
+                col.extend(values)
+        return cls(columns, [_compact_column(col) for col in data])
+
+    @classmethod
+    def from_cursor(cls, cursor, chunk_size: int = 10_000, timings: Optional[Dict[str, float]] = None) -> "QueryResult":
+        """
+        Fetch everything from an executed cursor without holding all raw rows at once.
+        If `timings` is given, seconds spent in fetchmany() are stored under "fetch".
+        """
+        names = [d[0] for d in cursor.description]
+        fetch_seconds = 0.0
+
+        def fetchmany():
+            nonlocal fetch_seconds
+            start = time.perf_counter()
+            chunk = cursor.fetchmany(chunk_size)
+            fetch_seconds += time.perf_counter() - start
+            return chunk
+
+        first = fetchmany()
+        if first and isinstance(first[0], dict):
+            # dict rows collapse duplicate column names (e.g. SELECT * over a join)
+            names = list(first[0].keys())
+
+        def chunks():
+            chunk = first
+            while chunk:
+                yield from chunk
+                chunk = fetchmany()
+
+        result = cls.from_rows(names, chunks(), chunk_size=chunk_size)
+        if timings is not None:
+            timings["fetch"] = fetch_seconds
+        return result
+
+    def __len__(self):
+        return len(self.data[0]) if self.data else 0
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self) -> Iterator[ResultRow]:
+        return (ResultRow(self, i) for i in range(len(self)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return QueryResult(self.columns, [col[index] for col in self.data])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("QueryResult index out of range")
+        return ResultRow(self, index)
+
+    def column(self, name: str):
+        return self.data[self.positions[name]]
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the result (used to bound the query cache)."""
+        total = sys.getsizeof(self.data)
+        for col in self.data:
+            if isinstance(col, array):
+                total += sys.getsizeof(col)
+            else:
+                total += sys.getsizeof(col) + sum(map(sys.getsizeof, col))
+        return total
+
+    def iter_tuples(self) -> Iterator[Tuple[Any, ...]]:
+        return zip(*self.data) if self.data else iter(())
+
+    def iter_dicts(self) -> Iterator[Dict[str, Any]]:
+        """One short-lived dict per row (for writers that need real dicts)."""
+        columns = self.columns
+        return (dict(zip(columns, values)) for values in self.iter_tuples())
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return list(self.iter_dicts())
+
+    def __repr__(self):
+        return f"QueryResult(columns={self.columns!r}, rows={len(self)})"
+
+
+_LAST_RESULT: QueryResult = QueryResult.empty()
+# Set when the last result was streamed instead of kept in _LAST_RESULT;
+# the save functions re-stream it so large tables never sit in memory.
+_LAST_STREAM_QUERY: Optional[str] = None
+# SQL of the last successful SELECT (in memory or streamed), for export_query_csv()
+_LAST_QUERY: Optional[str] = None
+_LAST_PARAMS: Any = None
+_STREAM_IDS = itertools.count(1)
+
+# -------------------------------------------------------
+# Connection pool (one per process, shared by the menu and the scripts)
+# -------------------------------------------------------
+class ConnectionPool:
+    """
+    Small thread-safe pool on top of get_connection().
+
+    - keeps between min_size and max_size connections open
+    - checks a connection before handing it out (closed / broken / stale)
+    - closes connections that stayed idle longer than idle_timeout
+    """
+
+    def __init__(
+        self,
+        min_size: int = POOL_MIN_SIZE,
+        max_size: int = POOL_MAX_SIZE,
+        idle_timeout: float = POOL_IDLE_TIMEOUT,
+        check_after: float = POOL_CHECK_AFTER,
+        connect=None,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1.")
+        _load_psycopg2()  # PoolError and TRANSACTION_STATUS_IDLE, even with a custom connect()
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self._connect = connect or get_connection
+        self._idle: List[Tuple[Any, float]] = []   # (connection, returned_at), most recent last
+        self._size = 0                             # open connections (idle + in use)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._reaper: Optional[threading.Thread] = None
+        self.stats = {"created": 0, "reused": 0, "discarded": 0, "reaped": 0}
+
+        # connect before taking the lock; if one connect fails, close the ones already open
+        opened = []
+        try:
+            for _ in range(min_size):
+                opened.append(self._connect())
+        except BaseException:
+            for conn in opened:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            raise
+        now = time.monotonic()
+        with self._cond:
+            self._idle = [(conn, now) for conn in opened]
+            self._size = self.stats["created"] = len(opened)
+
+    def _discard(self, conn) -> None:
+        self._size -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            return False
+        if idle_for < self.check_after:
+            return True
+        # Long idle connections may have been dropped by the server or a proxy.
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self, timeout: float = POOL_ACQUIRE_TIMEOUT):
+        """
+        Borrow a healthy connection, opening a new one if the pool is not full.
+
+        Only the bookkeeping happens under the lock: an idle connection is taken
+        (or a slot reserved for a new one), and the health check or the connect
+        runs after the lock is released, so other borrowers are not held up by a
+        network round trip. A failed check or connect gives the slot back.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                self._start_reaper()
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolError(f"no free connection after {timeout:.1f}s (max_size={self.max_size})")
+                    self._cond.wait(remaining)
+                    if self._closed:
+                        raise PoolError("connection pool is closed")
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    conn = None
+                    self._size += 1   # reserve the slot for the new connection
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except BaseException:
+                    self._release_slot()
+                    raise
+                with self._cond:
+                    self.stats["created"] += 1
+                return conn
+
+            if self._is_healthy(conn, time.monotonic() - returned_at):
+                with self._cond:
+                    self.stats["reused"] += 1
+                return conn
+            self._release_slot(conn)
+
+    def _release_slot(self, conn=None) -> None:
+        """Give back a slot (closing its connection) and wake up a waiting borrower."""
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        with self._cond:
+            self._size -= 1
+            if conn is not None:
+                self.stats["discarded"] += 1
+            self._cond.notify()
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        """Return a borrowed connection. Broken connections are closed instead of reused."""
+        keep = not (discard or conn.closed)
+        if keep:
+            # the rollback is a round trip, so it runs before taking the lock
+            try:
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                keep = False
+        with self._cond:
+            if keep and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                return
+        self._release_slot(conn)
+
+    def reap(self) -> int:
+        """
+        Close connections idle longer than idle_timeout (never going below min_size),
+        then open new ones if discarded connections left fewer than min_size.
+        """
+        now = time.monotonic()
+        reaped = 0
+        with self._cond:
+            keep = []
+            # oldest first, so the most recently used connections survive
+            for conn, returned_at in self._idle:
+                if now - returned_at > self.idle_timeout and self._size > self.min_size:
+                    self._discard(conn)
+                    reaped += 1
+                else:
+                    keep.append((conn, returned_at))
+            self._idle = keep
+            self.stats["reaped"] += reaped
+        self.refill()
+        return reaped
+
+    def refill(self) -> int:
+        """Open connections until min_size are open again (outside the lock). Returns how many were opened."""
+        with self._cond:
+            missing = 0 if self._closed else max(0, self.min_size - self._size)
+            self._size += missing   # reserve the slots
+        opened = 0
+        try:
+            for _ in range(missing):
+                conn = self._connect()
+                opened += 1
+                with self._cond:
+                    self.stats["created"] += 1
+                    if self._closed:
+                        self._discard(conn)
+                    else:
+                        self._idle.insert(0, (conn, time.monotonic()))
+                        self._cond.notify()
+        except Exception:
+            pass   # the database is unreachable right now; the next reap tries again
+        finally:
+            with self._cond:
+                self._size -= missing - opened
+        return opened
+
+    def _start_reaper(self) -> None:
+        if self._reaper is not None or self.idle_timeout <= 0:
+            return
+
+        def loop():
+            interval = max(self.idle_timeout / 2, 1.0)
+            while not self._closed:
+                time.sleep(interval)
+                self.reap()
+
+        self._reaper = threading.Thread(target=loop, name="pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def closeall(self) -> None:
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+            self._cond.notify_all()
+
+    def size(self) -> Tuple[int, int]:
+        """(open connections, idle connections)"""
+        with self._cond:
+            return self._size, len(self._idle)
+
+
+_POOL: Optional[ConnectionPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Process-wide pool, created on first use."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ConnectionPool()
+            atexit.register(_POOL.closeall)
+        return _POOL
+
+
+def get_pooled_connection():
+    """Borrow a connection (a fresh one when USE_POOL=0). Give it back with release_connection()."""
+    if not USE_POOL:
+        return get_connection()
+    return get_pool().getconn()
+
+
+def release_connection(conn, discard: bool = False) -> None:
+    if conn is None:
+        return
+    if not USE_POOL:
+        conn.close()
+        return
+    get_pool().putconn(conn, discard=discard)
+
+
+@contextmanager
+def pooled_connection():
+    """with pooled_connection() as conn: ...  (returns the connection to the pool afterwards)"""
+    conn = get_pooled_connection()
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        release_connection(conn, discard=broken)
+
+# -------------------------------------------------------
+# Prepared statements (PREPARE once per connection, then EXECUTE)
+# -------------------------------------------------------
+_STATEMENT_NAME = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+def _to_server_placeholders(sql: str) -> Tuple[str, int]:
+    """Turn psycopg2 %s placeholders into PREPARE-style $1, $2, ... (and %% back into %)."""
+    sql = sql.strip().rstrip(";").strip()
+    if "%(" in sql:
+        raise ValueError("Prepared statements take positional %s parameters only.")
+    count = 0
+
+    def number(match):
+        nonlocal count
+        if match.group(0) == "%%":
+            return "%"
+        count += 1
+        return f"${count}"
+
+    return re.sub(r"%%|%s", number, sql), count
+
+
+class PreparedStatement:
+    """A named query that run_query() PREPAREs once per pooled connection and runs with EXECUTE."""
+
+    __slots__ = ("name", "sql", "server_sql", "nparams", "execute_sql")
+
+    def __init__(self, name: str, sql: str):
+        if not _STATEMENT_NAME.match(name):
+            raise ValueError(f"Invalid statement name: {name!r}")
+        self.name = name
+        self.sql = sql
+        self.server_sql, self.nparams = _to_server_placeholders(sql)
+        placeholders = ", ".join(["%s"] * self.nparams)
+        self.execute_sql = f"EXECUTE {name} ({placeholders})" if self.nparams else f"EXECUTE {name}"
+
+    def __repr__(self):
+        return f"PreparedStatement({self.name!r}, params={self.nparams})"
+
+
+# the query catalog: statement name -> PreparedStatement (filled by prepare_statement)
+QUERY_CATALOG: Dict[str, PreparedStatement] = {}
+# connection -> names already PREPAREd in that session
+_PREPARED_ON: "weakref.WeakKeyDictionary[Any, set]" = weakref.WeakKeyDictionary()
+
+
+def prepare_statement(name: str, sql: str) -> PreparedStatement:
+    """Register a named statement (use %s for parameters). Registering the same name twice must use the same SQL."""
+    existing = QUERY_CATALOG.get(name)
+    if existing is not None:
+        if existing.sql != sql:
+            raise ValueError(f"Statement {name!r} is already registered with different SQL.")
+        return existing
+    stmt = PreparedStatement(name, sql)
+    QUERY_CATALOG[name] = stmt
+    return stmt
+
+
+def _ensure_prepared(conn, stmt: PreparedStatement) -> None:
+    done = _PREPARED_ON.setdefault(conn, set())
+    if stmt.name not in done:
+        with conn.cursor() as cur:
+            cur.execute(f"PREPARE {stmt.name} AS {stmt.server_sql}")
+        done.add(stmt.name)
+
+
+def _execute(cursor, query, params=None) -> None:
+    """cursor.execute() for plain SQL, or EXECUTE of a PreparedStatement on the cursor's connection."""
+    if not isinstance(query, PreparedStatement):
+        cursor.execute(query, params)
+        return
+
+    conn = cursor.connection
+    in_transaction = conn.get_transaction_status() != TRANSACTION_STATUS_IDLE
+    _ensure_prepared(conn, query)
+    if not in_transaction:
+        try:
+            cursor.execute(query.execute_sql, params)
+        except psycopg2.errors.InvalidSqlStatementName:
+            # the session lost its prepared statements (e.g. DISCARD ALL): prepare again once;
+            # the rollback only ends the transaction psycopg2 opened for this statement
+            conn.rollback()
+            _PREPARED_ON.pop(conn, None)
+            _ensure_prepared(conn, query)
+            cursor.execute(query.execute_sql, params)
+        return
+
+    # the caller has a transaction open (e.g. the batch snapshot): a failed EXECUTE
+    # must only undo itself, so it runs behind a savepoint instead of a full rollback.
+    # The savepoint commands use their own cursor, so `cursor` keeps the EXECUTE result.
+    with conn.cursor() as sp:
+        sp.execute("SAVEPOINT execute_prepared")
+        try:
+            cursor.execute(query.execute_sql, params)
+        except psycopg2.errors.InvalidSqlStatementName:
+            sp.execute("ROLLBACK TO SAVEPOINT execute_prepared")
+            _PREPARED_ON.pop(conn, None)
+            _ensure_prepared(conn, query)
+            cursor.execute(query.execute_sql, params)
+        sp.execute("RELEASE SAVEPOINT execute_prepared")
+
+
+def _sql_text(query) -> str:
+    return query.sql if isinstance(query, PreparedStatement) else query
+
+# -------------------------------------------------------
+# Query result cache (TTL + LRU bounded by bytes)
+# -------------------------------------------------------
+_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_TABLE_REF = re.compile(r"""\b(?:from|join|into|update|table)\s+((?:"[^"]+"|\w+)(?:\.(?:"[^"]+"|\w+))?)""")
+_READ_ONLY_START = re.compile(r"^\s*(select|with|values|table)\b")
+_NOT_CACHEABLE = re.compile(r"\b(insert|update|delete|merge|for\s+update|for\s+share|random|now|nextval|setval|clock_timestamp)\b")
+_WRITE_TARGET = re.compile(r"""^\s*(?:insert\s+into|update|delete\s+from|truncate(?:\s+table)?)\s+((?:"[^"]+"|\w+)(?:\.(?:"[^"]+"|\w+))?)""")
+
+
+def normalize_sql(query: str) -> str:
+    """Collapse whitespace, lowercase and drop the trailing ';' outside of quoted literals/identifiers."""
+    parts = _QUOTED.split(query.strip().rstrip(";").strip())
+    return "".join(
+        part if i % 2 else re.sub(r"\s+", " ", part).lower()
+        for i, part in enumerate(parts)
+    ).strip()
+
+
+def _table_name(ref: str) -> str:
+    return ref.split(".")[-1].strip('"').lower()
+
+
+def _tables_in(normalized_sql: str) -> frozenset:
+    return frozenset(_table_name(m) for m in _TABLE_REF.findall(_STRING_LITERAL.sub("''", normalized_sql)))
+
+
+def _is_cacheable(normalized_sql: str) -> bool:
+    unquoted = _QUOTED.sub("''", normalized_sql)
+    return bool(_READ_ONLY_START.match(unquoted)) and not _NOT_CACHEABLE.search(unquoted)
+
+
+class QueryCache:
+    """
+    In-process cache of QueryResult objects keyed on normalized SQL + parameters.
+
+    - entries expire after `ttl` seconds
+    - least recently used entries are evicted once `max_bytes` is exceeded
+    - invalidate_tables() drops every entry that reads from a given table
+      (driven by writes recorded in log_activity and by run_query's own writes)
+    """
+
+    def __init__(self, ttl: float = QUERY_CACHE_TTL, max_bytes: int = QUERY_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[QueryResult, int, float, frozenset]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.log_watermark: Optional[int] = None   # last log_activity.log_id seen
+        self.log_checked_at = 0.0
+        self.log_available = True
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "invalidations": 0}
+
+    @staticmethod
+    def key(query: str, params=None, namespace: str = "") -> Tuple[str, str]:
+        # namespace keeps results decoded differently (e.g. run_pipeline's JSON values) apart
+        if isinstance(params, dict):
+            params = sorted(params.items())
+        return normalize_sql(query), namespace + repr(params)
+
+    def get(self, key, count_miss: bool = True) -> Optional[QueryResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if count_miss:
+                    self.stats["misses"] += 1
+                return None
+            result, size, stored_at, _ = entry
+            if time.monotonic() - stored_at > self.ttl:
+                self._drop(key)
+                self.stats["expired"] += 1
+                if count_miss:
+                    self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return result
+
+    def put(self, key, result: QueryResult, size: Optional[int] = None) -> None:
+        size = result.nbytes() if size is None else size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (result, size, time.monotonic(), _tables_in(key[0]))
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def _drop(self, key) -> None:
+        _, size, _, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate_tables(self, tables: Iterable[str]) -> int:
+        tables = {t.lower() for t in tables}
+        with self._lock:
+            stale = [k for k, (_, _, _, used) in self._entries.items() if used & tables]
+            for key in stale:
+                self._drop(key)
+            self.stats["invalidations"] += len(stale)
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def poll_due(self) -> bool:
+        return self.log_available and time.monotonic() - self.log_checked_at >= QUERY_CACHE_LOG_POLL
+
+    def poll_log_activity(self, conn) -> None:
+        """Invalidate entries for tables that log_activity reports as written since the last poll."""
+        if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            return   # don't touch a transaction the caller has open
+        self.log_checked_at = time.monotonic()
+        try:
+            with conn.cursor() as cur:
+                if self.log_watermark is None:
+                    cur.execute("SELECT COALESCE(MAX(log_id), 0) FROM public.log_activity;")
+                    self.log_watermark = cur.fetchone()[0]
+                    tables = []
+                else:
+                    cur.execute(
+                        "SELECT MAX(log_id) OVER (), table_name FROM public.log_activity WHERE log_id > %s;",
+                        (self.log_watermark,),
+                    )
+                    rows = cur.fetchall()
+                    tables = [t for _, t in rows if t]
+                    if rows:
+                        self.log_watermark = rows[0][0]
+            conn.rollback()
+        except (psycopg2.errors.UndefinedTable, psycopg2.errors.InsufficientPrivilege):
+            # no (readable) log_activity table: rely on TTL and run_query's own writes only
+            self.log_available = False
+            conn.rollback()
+            return
+        except PsycopgError as e:
+            # transient (network, serialization, ...): skip this poll and retry on the next
+            # interval; the watermark is unchanged, so the writes are picked up then
+            print(f"[query cache: log_activity poll failed ({str(e).strip().splitlines()[0]}); retrying later]")
+            try:
+                conn.rollback()
+            except PsycopgError:
+                pass
+            return
+        if tables:
+            self.invalidate_tables(tables)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+            }
+
+
+_QUERY_CACHE = QueryCache()
+
+
+def get_query_cache() -> QueryCache:
+    return _QUERY_CACHE
+
+
+def show_query_cache_stats() -> None:
+    stats = _QUERY_CACHE.summary()
+    print("\n===== QUERY CACHE =====")
+    print(f"Hits: {stats['hits']} | Misses: {stats['misses']} | Hit rate: {stats['hit_rate'] * 100:.1f}%")
+    print(f"Entries: {stats['entries']} | Size: {stats['bytes'] / 1024:.1f} KB of {stats['max_bytes'] / 1024 ** 2:.0f} MB")
+    print(f"Evictions: {stats['evictions']} | Expired: {stats['expired']} | Invalidated: {stats['invalidations']}")
+    datasets = _DATASETS.summary()
+    print(f"Session datasets: {datasets['entries']} | Hits: {datasets['hits']} | Misses: {datasets['misses']}"
+          f" | Invalidated: {datasets['invalidations']}")
+
+
+def _cached(query, params, use_cache: bool, namespace: str = "") -> Optional[QueryResult]:
+    """Fresh cache hit that needs no database round trip (no log_activity poll due), else None."""
+    if not (QUERY_CACHE and use_cache) or _QUERY_CACHE.poll_due():
+        return None
+    key = QueryCache.key(_sql_text(query), params, namespace)
+    if not _is_cacheable(key[0]):
+        return None
+    # a miss here is counted by run_query, which runs next
+    return _QUERY_CACHE.get(key, count_miss=False)
+
+# -------------------------------------------------------
+# Per-query latency metrics (connect / execute / fetch / decode / format)
+# -------------------------------------------------------
+METRIC_PHASES = ("connect", "execute", "fetch", "decode", "format")
+# histogram bucket upper bounds in seconds (+Inf is implied), Prometheus style
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class LatencyHistogram:
+    """Bucket counts (for export) plus the most recent samples (for percentiles)."""
+
+    __slots__ = ("buckets", "count", "total", "recent")
+
+    def __init__(self, samples: int = QUERY_METRICS_SAMPLES):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=samples)
+
+    def observe(self, seconds: float) -> None:
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        """Nearest-rank percentile (0 < q <= 1) over the recent samples, in seconds."""
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(0.50) * 1000,
+            "p95_ms": self.percentile(0.95) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+        }
+
+
+class QueryMetrics:
+    """
+    Latency histograms per query label and phase, plus call/row/byte counters.
+
+    Labels are statement names for prepared statements and the normalized
+    SQL (shortened) for everything else; see query_label().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._labels: Dict[str, Dict[str, Any]] = {}
+
+    def _entry(self, label: str) -> Dict[str, Any]:
+        entry = self._labels.get(label)
+        if entry is None:
+            entry = {"calls": 0, "cache_hits": 0, "errors": 0, "rows": 0, "bytes": 0, "phases": {}}
+            self._labels[label] = entry
+        return entry
+
+    def observe(self, label: str, phase: str, seconds: float) -> None:
+        with self._lock:
+            phases = self._entry(label)["phases"]
+            hist = phases.get(phase)
+            if hist is None:
+                hist = phases[phase] = LatencyHistogram()
+            hist.observe(seconds)
+
+    def record(self, label: str, phases: Optional[Dict[str, float]] = None, rows: int = 0,
+               nbytes: int = 0, cache_hit: bool = False, error: bool = False) -> None:
+        """Count one call of `label` and observe each measured phase."""
+        for phase, seconds in (phases or {}).items():
+            self.observe(label, phase, seconds)
+        with self._lock:
+            entry = self._entry(label)
+            entry["calls"] += 1
+            entry["cache_hits"] += cache_hit
+            entry["errors"] += error
+            entry["rows"] += rows
+            entry["bytes"] += nbytes
+
+    def reset(self) -> None:
+        with self._lock:
+            self._labels.clear()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                label: {
+                    **{k: v for k, v in entry.items() if k != "phases"},
+                    "phases": {
+                        phase: entry["phases"][phase].summary()
+                        for phase in METRIC_PHASES if phase in entry["phases"]
+                    },
+                }
+                for label, entry in self._labels.items()
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self, prefix: str = "sqlteam_query") -> str:
+        """Prometheus text exposition format (histograms in seconds, counters as *_total)."""
+        def esc(value: str) -> str:
+            return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+        lines = [
+            f"# HELP {prefix}_phase_seconds Time spent per query phase.",
+            f"# TYPE {prefix}_phase_seconds histogram",
+        ]
+        with self._lock:
+            for label, entry in self._labels.items():
+                for phase in METRIC_PHASES:
+                    hist = entry["phases"].get(phase)
+                    if hist is None:
+                        continue
+                    tags = f'query="{esc(label)}",phase="{phase}"'
+                    cumulative = 0
+                    for bound, n in zip(LATENCY_BUCKETS + (float("inf"),), hist.buckets):
+                        cumulative += n
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f'{prefix}_phase_seconds_bucket{{{tags},le="{le}"}} {cumulative}')
+                    lines.append(f"{prefix}_phase_seconds_sum{{{tags}}} {hist.total}")
+                    lines.append(f"{prefix}_phase_seconds_count{{{tags}}} {hist.count}")
+
+            for counter in ("calls", "cache_hits", "errors", "rows", "bytes"):
+                lines.append(f"# TYPE {prefix}_{counter}_total counter")
+                for label, entry in self._labels.items():
+                    lines.append(f'{prefix}_{counter}_total{{query="{esc(label)}"}} {entry[counter]}')
+        return "\n".join(lines) + "\n"
+
+
+_METRICS = QueryMetrics()
+_LAST_LABEL: Optional[str] = None
+
+
+def get_query_metrics() -> QueryMetrics:
+    return _METRICS
+
+
+def query_label(query) -> str:
+    """Metrics label: the statement name, or the normalized SQL cut to 60 characters."""
+    if isinstance(query, PreparedStatement):
+        return query.name
+    text = normalize_sql(query)
+    return text if len(text) <= 60 else text[:57] + "..."
+
+
+def _print_query_time(phases: Dict[str, float], cache_hit: bool = False) -> None:
+    total_ms = sum(phases.values()) * 1000
+    if cache_hit:
+        print(f"[Query time: {total_ms:.2f} ms (cache hit)]")
+        return
+    parts = " | ".join(f"{p} {phases[p] * 1000:.2f}" for p in METRIC_PHASES if p in phases)
+    print(f"[Query time: {total_ms:.2f} ms ({parts} ms)]")
+
+
+def show_query_metrics() -> None:
+    stats = _METRICS.summary()
+    print("\n===== QUERY LATENCY (ms) =====")
+    if not stats:
+        print("No queries recorded yet.")
+        return
+    print(f"{'query':<40} {'phase':<8} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for label, entry in stats.items():
+        name = label if len(label) <= 40 else label[:37] + "..."
+        print(f"{name:<40} calls={entry['calls']} cache_hits={entry['cache_hits']} "
+              f"errors={entry['errors']} rows={entry['rows']} bytes={entry['bytes']}")
+        for phase, h in entry["phases"].items():
+            print(f"{'':<40} {phase:<8} {h['count']:>6} {h['p50_ms']:>9.3f} {h['p95_ms']:>9.3f} {h['p99_ms']:>9.3f}")
+
+
+def save_query_metrics(filepath: str = "query_metrics.json") -> None:
+    """Dump the metrics registry; a .prom file gets Prometheus text format, anything else JSON."""
+    text = _METRICS.to_prometheus() if filepath.endswith(".prom") else _METRICS.to_json()
+    with open(filepath, "w", encoding="utf-8") as f:
+        f.write(text)
+    print(f"Saved query metrics to {filepath}")
+
+# -------------------------------------------------------
+# EXPLAIN capture mode (plans of the menu queries + warnings)
+# -------------------------------------------------------
+# tables that are big enough that a sequential scan is worth a warning
+SEQ_SCAN_WATCH = ("rentings", "actsin")
+# actual vs estimated rows off by more than this factor counts as a misestimate
+MISESTIMATE_FACTOR = 10
+_WRITES = re.compile(r"\b(insert|update|delete|merge)\b")
+
+_PLANS: Dict[str, Dict[str, Any]] = {}
+
+
+def _plan_nodes(node: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield node
+    for child in node.get("Plans", ()):
+        yield from _plan_nodes(child)
+
+
+def plan_issues(plan: Dict[str, Any]) -> List[str]:
+    """Warnings for one EXPLAIN (ANALYZE, FORMAT JSON) plan: seq scans on big tables, misestimates, disk sorts."""
+    issues = []
+    for node in _plan_nodes(plan["Plan"]):
+        kind = node["Node Type"]
+        relation = node.get("Relation Name")
+        if kind == "Seq Scan" and relation in SEQ_SCAN_WATCH:
+            issues.append(f"Seq Scan on {relation} ({node.get('Actual Rows', 0)} rows)")
+
+        if node.get("Actual Loops"):
+            estimated, actual = node["Plan Rows"], node["Actual Rows"]
+            if max(estimated, actual) / max(min(estimated, actual), 1) > MISESTIMATE_FACTOR:
+                where = f" on {relation}" if relation else ""
+                issues.append(f"Row misestimate in {kind}{where}: estimated {estimated}, actual {actual}")
+
+        if kind in ("Sort", "Incremental Sort") and node.get("Sort Space Type") == "Disk":
+            issues.append(f"Sort spilled to disk ({node.get('Sort Method')}, {node.get('Sort Space Used')} kB)")
+    return issues
+
+
+def capture_plan(conn, query, params=None, label: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Run a read-only query again under EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) and keep
+    the plan in _PLANS under its metrics label. Writes are skipped, since ANALYZE executes them.
+    """
+    sql = _sql_text(query)
+    normalized = _QUOTED.sub("''", normalize_sql(sql))
+    if not _READ_ONLY_START.match(normalized) or _WRITES.search(normalized):
+        return None
+
+    target = query.execute_sql if isinstance(query, PreparedStatement) else sql.strip().rstrip(";")
+    label = label or query_label(query)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {target}", params)
+            plan = cur.fetchone()[0][0]
+    except PsycopgError as e:
+        conn.rollback()
+        print(f"[EXPLAIN capture failed for {label}: {str(e).strip()}]")
+        return None
+
+    root = plan["Plan"]
+    entry = {
+        "label": label,
+        "execution_ms": plan.get("Execution Time", 0.0),
+        "planning_ms": plan.get("Planning Time", 0.0),
+        "shared_hit_blocks": root.get("Shared Hit Blocks", 0),
+        "shared_read_blocks": root.get("Shared Read Blocks", 0),
+        "temp_written_blocks": root.get("Temp Written Blocks", 0),
+        "issues": plan_issues(plan),
+        "plan": plan,
+    }
+    _PLANS[label] = entry
+    return entry
+
+
+def show_plan_report(top: int = 10) -> None:
+    """Worst offenders among the captured plans: most warnings first, then slowest."""
+    print("\n===== EXPLAIN CAPTURE: WORST OFFENDERS =====")
+    if not _PLANS:
+        print("No plans captured yet (turn capture on with 26, or run 26a).")
+        return
+    ranked = sorted(_PLANS.values(), key=lambda e: (len(e["issues"]), e["execution_ms"]), reverse=True)
+    for i, entry in enumerate(ranked[:top], start=1):
+        print(f"{i}. {entry['label']} | {entry['execution_ms']:.2f} ms | "
+              f"buffers hit={entry['shared_hit_blocks']} read={entry['shared_read_blocks']} "
+              f"temp={entry['temp_written_blocks']}")
+        for issue in entry["issues"]:
+            print(f"     - {issue}")
+    clean = sum(1 for e in _PLANS.values() if not e["issues"])
+    print(f"\n{len(_PLANS)} plans captured, {clean} without warnings.")
+
+
+def save_captured_plans(filepath: str = "query_plans.json") -> None:
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump(_PLANS, f, indent=2, default=_json_default)
+    print(f"Saved {len(_PLANS)} plans to {filepath}")
+
+
+def capture_all_menu_plans() -> None:
+    """Run menu choices 1–18 once with capture on (their output is suppressed), then print the report."""
+    global EXPLAIN_CAPTURE, QUERY_CACHE
+
+    previous = EXPLAIN_CAPTURE, QUERY_CACHE
+    # cache hits never reach the database, so bypass the cache for this run
+    EXPLAIN_CAPTURE, QUERY_CACHE = True, False
+    try:
+        with redirect_stdout(io.StringIO()):
+            for choice in range(1, 19):
+                run_menu_query(str(choice))
+    finally:
+        EXPLAIN_CAPTURE, QUERY_CACHE = previous
+    show_plan_report(top=len(_PLANS))
+
+# -------------------------------------------------------
+# Task 1 – Generic Function (all queries go through here)
+# -------------------------------------------------------
+def run_query(cursor, query, params=None, use_cache: bool = True):
+    """
+    Executes ANY SQL query and returns results for SELECT queries.
+
+    Task 9 requirement:
+    - If SQL is invalid, catch exception, print friendly message, and do NOT crash.
+
+    `query` is SQL text with optional %s bind parameters in `params`, or a
+    PreparedStatement (see prepare_statement), which is PREPAREd once per
+    connection and then run with EXECUTE.
+    Read-only SELECTs are served from the query cache when possible;
+    pass use_cache=False to always hit the database.
+    Execute / fetch / decode times are recorded in the metrics registry.
+    """
+    global _LAST_RESULT, _LAST_STREAM_QUERY, _LAST_QUERY, _LAST_PARAMS, _LAST_LABEL
+
+    _LAST_STREAM_QUERY = None
+    _LAST_QUERY = None
+    _LAST_PARAMS = None
+    sql = _sql_text(query)
+    label = _LAST_LABEL = query_label(query)
+    phases: Dict[str, float] = {}
+    start = time.perf_counter()
+    try:
+        key = None
+        if QUERY_CACHE and use_cache:
+            if _QUERY_CACHE.poll_due():
+                _QUERY_CACHE.poll_log_activity(cursor.connection)
+            key = QueryCache.key(sql, params)
+            if not _is_cacheable(key[0]):
+                key = None
+            else:
+                cached = _QUERY_CACHE.get(key)
+                if cached is not None:
+                    _LAST_RESULT = cached
+                    _LAST_QUERY, _LAST_PARAMS = sql, params
+                    _METRICS.record(label, rows=len(cached), cache_hit=True)
+                    if SHOW_QUERY_TIME:
+                        _print_query_time({"execute": time.perf_counter() - start}, cache_hit=True)
+                    return _LAST_RESULT
+
+        started = time.perf_counter()
+        _execute(cursor, query, params)
+        phases["execute"] = time.perf_counter() - started
+
+        if cursor.description is not None:
+            started = time.perf_counter()
+            _LAST_RESULT = QueryResult.from_cursor(cursor, timings=phases)
+            phases["decode"] = time.perf_counter() - started - phases["fetch"]
+            _LAST_QUERY, _LAST_PARAMS = sql, params
+            size = _LAST_RESULT.nbytes()
+            if key is not None:
+                _QUERY_CACHE.put(key, _LAST_RESULT, size)
+
+            _METRICS.record(label, phases, rows=len(_LAST_RESULT), nbytes=size)
+            if SHOW_QUERY_TIME:
+                _print_query_time(phases)
+            if EXPLAIN_CAPTURE:
+                capture_plan(cursor.connection, query, params, label)
+
+            return _LAST_RESULT
+
+        cursor.connection.commit()
+        phases["execute"] = time.perf_counter() - started
+        target = _WRITE_TARGET.match(normalize_sql(sql))
+        if target:
+            _QUERY_CACHE.invalidate_tables([_table_name(target.group(1))])
+            _DATASETS.invalidate_tables([_table_name(target.group(1))])
+        _METRICS.record(label, phases, rows=max(cursor.rowcount, 0))
+        if SHOW_QUERY_TIME:
+            _print_query_time(phases)
+        _LAST_RESULT = QueryResult.empty()
+        return _LAST_RESULT
+
+    except PsycopgError as e:
+        try:
+            cursor.connection.rollback()
+        except Exception:
+            pass
+
+        _METRICS.record(label, phases, error=True)
+        msg = getattr(e, "pgerror", None) or str(e)
+        print("\n[SQL ERROR] Your query could not be executed.")
+        print(f"Details: {msg.strip()}")
+        _LAST_RESULT = QueryResult.empty()
+        return _LAST_RESULT
+
+    except Exception as e:
+        try:
+            cursor.connection.rollback()
+        except Exception:
+            pass
+        _METRICS.record(label, phases, error=True)
+        print("\n[ERROR] Unexpected error while executing query.")
+        print(f"Details: {e}")
+        _LAST_RESULT = QueryResult.empty()
+        return _LAST_RESULT
+
+# -------------------------------------------------------
+# Generic fetch function (keeps the style used in your file)
+# -------------------------------------------------------
+def _fetch_all(query, params=None, use_cache: bool = True) -> QueryResult:
+    global _LAST_RESULT, _LAST_STREAM_QUERY, _LAST_QUERY, _LAST_PARAMS, _LAST_LABEL
+
+    start = time.perf_counter()
+    cached = _cached(query, params, use_cache)
+    if cached is not None:
+        # served without borrowing a connection
+        _LAST_RESULT, _LAST_STREAM_QUERY = cached, None
+        _LAST_QUERY, _LAST_PARAMS = _sql_text(query), params
+        _LAST_LABEL = query_label(query)
+        _METRICS.record(_LAST_LABEL, rows=len(cached), cache_hit=True)
+        if SHOW_QUERY_TIME:
+            _print_query_time({"execute": time.perf_counter() - start}, cache_hit=True)
+        return cached
+
+    with pooled_connection() as conn:
+        _METRICS.observe(query_label(query), "connect", time.perf_counter() - start)
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            return run_query(cur, query, params, use_cache=use_cache)
+
+# -------------------------------------------------------
+# Streaming variant of run_query (server-side cursor)
+# -------------------------------------------------------
+def stream_query(conn, query, itersize: int = STREAM_ITERSIZE, batches: bool = False):
+    """
+    Generator version of run_query for SELECTs over large tables.
+
+    Rows are pulled from a named (server-side) cursor `itersize` at a time,
+    so memory stays flat no matter how big the table is. Yields one dict per
+    row, or lists of up to `itersize` rows when batches=True.
+    Errors are reported like run_query and simply end the stream.
+    Execute and fetch times are recorded when the stream ends (rows, no bytes).
+    """
+    global _LAST_RESULT, _LAST_STREAM_QUERY, _LAST_QUERY, _LAST_PARAMS, _LAST_LABEL
+
+    _LAST_RESULT = QueryResult.empty()
+    _LAST_STREAM_QUERY = query
+    _LAST_QUERY = query
+    _LAST_PARAMS = None
+    label = _LAST_LABEL = query_label(query)
+    phases = {"execute": 0.0, "fetch": 0.0}
+    rows = 0
+    error = False
+    if EXPLAIN_CAPTURE:
+        capture_plan(conn, query, label=label)
+    try:
+        with conn.cursor(name=f"stream_{next(_STREAM_IDS)}", cursor_factory=RealDictCursor) as cur:
+            started = time.perf_counter()
+            cur.execute(query)
+            # a named cursor only DECLAREs here; the first FETCH runs the query
+            phases["execute"] = time.perf_counter() - started
+            while True:
+                started = time.perf_counter()
+                chunk = cur.fetchmany(itersize)
+                phases["fetch"] += time.perf_counter() - started
+                if not chunk:
+                    break
+                rows += len(chunk)
+                if batches:
+                    yield chunk
+                else:
+                    yield from chunk
+
+    except PsycopgError as e:
+        error = True
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        msg = getattr(e, "pgerror", None) or str(e)
+        print("\n[SQL ERROR] Your query could not be executed.")
+        print(f"Details: {msg.strip()}")
+        _LAST_STREAM_QUERY = None
+        _LAST_QUERY = None
+
+    finally:
+        _METRICS.record(label, phases, rows=rows, error=error)
+        if SHOW_QUERY_TIME and not error:
+            _print_query_time(phases)
+
+
+def _fetch_stream(query: str, itersize: int = STREAM_ITERSIZE, batches: bool = False):
+    """Like _fetch_all, but lazy; the pooled connection is held until the stream is exhausted or closed."""
+    start = time.perf_counter()
+    with pooled_connection() as conn:
+        _METRICS.observe(query_label(query), "connect", time.perf_counter() - start)
+        yield from stream_query(conn, query, itersize=itersize, batches=batches)
+
+# -------------------------------------------------------
+# Pipelined catalog queries: N SELECTs in ONE round trip
+# -------------------------------------------------------
+# cache namespace for run_pipeline results: their values are JSON-decoded, not psycopg2 types
+PIPELINE_CACHE_NAMESPACE = "pipeline:"
+
+
+def _pipeline_loads(text: str):
+    # keep NUMERIC exact, like psycopg2 does for normal results
+    return json.loads(text, parse_float=Decimal)
+
+
+def run_pipeline(queries: Dict[str, Tuple[Any, Any]], use_cache: bool = True) -> Dict[str, QueryResult]:
+    """
+    Run {name: (query, params)} as one batched statement and split the result sets again.
+
+    Every query becomes a `(SELECT json_agg(t ORDER BY n) ...)` column of a single
+    SELECT, so the whole batch costs one network round trip instead of N (what
+    matters on a high-latency link). The rows are collected with ARRAY(query),
+    which keeps the query's output order, and n is their position from
+    unnest(...) WITH ORDINALITY, so an ORDER BY in the query is kept.
+
+    Values come back as JSON values, not the types run_query returns: numbers with
+    a fraction (NUMERIC and float columns) are Decimal, whole numbers are int
+    (also a float or NUMERIC value such as 4.0), dates/timestamps are ISO strings. For that reason results are cached under their own namespace
+    (PIPELINE_CACHE_NAMESPACE) and never handed to run_query, and vice versa.
+    If the batch fails, the queries are re-run one by one so the error points at
+    the query that caused it (those results have the run_query types).
+    """
+    results: Dict[str, QueryResult] = {}
+    pending = []
+    for name, (query, params) in queries.items():
+        cached = _cached(query, params, use_cache, PIPELINE_CACHE_NAMESPACE)
+        if cached is not None:
+            _METRICS.record(query_label(query), rows=len(cached), cache_hit=True)
+            results[name] = cached
+        else:
+            pending.append((name, query, params))
+
+    if pending:
+        columns, all_params = [], []
+        for i, (_, query, params) in enumerate(pending):
+            sql = _sql_text(query).strip().rstrip(";").strip()
+            columns.append(
+                f"(SELECT COALESCE(json_agg(s.t ORDER BY s.n), '[]'::json)"
+                f" FROM unnest(ARRAY(SELECT to_json(t) FROM ({sql}) AS t)) WITH ORDINALITY AS s(t, n)) AS r{i}"
+            )
+            all_params.extend(params or ())
+        batch_sql = "SELECT " + ",\n       ".join(columns)
+
+        label = f"pipeline[{len(pending)}]"
+        phases: Dict[str, float] = {}
+        start = time.perf_counter()
+        try:
+            with pooled_connection() as conn:
+                phases["connect"] = time.perf_counter() - start
+                with conn.cursor() as cur:
+                    psycopg2.extras.register_default_json(cur, loads=_pipeline_loads)
+                    started = time.perf_counter()
+                    cur.execute(batch_sql, all_params or None)
+                    phases["execute"] = time.perf_counter() - started
+                    started = time.perf_counter()
+                    row = cur.fetchone()
+                    phases["fetch"] = time.perf_counter() - started
+                conn.rollback()
+        except PsycopgError as e:
+            _METRICS.record(label, phases, error=True)
+            print(f"[pipeline failed ({str(e).strip().splitlines()[0]}); running the queries one by one]")
+            for name, query, params in pending:
+                results[name] = _fetch_all(query, params, use_cache=use_cache)
+            return {name: results[name] for name in queries}
+
+        started = time.perf_counter()
+        total_rows = 0
+        for (name, query, params), records in zip(pending, row):
+            result = QueryResult.from_rows(records[0].keys(), records) if records else QueryResult.empty()
+            results[name] = result
+            total_rows += len(result)
+            key = QueryCache.key(_sql_text(query), params, PIPELINE_CACHE_NAMESPACE)
+            if QUERY_CACHE and use_cache and _is_cacheable(key[0]):
+                _QUERY_CACHE.put(key, result)
+        phases["decode"] = time.perf_counter() - started
+        _METRICS.record(label, phases, rows=total_rows)
+        if SHOW_QUERY_TIME:
+            _print_query_time(phases)
+
+    return {name: results[name] for name in queries}
+
+# -------------------------------------------------------
+# Async engine (asyncpg): run independent queries concurrently
+# -------------------------------------------------------
+def _try_import_asyncpg():
+    try:
+        import asyncpg
+        return asyncpg
+    except Exception:
+        return None
+
+
+class AsyncEngine:
+    """
+    asyncpg pool of its own, used to fan out independent SELECTs and gather
+    the results as QueryResults. Blocking code goes through run_concurrently();
+    inside a running event loop use it directly:
+
+        async with AsyncEngine() as engine:
+            results = await engine.gather({"total": (TASK4_TOTAL_MOVIES, None), ...})
+
+    The query cache and _LAST_RESULT are not touched; latency is recorded in
+    the metrics registry like run_query does.
+    """
+
+    def __init__(self, min_size: int = ASYNC_POOL_MIN_SIZE, max_size: int = ASYNC_POOL_MAX_SIZE):
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = None
+
+    async def start(self) -> "AsyncEngine":
+        asyncpg = _try_import_asyncpg()
+        if asyncpg is None:
+            raise RuntimeError("The async engine needs asyncpg: pip install asyncpg")
+        _require_env()
+        self._pool = await asyncpg.create_pool(
+            user=USER,
+            password=PASSWORD,
+            host=HOST,
+            port=int(PORT),
+            database=DBNAME,
+            ssl=SSLMODE,
+            min_size=self.min_size,
+            max_size=self.max_size,
+        )
+        return self
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def __aenter__(self) -> "AsyncEngine":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def fetch(self, query, params=None) -> QueryResult:
+        """Run one SELECT (SQL with %s parameters, or a PreparedStatement). Errors print and give an empty result."""
+        asyncpg = _try_import_asyncpg()
+        label = query_label(query)
+        sql = query.server_sql if isinstance(query, PreparedStatement) else _to_server_placeholders(query)[0]
+        phases: Dict[str, float] = {}
+        start = time.perf_counter()
+        try:
+            async with self._pool.acquire() as conn:
+                phases["connect"] = time.perf_counter() - start
+                started = time.perf_counter()
+                # asyncpg keeps its own per-connection cache of prepared statements
+                stmt = await conn.prepare(sql)
+                phases["execute"] = time.perf_counter() - started
+                started = time.perf_counter()
+                records = await stmt.fetch(*(params or ()))
+                phases["fetch"] = time.perf_counter() - started
+                columns = [attr.name for attr in stmt.get_attributes()]
+        except (asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            _METRICS.record(label, phases, error=True)
+            print(f"\n[SQL ERROR] {label} could not be executed.")
+            print(f"Details: {str(e).strip()}")
+            return QueryResult.empty()
+
+        started = time.perf_counter()
+        result = QueryResult.from_rows(columns, (tuple(r) for r in records))
+        phases["decode"] = time.perf_counter() - started
+        _METRICS.record(label, phases, rows=len(result))
+        return result
+
+    async def gather(self, queries: Dict[str, Tuple[Any, Any]]) -> Dict[str, QueryResult]:
+        """Run {name: (query, params)} concurrently; returns {name: QueryResult} in the same order."""
+        import asyncio
+
+        results = await asyncio.gather(*(self.fetch(q, p) for q, p in queries.values()))
+        return dict(zip(queries, results))
+
+
+# one engine per process, living on a background event loop so its pool survives between calls
+# (asyncio itself is imported inside these functions: it is the slowest import in the module)
+_ASYNC_LOOP: Optional["asyncio.AbstractEventLoop"] = None
+_ASYNC_ENGINE: Optional[AsyncEngine] = None
+_ASYNC_LOCK = threading.Lock()
+
+
+def _async_loop() -> "asyncio.AbstractEventLoop":
+    global _ASYNC_LOOP
+    import asyncio
+
+    with _ASYNC_LOCK:
+        if _ASYNC_LOOP is None:
+            _ASYNC_LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_ASYNC_LOOP.run_forever, name="async-engine", daemon=True).start()
+            atexit.register(close_async_engine)
+    return _ASYNC_LOOP
+
+
+async def _get_async_engine() -> AsyncEngine:
+    global _ASYNC_ENGINE
+    if _ASYNC_ENGINE is None:
+        _ASYNC_ENGINE = await AsyncEngine().start()
+    return _ASYNC_ENGINE
+
+
+def run_concurrently(queries: Dict[str, Tuple[Any, Any]]) -> Dict[str, QueryResult]:
+    """Blocking wrapper: run {name: (query, params)} concurrently on the shared async engine."""
+    async def main():
+        engine = await _get_async_engine()
+        return await engine.gather(queries)
+
+    import asyncio
+
+    return asyncio.run_coroutine_threadsafe(main(), _async_loop()).result()
+
+
+def close_async_engine() -> None:
+    global _ASYNC_ENGINE
+    if _ASYNC_ENGINE is not None and _ASYNC_LOOP is not None:
+        import asyncio
+
+        asyncio.run_coroutine_threadsafe(_ASYNC_ENGINE.close(), _ASYNC_LOOP).result(timeout=10)
+        _ASYNC_ENGINE = None
+
+# -------------------------------------------------------
+# Typed NumPy column loader (used by the numpy/ tasks)
+# -------------------------------------------------------
+CATEGORY_DTYPES = ("category", "str")
+
+
+class NumpyColumn:
+    """
+    One column from load_columns().
+
+    - values:     typed ndarray (NULLs filled with NaN / 0 / False / NaT);
+                  for string columns these are int32 codes into `categories` (-1 = NULL)
+    - null:       bool ndarray, True where the database value was NULL
+    - categories: sorted distinct strings (string columns only)
+    """
+
+    __slots__ = ("values", "null", "categories")
+
+    def __init__(self, values, null, categories=None):
+        self.values = values
+        self.null = null
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def valid(self):
+        return ~self.null
+
+    def code_of(self, value: str) -> int:
+        import numpy as np
+
+        i = int(np.searchsorted(self.categories, value))
+        if i < len(self.categories) and self.categories[i] == value:
+            return i
+        return -1
+
+    def eq(self, value: str):
+        """Boolean mask of rows equal to `value` (string columns); never True for NULL."""
+        code = self.code_of(value)
+        if code < 0:
+            return self.values == -2   # all False, right shape
+        return self.values == code
+
+    def lower(self) -> "NumpyColumn":
+        """Case-fold the categories (e.g. 'Drama' and 'drama' become one code)."""
+        import numpy as np
+
+        folded, inverse = np.unique(np.char.lower(self.categories), return_inverse=True)
+        codes = np.where(self.null, -1, inverse[self.values]).astype(np.int32)
+        return NumpyColumn(codes, self.null, folded)
+
+    def take(self, rows) -> "NumpyColumn":
+        """The column restricted to `rows` (a boolean mask or an index array)."""
+        return NumpyColumn(self.values[rows], self.null[rows], self.categories)
+
+    def counts(self):
+        """(categories, counts) for a string column, NULLs excluded."""
+        import numpy as np
+
+        return self.categories, np.bincount(self.values[~self.null], minlength=len(self.categories))
+
+    def decode(self, null_value: str = ""):
+        """Plain string ndarray (only for display; prefer codes for computations)."""
+        import numpy as np
+
+        if len(self.categories) == 0:
+            return np.full(len(self.values), null_value)
+        out = self.categories[np.where(self.null, 0, self.values)]
+        if self.null.any():
+            # widen the <U dtype first, or a longer null_value would be cut to the longest category
+            out = out.astype(np.result_type(out, np.array(null_value)))
+            out[self.null] = null_value
+        return out
+
+    def __repr__(self):
+        kind = f"categories={len(self.categories)}" if self.categories is not None else f"dtype={self.values.dtype}"
+        return f"NumpyColumn(rows={len(self)}, {kind}, nulls={int(self.null.sum())})"
+
+
+class _ColumnBuilder:
+    """Converts one column chunk by chunk, so no per-row Python objects outlive a chunk."""
+
+    def __init__(self, spec: str):
+        import numpy as np
+
+        self.np = np
+        self.categorical = spec in CATEGORY_DTYPES
+        self.dtype = None if self.categorical else np.dtype(spec)
+        self.values: list = []
+        self.nulls: list = []
+        self.lookup: Dict[str, int] = {}
+
+    def _fill_value(self):
+        np = self.np
+        kind = self.dtype.kind
+        if kind in "fc":
+            return np.nan
+        if kind in "mM":
+            return np.datetime64("NaT")
+        if kind == "b":
+            return False
+        if kind in "US":
+            return ""
+        return 0
+
+    def add(self, chunk: Tuple[Any, ...]) -> None:
+        np = self.np
+        obj = np.array(chunk, dtype=object)
+        null = np.equal(obj, None)
+        if self.categorical:
+            lookup = self.lookup
+            codes = np.fromiter(
+                (-1 if v is None else lookup.setdefault(v, len(lookup)) for v in chunk),
+                dtype=np.int32,
+                count=len(chunk),
+            )
+            self.values.append(codes)
+        else:
+            if null.any():
+                obj[null] = self._fill_value()
+            self.values.append(obj.astype(self.dtype))
+        self.nulls.append(null.astype(bool))
+
+    def finish(self) -> NumpyColumn:
+        np = self.np
+        if self.values:
+            values = np.concatenate(self.values)
+            null = np.concatenate(self.nulls)
+        else:
+            values = np.empty(0, dtype=np.int32 if self.categorical else self.dtype)
+            null = np.empty(0, dtype=bool)
+
+        if not self.categorical:
+            return NumpyColumn(values, null)
+
+        # Sort the dictionary so codes follow string order (like np.unique)
+        categories = np.array([str(v) for v in self.lookup], dtype=str)
+        order = np.argsort(categories, kind="stable")
+        remap = np.empty(len(order), dtype=np.int32)
+        remap[order] = np.arange(len(order), dtype=np.int32)
+        if len(order):
+            values = np.where(null, -1, remap[np.where(null, 0, values)]).astype(np.int32)
+        return NumpyColumn(values, null, categories[order])
+
+
+def _read_columns(conn, query: str, schema: Dict[str, str], params=None,
+                  chunk_size: int = STREAM_ITERSIZE) -> Dict[str, NumpyColumn]:
+    """load_columns() on a connection the caller holds (e.g. inside a snapshot transaction)."""
+    builders = {name: _ColumnBuilder(spec) for name, spec in schema.items()}
+
+    with conn.cursor(name=f"load_{next(_STREAM_IDS)}") as cur:
+        cur.itersize = chunk_size
+        cur.execute(query, params)
+        chunk = cur.fetchmany(chunk_size)
+
+        # named cursors only know their columns after the first fetch
+        names = [d[0] for d in cur.description]
+        missing = [name for name in schema if name not in names]
+        if missing:
+            raise ValueError(f"Columns not in query result: {', '.join(missing)} (got: {', '.join(names)})")
+        positions = {name: names.index(name) for name in schema}
+
+        while chunk:
+            columns = list(zip(*chunk))
+            for name, builder in builders.items():
+                builder.add(columns[positions[name]])
+            del columns
+            chunk = cur.fetchmany(chunk_size)
+
+    return {name: builder.finish() for name, builder in builders.items()}
+
+
+def load_columns(
+    query: str,
+    schema: Dict[str, str],
+    params=None,
+    chunk_size: int = STREAM_ITERSIZE,
+    use_cache: bool = True,
+) -> Dict[str, NumpyColumn]:
+    """
+    Run a SELECT and return {column: NumpyColumn} with the dtypes from `schema`.
+
+    schema maps column names to a NumPy dtype ("int32", "float64", "bool",
+    "datetime64[D]", ...) or "category" for dictionary-encoded strings.
+    Rows are read through a server-side cursor `chunk_size` at a time.
+    The columns are kept in the session dataset cache (read-only arrays), so
+    the next script asking for the same query and schema skips the database.
+    """
+    key = DatasetCache.key("columns", query, params, sorted(schema.items()))
+    if use_cache and DATASET_CACHE:
+        cached = _DATASETS.get(key)
+        if cached is not None:
+            return dict(cached)
+
+    with pooled_connection() as conn:
+        result = _read_columns(conn, query, schema, params, chunk_size)
+    if use_cache and DATASET_CACHE:
+        for column in result.values():
+            # shared with later scripts: nobody may change them in place
+            for arr in (column.values, column.null, column.categories):
+                if arr is not None:
+                    arr.flags.writeable = False
+        _DATASETS.put(key, result, query)
+    return result
+
+# -------------------------------------------------------
+# Session dataset cache (shared by the numpy/ and probability/ scripts)
+# -------------------------------------------------------
+class DatasetCache:
+    """
+    Whole datasets kept for the rest of the CLI session, keyed on normalized
+    SQL + parameters (+ the schema for load_columns()).
+
+    The P and N menus re-run scripts that read the same few tables, so unlike
+    QueryCache there is no TTL or size limit. Entries go away when run_query
+    writes to a table they read, or with clear() (menu option 24c).
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, ...], Tuple[Any, frozenset]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def key(kind: str, query: str, params=None, extra=None) -> Tuple[str, ...]:
+        return (kind, *QueryCache.key(query, params), repr(extra))
+
+    def get(self, key) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            self.stats["hits" if entry is not None else "misses"] += 1
+            return None if entry is None else entry[0]
+
+    def put(self, key, value: Any, query: str) -> None:
+        with self._lock:
+            self._entries[key] = (value, _tables_in(normalize_sql(query)))
+
+    def invalidate_tables(self, tables: Iterable[str]) -> int:
+        tables = {t.lower() for t in tables}
+        with self._lock:
+            stale = [k for k, (_, used) in self._entries.items() if used & tables]
+            for key in stale:
+                del self._entries[key]
+            self.stats["invalidations"] += len(stale)
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries)}
+
+
+_DATASETS = DatasetCache()
+
+
+def get_dataset_cache() -> DatasetCache:
+    return _DATASETS
+
+
+def load_rows(query: str, params=None, dicts: bool = False, use_cache: bool = True) -> List[Any]:
+    """
+    Run a SELECT and return all rows as tuples (or dicts with dicts=True).
+
+    Like load_columns(), the rows are kept in the session dataset cache; every
+    call gets its own list, so callers may sort or filter it freely.
+    """
+    key = DatasetCache.key("rows", query, params)
+    cached = _DATASETS.get(key) if use_cache and DATASET_CACHE else None
+    if cached is None:
+        label = query_label(query)
+        phases: Dict[str, float] = {}
+        start = time.perf_counter()
+        with pooled_connection() as conn:
+            phases["connect"] = time.perf_counter() - start
+            with conn.cursor() as cur:
+                started = time.perf_counter()
+                cur.execute(query, params)
+                phases["execute"] = time.perf_counter() - started
+                started = time.perf_counter()
+                cached = ([d[0] for d in cur.description], cur.fetchall())
+                phases["fetch"] = time.perf_counter() - started
+            conn.rollback()
+        _METRICS.record(label, phases, rows=len(cached[1]))
+        if use_cache and DATASET_CACHE:
+            _DATASETS.put(key, cached, query)
+
+    names, rows = cached
+    if dicts:
+        return [dict(zip(names, row)) for row in rows]
+    return list(rows)
+
+# -------------------------------------------------------
+# Local columnar snapshot of the core tables (opened memory-mapped)
+#
+#   snapshot/manifest.json                    tables, row counts, column dtypes, watermarks
+#   snapshot/<table>/<column>.npy             values (int32 codes for strings)
+#   snapshot/<table>/<column>.null.npy        NULL bitmap (np.packbits)
+#   snapshot/<table>/<column>.categories.npy  sorted distinct strings
+#   snapshot/<table>/<column>.counts.npy      rows per value (SNAPSHOT_COUNTS columns only)
+# -------------------------------------------------------
+SNAPSHOT_TABLES = ("movies", "customers", "actors", "actsin", "rentings")
+# primary keys: refresh_snapshot() pulls rows above the last max(key), the keys log_activity reports
+# and every key range whose checksum changed
+SNAPSHOT_KEYS = {
+    "movies": "movie_id",
+    "customers": "customer_id",
+    "actors": "actor_id",
+    "actsin": "actsin_id",
+    "rentings": "renting_id",
+}
+# derived aggregates kept next to the columns: counts[v] = rows where column == v (NULLs skipped);
+# refresh_snapshot() updates them in place instead of recounting the table
+SNAPSHOT_COUNTS = {
+    "rentings": ("customer_id", "movie_id", "rating"),
+    "actsin": ("movie_id", "actor_id"),
+}
+# Postgres type -> dtype stored in the snapshot; everything else becomes a string column
+SNAPSHOT_DTYPES = {
+    "smallint": "int16",
+    "integer": "int32",
+    "bigint": "int64",
+    "real": "float32",
+    "double precision": "float64",
+    "numeric": "float64",
+    "boolean": "bool",
+    "date": "datetime64[D]",
+    "timestamp without time zone": "datetime64[us]",
+}
+
+
+def table_schema(table: str, conn=None) -> Dict[str, str]:
+    """{column: dtype} for a public table, in column order, using SNAPSHOT_DTYPES ("category" for strings)."""
+    query = (
+        "SELECT column_name, data_type FROM information_schema.columns "
+        "WHERE table_schema = 'public' AND table_name = %s ORDER BY ordinal_position;"
+    )
+    if conn is None:
+        rows = load_rows(query, (table,), use_cache=False)
+    else:
+        with conn.cursor() as cur:
+            cur.execute(query, (table,))
+            rows = cur.fetchall()
+    if not rows:
+        raise ValueError(f"Unknown table: {table}")
+    return {name: SNAPSHOT_DTYPES.get(data_type, "category") for name, data_type in rows}
+
+
+def _save_npy(path: Path, arr) -> None:
+    """np.save() to a temporary file, then rename it over `path` (readers never see half a file)."""
+    import numpy as np
+
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def _write_snapshot_column(folder: Path, name: str, column: NumpyColumn) -> int:
+    import numpy as np
+
+    _save_npy(folder / f"{name}.npy", column.values)
+    _save_npy(folder / f"{name}.null.npy", np.packbits(column.null))
+    if column.categories is not None:
+        _save_npy(folder / f"{name}.categories.npy", column.categories)
+    return sum(f.stat().st_size for f in folder.glob(f"{name}.*npy"))
+
+
+def _value_counts(column: NumpyColumn, minlength: int = 0):
+    import numpy as np
+
+    return np.bincount(column.values[column.valid].astype(np.int64), minlength=minlength)
+
+
+def _log_watermark(conn) -> Optional[int]:
+    """Highest log_activity.log_id, or None when the table does not exist."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('public.log_activity') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            return None
+        cur.execute("SELECT COALESCE(MAX(log_id), 0) FROM public.log_activity;")
+        return cur.fetchone()[0]
+
+
+def _snapshot_table_info(table: str, schema: Dict[str, str], columns: Dict[str, NumpyColumn]) -> Dict[str, Any]:
+    info: Dict[str, Any] = {"rows": len(next(iter(columns.values()))), "columns": schema}
+    key = SNAPSHOT_KEYS.get(table)
+    if key in columns:
+        keys = columns[key]
+        info["key"] = key
+        info["max_id"] = int(keys.values[keys.valid].max()) if keys.valid.any() else 0
+    return info
+
+
+def _key_range_checksums(conn, table: str, key: str) -> Dict[str, List[Any]]:
+    """{range: [rows, checksum]} per SNAPSHOT_KEY_RANGE keys of a table, computed by the server."""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT {key} / %s AS part, count(*), "
+            f"sum(('x' || left(md5(t::text), 15))::bit(60)::bigint)::text "
+            f"FROM public.{table} AS t GROUP BY 1;",
+            (SNAPSHOT_KEY_RANGE,),
+        )
+        return {str(part): [rows, checksum] for part, rows, checksum in cur.fetchall()}
+
+
+def take_snapshot(out_dir: str = None, tables: Iterable[str] = SNAPSHOT_TABLES) -> Dict[str, Any]:
+    """
+    Dump `tables` into a local columnar snapshot (see the layout above).
+
+    All tables are read in one REPEATABLE READ transaction, so they are
+    consistent with each other. The snapshot is written next to `out_dir` and
+    only then moved into place, so a failed run leaves the old one intact.
+    """
+    import shutil
+
+    out = Path(out_dir or SNAPSHOT_DIR)
+    tmp = out.with_name(out.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    manifest: Dict[str, Any] = {"created_at": datetime.now().isoformat(timespec="seconds"), "tables": {}}
+    print(f"\n{'table':<12} {'rows':>9} {'columns':>8} {'MB':>8} {'seconds':>8}")
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                _begin_snapshot(cur)
+            for table in tables:
+                if not _IDENTIFIER.match(table):
+                    raise ValueError(f"Not a plain table name: {table!r}")
+                started = time.perf_counter()
+                schema = table_schema(table, conn)
+                columns = _read_columns(conn, f"SELECT {', '.join(schema)} FROM public.{table};", schema)
+
+                folder = tmp / table
+                folder.mkdir()
+                nbytes = sum(_write_snapshot_column(folder, name, col) for name, col in columns.items())
+                for name in SNAPSHOT_COUNTS.get(table, ()):
+                    _save_npy(folder / f"{name}.counts.npy", _value_counts(columns[name]))
+                info = _snapshot_table_info(table, schema, columns)
+                if "key" in info:
+                    info["checksums"] = _key_range_checksums(conn, table, info["key"])
+                    info["key_range"] = SNAPSHOT_KEY_RANGE
+                manifest["tables"][table] = info
+                print(f"{table:<12} {info['rows']:>9} {len(schema):>8} {nbytes / 1024 ** 2:>8.2f}"
+                      f" {time.perf_counter() - started:>8.2f}")
+            manifest["log_id"] = _log_watermark(conn)
+            conn.rollback()
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    (tmp / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    _swap_in_snapshot(tmp, out)
+    print(f"Snapshot saved to {out}/")
+    return manifest
+
+
+def _swap_in_snapshot(tmp: Path, out: Path) -> None:
+    """Replace the snapshot folder `out` by the finished folder `tmp`."""
+    import shutil
+
+    old = out.with_name(out.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if out.exists():
+        out.rename(old)
+    tmp.rename(out)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _copy_snapshot(folder: Path, tmp: Path) -> None:
+    """Working copy of a snapshot: hard links where possible (files are only ever replaced, never edited)."""
+    import shutil
+
+    def link_or_copy(src, dst):
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    shutil.rmtree(tmp, ignore_errors=True)
+    shutil.copytree(folder, tmp, copy_function=link_or_copy)
+
+
+def snapshot_manifest(snapshot_dir: str = None) -> Dict[str, Any]:
+    path = Path(snapshot_dir or SNAPSHOT_DIR) / "manifest.json"
+    if not path.exists():
+        raise FileNotFoundError(f"No snapshot in {path.parent}/ (take one with: python server.py snapshot)")
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _read_snapshot_column(folder: Path, name: str, spec: str, rows: int) -> NumpyColumn:
+    """A snapshot column loaded into memory (writable), for refresh_snapshot()."""
+    import numpy as np
+
+    values = np.load(folder / f"{name}.npy")
+    null = np.unpackbits(np.load(folder / f"{name}.null.npy"), count=rows).view(bool)
+    categories = np.load(folder / f"{name}.categories.npy") if spec in CATEGORY_DTYPES else None
+    return NumpyColumn(values, null, categories)
+
+
+def _merge_categories(old: NumpyColumn, new: NumpyColumn) -> Tuple[NumpyColumn, NumpyColumn]:
+    """Re-code two string columns against one sorted dictionary (the union of both)."""
+    import numpy as np
+
+    categories = np.union1d(old.categories, new.categories)
+
+    def recode(column):
+        remap = np.searchsorted(categories, column.categories).astype(np.int32)
+        codes = np.where(column.null, -1, remap[np.where(column.null, 0, column.values)] if len(remap) else -1)
+        return NumpyColumn(codes.astype(np.int32), column.null, categories)
+
+    return recode(old), recode(new)
+
+
+def _apply_counts(counts, column: NumpyColumn, sign: int):
+    """counts[v] += sign for every non-NULL value v of `column`, growing the array when needed."""
+    import numpy as np
+
+    values = column.values[column.valid].astype(np.int64)
+    if len(values) and values.max() >= len(counts):
+        counts = np.concatenate([counts, np.zeros(values.max() + 1 - len(counts), dtype=counts.dtype)])
+    np.add.at(counts, values, sign)
+    return counts
+
+
+def _log_changes(conn, since: int) -> Dict[str, Dict[str, set]]:
+    """{table: {"changed": ids, "deleted": ids}} from log_activity rows after log_id `since`."""
+    changes: Dict[str, Dict[str, set]] = {}
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT lower(table_name), upper(action_type), record_id FROM public.log_activity "
+            "WHERE log_id > %s AND record_id IS NOT NULL ORDER BY log_id;",
+            (since,),
+        )
+        for table, action, record_id in cur.fetchall():
+            entry = changes.setdefault(table, {"changed": set(), "deleted": set()})
+            if action == "DELETE":
+                entry["deleted"].add(record_id)
+                entry["changed"].discard(record_id)
+            else:
+                entry["changed"].add(record_id)
+                entry["deleted"].discard(record_id)
+    return changes
+
+
+def _refresh_table(conn, folder: Path, table: str, info: Dict[str, Any], changes: Dict[str, set]) -> Tuple[int, int, int]:
+    """Apply new, changed and deleted rows of one table to its snapshot files. Returns (new, updated, deleted)."""
+    import numpy as np
+
+    schema, key, rows = info["columns"], info["key"], info["rows"]
+    local = {name: _read_snapshot_column(folder, name, spec, rows) for name, spec in schema.items()}
+    keys = local[key].values
+
+    # key ranges whose checksum moved had rows updated or deleted (log_activity may not know about them);
+    # they are pulled again as a whole. No stored checksums (older snapshots): every range counts as moved.
+    span = info.get("key_range", SNAPSHOT_KEY_RANGE)
+    stored = info.get("checksums", {}) if span == SNAPSHOT_KEY_RANGE else {}
+    checksums = _key_range_checksums(conn, table, key)
+    moved = sorted(int(part) for part in set(stored) | set(checksums) if stored.get(part) != checksums.get(part))
+    in_moved = np.isin(np.fix(keys / span).astype(np.int64), np.asarray(moved, dtype=np.int64))  # SQL / truncates
+
+    changed = sorted(changes["changed"] | set(keys[in_moved].tolist()))
+    fetched = _read_columns(
+        conn,
+        f"SELECT {', '.join(schema)} FROM public.{table} "
+        f"WHERE {key} > %s OR {key} = ANY(%s) OR {key} / %s = ANY(%s) ORDER BY {key};",
+        schema,
+        (info["max_id"], changed, span, moved),
+    )
+    fetched_keys = fetched[key].values
+
+    # where each fetched row already sits in the snapshot (-1: a new row)
+    order = np.argsort(keys, kind="stable")
+    pos = np.searchsorted(keys[order], fetched_keys)
+    pos = np.minimum(pos, max(len(keys) - 1, 0))
+    exists = (keys[order][pos] == fetched_keys) if len(keys) else np.zeros(len(fetched_keys), dtype=bool)
+    update_at = order[pos[exists]]
+    deleted = np.isin(keys, np.fromiter(changes["deleted"], dtype=keys.dtype, count=len(changes["deleted"])))
+    # a changed key that is gone from the table was deleted too
+    gone = np.isin(keys, np.setdiff1d(np.asarray(changed, dtype=keys.dtype), fetched_keys))
+    deleted |= gone
+
+    counts = {name: np.load(folder / f"{name}.counts.npy") for name in SNAPSHOT_COUNTS.get(table, ())}
+    for name in counts:
+        counts[name] = _apply_counts(counts[name], local[name].take(update_at), -1)
+        counts[name] = _apply_counts(counts[name], local[name].take(deleted), -1)
+        counts[name] = _apply_counts(counts[name], fetched[name], +1)
+
+    for name, spec in schema.items():
+        old, new = local[name], fetched[name]
+        if spec in CATEGORY_DTYPES:
+            old, new = _merge_categories(old, new)
+        values, null = old.values.copy(), old.null.copy()
+        values[update_at], null[update_at] = new.values[exists], new.null[exists]
+        values = np.concatenate([values[~deleted], new.values[~exists]])
+        null = np.concatenate([null[~deleted], new.null[~exists]])
+        _write_snapshot_column(folder, name, NumpyColumn(values, null, old.categories))
+    for name, arr in counts.items():
+        _save_npy(folder / f"{name}.counts.npy", arr)
+
+    keys = np.concatenate([keys[~deleted], fetched_keys[~exists]])
+    info["rows"] = len(keys)
+    info["max_id"] = max(info["max_id"], int(keys.max()) if len(keys) else 0)
+    info["checksums"], info["key_range"] = checksums, SNAPSHOT_KEY_RANGE
+    return int((~exists).sum()), int(exists.sum()), int(deleted.sum())
+
+
+def refresh_snapshot(snapshot_dir: str = None) -> Dict[str, Any]:
     """
-    Executes ANY SQL query and returns results for SELECT queries.
-
-    Task 9 requirement:
-    - If SQL is invalid, catch exception, print friendly message, and do NOT crash.
+    Bring an existing snapshot up to date without re-dumping it.
+
+    Per table only rows with a key above the recorded max(key) are pulled,
+    plus the rows log_activity reports as inserted/updated since the recorded
+    log_id; rows it reports as deleted are dropped. The SNAPSHOT_COUNTS
+    aggregates are adjusted. Tables without a known key fall back to a full
+    dump.
+
+    The triggers in SQL/Part 2 Triggers.sql only log INSERTs on movies, so
+    updates and deletes are found another way too: the manifest keeps a
+    row count and checksum per SNAPSHOT_KEY_RANGE keys, the server recomputes
+    them (one scan per table, nothing is transferred), and every range whose
+    checksum moved is pulled again as a whole; its rows missing from the
+    table are dropped.
+
+    The refresh works on a copy of the snapshot, which replaces it only once
+    every table and the manifest are written, so a failed refresh leaves the
+    old snapshot as it was.
     """
-    global _LAST_RESULT
+    import shutil
 
-    start = time.perf_counter()
+    folder = Path(snapshot_dir or SNAPSHOT_DIR)
+    manifest = snapshot_manifest(str(folder))
+    tmp = folder.with_name(folder.name + ".tmp")
+    _copy_snapshot(folder, tmp)
     try:
-        cursor.execute(query)
+        log_id = _refresh_tables(tmp, manifest)
+        manifest["log_id"] = log_id
+        manifest["refreshed_at"] = datetime.now().isoformat(timespec="seconds")
+        _save_manifest(tmp, manifest)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    _swap_in_snapshot(tmp, folder)
+    print(f"Snapshot {folder}/ is up to date (log_id {log_id}).")
+    return manifest
+
+
+def _refresh_tables(folder: Path, manifest: Dict[str, Any]) -> Optional[int]:
+    """Refresh every table of `manifest` inside `folder` (updates manifest["tables"]); returns the new log_id."""
+    print(f"\n{'table':<12} {'rows':>9} {'new':>7} {'updated':>8} {'deleted':>8} {'seconds':>8}")
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            _begin_snapshot(cur)
+        log_id = _log_watermark(conn)
+        since = manifest.get("log_id")
+        changes = _log_changes(conn, since) if log_id is not None and since is not None else {}
+
+        for table, info in manifest["tables"].items():
+            started = time.perf_counter()
+            if "key" in info:
+                new, updated, deleted = _refresh_table(
+                    conn, folder / table, table, info, changes.get(table, {"changed": set(), "deleted": set()})
+                )
+            else:
+                schema = table_schema(table, conn)
+                columns = _read_columns(conn, f"SELECT {', '.join(schema)} FROM public.{table};", schema)
+                for name, col in columns.items():
+                    _write_snapshot_column(folder / table, name, col)
+                new, updated, deleted = len(next(iter(columns.values()))), 0, info["rows"]
+                manifest["tables"][table] = info = _snapshot_table_info(table, schema, columns)
+            print(f"{table:<12} {info['rows']:>9} {new:>7} {updated:>8} {deleted:>8}"
+                  f" {time.perf_counter() - started:>8.2f}")
+        conn.rollback()
+    return log_id
+
+
+def _save_manifest(folder: Path, manifest: Dict[str, Any]) -> None:
+    tmp = folder / "manifest.json.tmp"
+    tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp, folder / "manifest.json")
+
+
+def snapshot_counts(table: str, column: str, snapshot_dir: str = None):
+    """The maintained rows-per-value aggregate of a SNAPSHOT_COUNTS column (memory-mapped)."""
+    import numpy as np
+
+    if column not in SNAPSHOT_COUNTS.get(table, ()):
+        raise ValueError(f"No counts kept for {table}.{column} (see SNAPSHOT_COUNTS)")
+    return np.load(Path(snapshot_dir or SNAPSHOT_DIR) / table / f"{column}.counts.npy", mmap_mode="r")
+
+
+def open_snapshot_table(table: str, columns: Optional[Iterable[str]] = None,
+                        snapshot_dir: str = None) -> Dict[str, NumpyColumn]:
+    """
+    {column: NumpyColumn} of one snapshot table. Values and categories are
+    memory-mapped read-only (np.load(mmap_mode="r")), so nothing is read from
+    disk until it is used; only the NULL bitmaps are unpacked into memory.
+    """
+    import numpy as np
+
+    folder = Path(snapshot_dir or SNAPSHOT_DIR)
+    tables = snapshot_manifest(str(folder))["tables"]
+    if table not in tables:
+        raise ValueError(f"Table {table!r} is not in the snapshot (tables: {', '.join(tables)})")
+    info = tables[table]
+    schema = info["columns"]
+    names = list(schema) if columns is None else list(columns)
+    missing = [name for name in names if name not in schema]
+    if missing:
+        raise ValueError(f"Columns not in snapshot table {table}: {', '.join(missing)}")
 
-        if cursor.description is not None:
-            rows = cursor.fetchall()
+    result = {}
+    for name in names:
+        values = np.load(folder / table / f"{name}.npy", mmap_mode="r")
+        null = np.unpackbits(np.load(folder / table / f"{name}.null.npy"), count=info["rows"]).view(bool)
+        null.flags.writeable = False
+        categories = None
+        if schema[name] in CATEGORY_DTYPES:
+            categories = np.load(folder / table / f"{name}.categories.npy", mmap_mode="r")
+        result[name] = NumpyColumn(values, null, categories)
+    return result
 
-            _LAST_RESULT = [dict(r) for r in rows]
 
-            if SHOW_QUERY_TIME:
-                elapsed_ms = (time.perf_counter() - start) * 1000
-                print(f"[Query time: {elapsed_ms:.2f} ms]")
+def load_table(table: str, schema: Optional[Dict[str, str]] = None, source: Optional[str] = None) -> Dict[str, NumpyColumn]:
+    """
+    Columns of one core table as {column: NumpyColumn}, from the local snapshot or the live database.
+
+    source is "snapshot", "db" or None (USE_SNAPSHOT decides). schema maps the
+    columns to read to dtypes, as in load_columns(); None reads every column.
+    Snapshot columns whose dtype already matches are zero-copy memory maps,
+    others are converted (NULLs become NaN / NaT in float and date columns).
+    From the database the whole table is read once with its snapshot dtypes
+    (one dataset cache entry per table, whatever columns the scripts ask for)
+    and then projected and converted the same way.
+    """
+    source = source or ("snapshot" if USE_SNAPSHOT else "db")
+    if source not in ("snapshot", "db"):
+        raise ValueError(f"source must be 'snapshot' or 'db', not {source!r}")
+    if not _IDENTIFIER.match(table):
+        raise ValueError(f"Not a plain table name: {table!r}")
+
+    if source == "db":
+        full_schema = table_schema(table)
+        full = load_columns(f"SELECT {', '.join(full_schema)} FROM public.{table};", full_schema)
+        missing = [name for name in schema or () if name not in full]
+        if missing:
+            raise ValueError(f"Columns not in table {table}: {', '.join(missing)}")
+        columns = {name: full[name] for name in (schema or full)}
+    else:
+        columns = open_snapshot_table(table, None if schema is None else list(schema))
 
-            return _LAST_RESULT
+    import numpy as np
 
-        cursor.connection.commit()
-        _LAST_RESULT = []
-        return []
+    for name, spec in (schema or {}).items():
+        column = columns[name]
+        if spec in CATEGORY_DTYPES:
+            if column.categories is None:
+                raise ValueError(f"{table}.{name} is not a string column")
+            continue
+        dtype = np.dtype(spec)
+        if column.values.dtype != dtype:
+            values = column.values.astype(dtype)
+            if dtype.kind in "fcmM":
+                values[column.null] = np.nan if dtype.kind in "fc" else np.datetime64("NaT")
+            values.flags.writeable = False
+            columns[name] = NumpyColumn(values, column.null)
+    return columns
 
-    except PsycopgError as e:
-        try:
-            cursor.connection.rollback()
-        except Exception:
-            pass
 
-        msg = getattr(e, "pgerror", None) or str(e)
-        print("\n[SQL ERROR] Your query could not be executed.")
-        print(f"Details: {msg.strip()}")
-        _LAST_RESULT = []
-        return []
+def select_rows(columns: Dict[str, NumpyColumn], rows) -> Dict[str, NumpyColumn]:
+    """Every column restricted to `rows` (a boolean mask or an index array), like a WHERE clause."""
+    return {name: column.take(rows) for name, column in columns.items()}
 
-    except Exception as e:
-        try:
-            cursor.connection.rollback()
-        except Exception:
-            pass
-        print("\n[ERROR] Unexpected error while executing query.")
-        print(f"Details: {e}")
-        _LAST_RESULT = []
-        return []
 
-# -------------------------------------------------------
-# Generic fetch function (keeps the style used in your file)
-# -------------------------------------------------------
-def _fetch_all(query: str) -> List[Dict[str, Any]]:
-    conn = None
-    try:
-        conn = get_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            return run_query(cur, query)
-    finally:
-        if conn:
-            conn.close()
+def join_columns(left: Dict[str, NumpyColumn], right: Dict[str, NumpyColumn],
+                 on: str, right_on: Optional[str] = None) -> Dict[str, NumpyColumn]:
+    """
+    Inner join of two load_table() results: left JOIN right ON left.on = right.right_on,
+    where the right key is unique (a primary key). Rows keep the left table's order;
+    rows with a NULL or unmatched key are dropped, as in SQL.
+    """
+    import numpy as np
+
+    left_key, right_key = left[on], right[right_on or on]
+    candidates = np.flatnonzero(right_key.valid)
+    order = candidates[np.argsort(right_key.values[candidates], kind="stable")]
+    sorted_keys = right_key.values[order]
+
+    left_rows = np.flatnonzero(left_key.valid)
+    pos = np.searchsorted(sorted_keys, left_key.values[left_rows])
+    if len(sorted_keys):
+        pos = np.minimum(pos, len(sorted_keys) - 1)
+        found = sorted_keys[pos] == left_key.values[left_rows]
+    else:
+        found = np.zeros(len(left_rows), dtype=bool)
+    left_rows, right_rows = left_rows[found], order[pos[found]]
+
+    joined = select_rows(left, left_rows)
+    for name, column in right.items():
+        if name not in joined:
+            joined[name] = column.take(right_rows)
+    return joined
 
 # ============================
 # Task 8 – Output Formatting
@@ -132,276 +2406,796 @@ def _format_value(v: Any) -> str:
     return str(v)
 
 
-def _print_rows(title: str, rows: List[Dict[str, Any]], max_rows: int = 20) -> None:
-    """Pretty, labeled printing for any list of dict rows."""
+def _print_rows(
+    title: str,
+    rows: Iterable[Mapping],
+    max_rows: int = 20,
+    label: Optional[str] = None,
+    more: Optional[int] = None,
+    number_from: int = 1,
+) -> int:
+    """
+    Pretty, labeled printing for a QueryResult, a list or a stream of dict rows. Returns the row count.
+    The time spent formatting is recorded as the "format" phase of `label`
+    (default: the query that produced the last result).
+    `more` is an estimate of rows beyond the ones passed in (a LIMITed page); rows
+    are numbered from `number_from`.
+    """
     print(f"\n===== {title} =====")
-    if not rows:
-        print("No data found.")
-        return
-
-    to_show = rows[:max_rows]
-    for i, row in enumerate(to_show, start=1):
-        parts = [f"{k}: {_format_value(v)}" for k, v in row.items()]
-        print(f"{i}. " + " | ".join(parts))
 
-    if len(rows) > max_rows:
-        print(f"... ({len(rows) - max_rows} more rows not shown)")
+    total = None
+    if isinstance(rows, (QueryResult, list)):
+        total = len(rows)
+        rows = rows[:max_rows]
+
+    shown = 0
+    format_seconds = 0.0
+    for row in rows:
+        shown += 1
+        if shown <= max_rows:
+            started = time.perf_counter()
+            parts = [f"{k}: {_format_value(v)}" for k, v in row.items()]
+            print(f"{number_from + shown - 1}. " + " | ".join(parts))
+            format_seconds += time.perf_counter() - started
+
+    if total is None:
+        total = shown
+    if total == 0:
+        print("No data found.")
+    elif total > max_rows:
+        print(f"... ({total - max_rows} more rows not shown)")
+    if more:
+        print(f"... (about {more} more rows not shown)")
+    label = label or _LAST_LABEL
+    if label is not None:
+        _METRICS.observe(label, "format", format_seconds)
+    return total
 
 
 # -------------------------------------------------------
 # Task Bonus – Save last results to a file
 # -------------------------------------------------------
-def save_last_result_json(filepath: str = "last_result.json") -> None:
-    if not _LAST_RESULT:
+def _last_rows() -> Iterable[Mapping]:
+    """The last result: the in-memory QueryResult, or a fresh stream of the last streamed query."""
+    if _LAST_RESULT or _LAST_STREAM_QUERY is None:
+        return _LAST_RESULT
+    return _fetch_stream(_LAST_STREAM_QUERY)
+
+
+def _json_default(v: Any) -> Any:
+    """JSON encoder fallback for the types Postgres hands back (AVG() -> Decimal, date columns, ...)."""
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (datetime, date, dt_time)):
+        return v.isoformat()
+    if isinstance(v, timedelta):
+        return v.total_seconds()
+    from uuid import UUID
+
+    if isinstance(v, UUID):
+        return str(v)
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return bytes(v).hex()
+    raise TypeError(f"Object of type {type(v).__name__} is not JSON serializable")
+
+
+def _try_import_zstandard():
+    try:
+        import zstandard
+        return zstandard
+    except Exception:
+        return None
+
+
+def _compression_for(filepath: str) -> Optional[str]:
+    suffix = Path(filepath).suffix.lower()
+    if suffix == ".gz":
+        return "gzip"
+    if suffix in (".zst", ".zstd"):
+        return "zstd"
+    return None
+
+
+@contextmanager
+def _open_text_output(filepath: str, compression: Optional[str]):
+    """Text file handle that compresses on the fly (None, "gzip" or "zstd")."""
+    if compression is None:
+        with open(filepath, "w", encoding="utf-8") as f:
+            yield f
+    elif compression == "gzip":
+        import gzip
+
+        with gzip.open(filepath, "wt", encoding="utf-8", compresslevel=6) as f:
+            yield f
+    elif compression == "zstd":
+        zstd = _try_import_zstandard()
+        if zstd is None:
+            raise ValueError("zstd compression needs the zstandard package: pip install zstandard")
+        with open(filepath, "wb") as raw:
+            with zstd.ZstdCompressor().stream_writer(raw, closefd=False) as writer:
+                with io.TextIOWrapper(writer, encoding="utf-8") as f:
+                    yield f
+    else:
+        raise ValueError(f"Unknown compression: {compression!r} (use None, 'gzip' or 'zstd')")
+
+
+def save_last_result_json(
+    filepath: str = "last_result.json",
+    rows: Optional[Iterable[Mapping]] = None,
+    ndjson: bool = False,
+    compression: Optional[str] = None,
+) -> None:
+    """
+    Write the last result (or any rows / stream) as a JSON array or as NDJSON,
+    one row at a time. Compression defaults to the file extension (.gz / .zst).
+    """
+    rows = _last_rows() if rows is None else rows
+    rows = rows.iter_dicts() if isinstance(rows, QueryResult) else iter(rows)
+    first = next(rows, None)
+    if first is None:
         print("No last result to save.")
         return
-    Path(filepath).write_text(json.dumps(_LAST_RESULT, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    if compression is None:
+        compression = _compression_for(filepath)
+    try:
+        with _open_text_output(filepath, compression) as f:
+            if ndjson:
+                encode = json.JSONEncoder(default=_json_default, ensure_ascii=False, separators=(",", ":")).encode
+                for row in itertools.chain([first], rows):
+                    f.write(encode(row if isinstance(row, dict) else dict(row)))
+                    f.write("\n")
+            else:
+                # Same layout as json.dumps(rows, indent=2), written one row at a time.
+                encode = json.JSONEncoder(default=_json_default, ensure_ascii=False, indent=2).encode
+                f.write("[\n")
+                for i, row in enumerate(itertools.chain([first], rows)):
+                    if i:
+                        f.write(",\n")
+                    f.write(textwrap.indent(encode(row if isinstance(row, dict) else dict(row)), "  "))
+                f.write("\n]")
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return
     print(f"Saved last result to {filepath}")
 
 
-def save_last_result_csv(filepath: str = "last_result.csv") -> None:
-    if not _LAST_RESULT:
-        print("No last result to save.")
+def save_last_result_ndjson(filepath: str = "last_result.ndjson.gz", rows: Optional[Iterable[Mapping]] = None) -> None:
+    save_last_result_json(filepath, rows=rows, ndjson=True)
+
+
+def save_last_result_csv(filepath: str = "last_result.csv", rows: Optional[Iterable[Mapping]] = None) -> None:
+    rows = _last_rows() if rows is None else rows
+    if isinstance(rows, QueryResult):
+        if not rows:
+            print("No last result to save.")
+            return
+        with open(filepath, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(rows.columns)
+            writer.writerows(rows.iter_tuples())
+        print(f"Saved last result to {filepath}")
         return
-    headers = sorted({k for row in _LAST_RESULT for k in row.keys()})
+
+    if isinstance(rows, list):
+        if not rows:
+            print("No last result to save.")
+            return
+        headers = sorted({k for row in rows for k in row.keys()})
+    else:
+        # A stream can only be read once: take the header from the first row.
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            print("No last result to save.")
+            return
+        headers = list(first.keys())
+        rows = itertools.chain([first], rows)
+
     with open(filepath, "w", newline="", encoding="utf-8") as f:
         writer = csv.DictWriter(f, fieldnames=headers)
         writer.writeheader()
-        writer.writerows(_LAST_RESULT)
+        writer.writerows(rows)
     print(f"Saved last result to {filepath}")
 
+
+COPY_BUFFER_SIZE = 1 << 16
+
+
+def export_query_csv(query=None, filepath: str = "last_result.csv", params=None) -> Optional[int]:
+    """
+    Re-run a SELECT (default: the last one) as COPY ... TO STDOUT WITH CSV HEADER
+    and stream it straight into `filepath`. Nothing goes through _LAST_RESULT,
+    so memory use does not depend on the table size. Returns the row count.
+    """
+    if query is None:
+        query, params = _LAST_QUERY, _LAST_PARAMS
+    if not query:
+        print("No last query to export.")
+        return None
+
+    copy_sql = f"COPY ({_sql_text(query).strip().rstrip(';').strip()}) TO STDOUT WITH CSV HEADER"
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cur, open(filepath, "wb") as f:
+                if params is not None:
+                    # COPY cannot take bind parameters: interpolate them client-side
+                    copy_sql = cur.mogrify(copy_sql, params).decode()
+                # the query is re-executed, so make sure it cannot write anything
+                cur.execute("SET TRANSACTION READ ONLY;")
+                cur.copy_expert(copy_sql, f, size=COPY_BUFFER_SIZE)
+                rows = cur.rowcount
+    except PsycopgError as e:
+        Path(filepath).unlink(missing_ok=True)
+        msg = getattr(e, "pgerror", None) or str(e)
+        print("\n[SQL ERROR] Export failed.")
+        print(f"Details: {msg.strip()}")
+        return None
+
+    print(f"Exported {rows} rows to {filepath}")
+    return rows
+
+# ============================
+# Query catalog: the ONE definition of every task query
+# (prepared statements; literals are bind parameters, so every variant reuses one plan)
+# ============================
+TASK2_ALL_MOVIES = prepare_statement("task2_all_movies", "SELECT * FROM public.movies;")
+TASK2_ALL_CUSTOMERS = prepare_statement("task2_all_customers", "SELECT * FROM public.customers;")
+TASK2_ALL_ACTORS = prepare_statement("task2_all_actors", "SELECT * FROM public.actors;")
+TASK3_MOVIES_RELEASED_AFTER = prepare_statement(
+    "task3_movies_released_after",
+    "SELECT * FROM public.movies WHERE year_of_release > %s;",
+)
+TASK3_CUSTOMERS_FROM_COUNTRY = prepare_statement(
+    "task3_customers_from_country",
+    "SELECT * FROM public.customers WHERE country = %s;",
+)
+TASK3_RENTINGS_RATING_AT_LEAST = prepare_statement(
+    "task3_rentings_rating_at_least",
+    "SELECT * FROM public.rentings WHERE rating >= %s;",
+)
+TASK4_TOTAL_MOVIES = prepare_statement(
+    "task4_total_movies",
+    "SELECT COUNT(movie_id) AS total_movies FROM public.movies;",
+)
+TASK4_TOTAL_CUSTOMERS = prepare_statement(
+    "task4_total_customers",
+    "SELECT COUNT(customer_id) AS total_customers FROM public.customers;",
+)
+TASK4_AVG_RENTING_PRICE = prepare_statement(
+    "task4_avg_renting_price",
+    """
+        SELECT AVG(renting_price) AS avg_renting_price
+        FROM public.movies
+        WHERE renting_price IS NOT NULL;
+    """,
+)
+TASK4_AVG_RATING = prepare_statement(
+    "task4_avg_rating",
+    "SELECT AVG(rating) AS avg_rating FROM public.rentings WHERE rating IS NOT NULL;",
+)
+TASK5_MOVIES_PER_GENRE = prepare_statement(
+    "task5_movies_per_genre",
+    """
+        SELECT genre, COUNT(movie_id) AS movie_count
+        FROM public.movies
+        GROUP BY genre
+        ORDER BY movie_count DESC;
+    """,
+)
+TASK5_CUSTOMERS_PER_COUNTRY = prepare_statement(
+    "task5_customers_per_country",
+    """
+        SELECT country, COUNT(customer_id) AS customer_count
+        FROM public.customers
+        GROUP BY country
+        ORDER BY customer_count DESC;
+    """,
+)
+TASK5_RENTINGS_PER_MOVIE = prepare_statement(
+    "task5_rentings_per_movie",
+    """
+        SELECT m.title, COUNT(r.renting_id) AS renting_count
+        FROM public.movies m
+        JOIN public.rentings r ON r.movie_id = m.movie_id
+        GROUP BY m.title
+        ORDER BY renting_count DESC;
+    """,
+)
+TASK6_MOVIES_WITH_AVG_RATING = prepare_statement(
+    "task6_movies_with_avg_rating",
+    """
+        SELECT
+          m.title,
+          AVG(r.rating) AS avg_rating
+        FROM public.movies m
+        JOIN public.rentings r ON r.movie_id = m.movie_id
+        WHERE r.rating IS NOT NULL
+        GROUP BY m.title
+        ORDER BY avg_rating DESC;
+    """,
+)
+TASK6_ACTORS_MOVIE_COUNT = prepare_statement(
+    "task6_actors_movie_count",
+    """
+        SELECT
+          a.name AS actor_name,
+          COUNT(ac.movie_id) AS movie_count
+        FROM public.actors a
+        LEFT JOIN public.actsin ac ON ac.actor_id = a.actor_id
+        GROUP BY a.name
+        ORDER BY movie_count DESC;
+    """,
+)
+TASK6_CUSTOMERS_RENTALS_COUNT = prepare_statement(
+    "task6_customers_rentals_count",
+    """
+        SELECT
+          c.name AS customer_name,
+          COUNT(r.renting_id) AS rentals_count
+        FROM public.customers c
+        LEFT JOIN public.rentings r ON r.customer_id = c.customer_id
+        GROUP BY c.name
+        ORDER BY rentals_count DESC;
+    """,
+)
+TASK7_GENRES_WITH_MORE_THAN = prepare_statement(
+    "task7_genres_with_more_than",
+    """
+        SELECT genre, COUNT(movie_id) AS total_movies
+        FROM public.movies
+        GROUP BY genre
+        HAVING COUNT(movie_id) > %s
+        ORDER BY total_movies DESC;
+    """,
+)
+TASK7_MOVIES_AVG_RATING_ABOVE = prepare_statement(
+    "task7_movies_avg_rating_above",
+    """
+        SELECT
+          m.title,
+          AVG(r.rating) AS avg_rating
+        FROM public.movies m
+        JOIN public.rentings r ON r.movie_id = m.movie_id
+        WHERE r.rating IS NOT NULL
+        GROUP BY m.title
+        HAVING AVG(r.rating) > %s
+        ORDER BY avg_rating DESC;
+    """,
+)
+TASK7_CUSTOMERS_WITH_MORE_THAN = prepare_statement(
+    "task7_customers_with_more_than",
+    """
+        SELECT
+          c.name AS customer_name,
+          COUNT(r.renting_id) AS total_rentals
+        FROM public.customers c
+        JOIN public.rentings r ON r.customer_id = c.customer_id
+        GROUP BY c.name
+        HAVING COUNT(r.renting_id) > %s
+        ORDER BY total_rentals DESC;
+    """,
+)
+# the get_* functions' own versions of the Task 6/7 reports: they return the ids and the
+# stored movies.avg_rating, so they are separate entries, not the menu queries above
+GET_MOVIES_WITH_AVG_RATING = prepare_statement(
+    "get_movies_with_avg_rating",
+    """
+        SELECT
+          movie_id,
+          title,
+          avg_rating
+        FROM public.movies
+        ORDER BY avg_rating DESC NULLS LAST;
+    """,
+)
+GET_ACTORS_WITH_MOVIE_COUNT = prepare_statement(
+    "get_actors_with_movie_count",
+    """
+        SELECT
+          a.actor_id,
+          a.name AS actor_name,
+          COUNT(ac.movie_id) AS movie_count
+        FROM public.actors a
+        LEFT JOIN public.actsin ac ON ac.actor_id = a.actor_id
+        GROUP BY a.actor_id, a.name
+        ORDER BY movie_count DESC;
+    """,
+)
+GET_CUSTOMERS_WITH_RENTALS_COUNT = prepare_statement(
+    "get_customers_with_rentals_count",
+    """
+        SELECT
+          c.customer_id,
+          c.name AS customer_name,
+          COUNT(r.renting_id) AS rentals_count
+        FROM public.customers c
+        LEFT JOIN public.rentings r ON r.customer_id = c.customer_id
+        GROUP BY c.customer_id, c.name
+        ORDER BY rentals_count DESC;
+    """,
+)
+GET_MOVIES_WITH_AVG_RATING_ABOVE = prepare_statement(
+    "get_movies_with_avg_rating_above",
+    """
+        SELECT
+            movie_id,
+            title,
+            genre,
+            avg_rating
+        FROM public.movies
+        GROUP BY movie_id, title, genre, avg_rating
+        HAVING avg_rating > %s
+        ORDER BY avg_rating DESC;
+    """,
+)
+GET_CUSTOMERS_WITH_MORE_THAN = prepare_statement(
+    "get_customers_with_more_than",
+    """
+        SELECT
+            c.customer_id,
+            COUNT(r.renting_id) AS total_rentals
+        FROM public.customers c
+        JOIN public.rentings r ON r.customer_id = c.customer_id
+        GROUP BY c.customer_id
+        HAVING COUNT(r.renting_id) > %s
+        ORDER BY total_rentals DESC;
+    """,
+)
+
 # ============================
 # Task 2 – SELECT queries
 # ============================
 def get_all_movies(cursor):
-    query = "SELECT * FROM movies;"
-    return run_query(cursor, query)
+    return run_query(cursor, TASK2_ALL_MOVIES)
 
 def get_all_customers(cursor):
-    query = "SELECT * FROM customers;"
-    return run_query(cursor, query)
+    return run_query(cursor, TASK2_ALL_CUSTOMERS)
 
 def get_all_actors(cursor):
-    query = "SELECT * FROM actors;"
-    return run_query(cursor, query)
+    return run_query(cursor, TASK2_ALL_ACTORS)
+
+# ---------------------------------------------------------
+# Table browsing: LIMIT push-down + keyset pagination
+# ---------------------------------------------------------
+# primary key used for keyset paging (None = no key, pages use OFFSET)
+BROWSE_KEYS = {
+    "movies": "movie_id",
+    "customers": "customer_id",
+    "actors": "actor_id",
+    "rentings": "renting_id",
+    "actsin": "actsin_id",
+    "log_activity": "log_id",
+    "view_actor_summary": None,
+}
+_IDENTIFIER = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+class TableBrowser:
+    """
+    Page through one table without reading all of it.
+
+    Each page is `WHERE key > <last key> ORDER BY key LIMIT n` (the previous page
+    uses `<` and DESC), so every page costs the same no matter how deep you are.
+    The "N more rows" hint comes from an EXPLAIN row estimate, not from fetching.
+    """
+
+    def __init__(self, table: str, columns: Optional[List[str]] = None, page_size: int = BROWSE_PAGE_SIZE):
+        if table not in BROWSE_KEYS:
+            raise ValueError(f"Unknown table: {table}")
+        self.table = table
+        self.key = BROWSE_KEYS[table]
+        self.page_size = page_size
+        self.page = QueryResult.empty()
+        self.offset = 0  # rows before the current page
+        self.set_columns(columns)
+
+    def set_columns(self, columns: Optional[List[str]] = None) -> None:
+        """Column projection; the key column is always kept (paging needs it)."""
+        columns = [c.strip().lower() for c in (columns or []) if c.strip()]
+        for name in columns:
+            if not _IDENTIFIER.match(name):
+                raise ValueError(f"Invalid column name: {name!r}")
+        if columns and self.key and self.key not in columns:
+            columns.insert(0, self.key)
+        self.columns = columns
+        select_list = ", ".join(columns) if columns else "*"
+        self._select = f"SELECT {select_list} FROM public.{self.table}"
+        self._order_by: Optional[str] = None
+
+    def order_by(self) -> str:
+        """
+        ORDER BY list of the pages: the key, or for keyless views every selected column
+        (Postgres keeps no stable row order between queries, so OFFSET pages need one).
+        """
+        if self.key:
+            return self.key
+        if self._order_by is None:
+            names = self.columns or list(table_schema(self.table))
+            self._order_by = ", ".join('"' + name.replace('"', '""') + '"' for name in names)
+        return self._order_by
+
+    def full_query(self) -> str:
+        """The whole (projected) table in page order - what saving/exporting uses."""
+        return f"{self._select} ORDER BY {self.order_by()}"
+
+    def _fetch_page(self, after=None, before=None) -> QueryResult:
+        key, n = self.key, self.page_size
+        if key is None:
+            # no key to seek on: fall back to OFFSET
+            if after is not None:
+                offset = self.offset + len(self.page)
+            elif before is not None:
+                offset = max(0, self.offset - n)
+            else:
+                offset = 0
+            return _fetch_all(f"{self._select} ORDER BY {self.order_by()} LIMIT %s OFFSET %s", (n, offset))
+        if after is not None:
+            return _fetch_all(f"{self._select} WHERE {key} > %s ORDER BY {key} LIMIT %s", (after, n))
+        if before is not None:
+            return _fetch_all(
+                f"SELECT * FROM ({self._select} WHERE {key} < %s ORDER BY {key} DESC LIMIT %s) AS page ORDER BY {key}",
+                (before, n),
+            )
+        return _fetch_all(f"{self._select} ORDER BY {key} LIMIT %s", (n,))
+
+    def estimate_after(self) -> int:
+        """Planner's estimate of the rows after the current page (EXPLAIN only, nothing is read)."""
+        if self.key and self.page:
+            sql, params = f"EXPLAIN (FORMAT JSON) SELECT 1 FROM public.{self.table} WHERE {self.key} > %s", (self.page.column(self.key)[-1],)
+        else:
+            sql, params = f"EXPLAIN (FORMAT JSON) SELECT 1 FROM public.{self.table}", None
+        try:
+            with pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(sql, params)
+                    estimate = int(cur.fetchone()[0][0]["Plan"]["Plan Rows"])
+                conn.rollback()
+        except PsycopgError:
+            return 0
+        if not (self.key and self.page):
+            estimate -= self.offset + len(self.page)
+        # the planner never estimates 0 rows; a short page means we are at the end
+        return max(estimate, 0) if len(self.page) == self.page_size else 0
+
+    def first(self) -> QueryResult:
+        self.page, self.offset = self._fetch_page(), 0
+        return self.page
+
+    def next(self) -> Optional[QueryResult]:
+        """Next page, or None at the end of the table (the current page stays)."""
+        if not self.page:
+            return self.first()
+        last = self.page.column(self.key)[-1] if self.key else True
+        rows = self._fetch_page(after=last)
+        if not rows:
+            return None
+        self.offset += len(self.page)
+        self.page = rows
+        return rows
+
+    def prev(self) -> Optional[QueryResult]:
+        """Previous page, or None on the first page."""
+        if self.offset == 0:
+            return None
+        first = self.page.column(self.key)[0] if self.key and self.page else True
+        rows = self._fetch_page(before=first)
+        self.offset = max(0, self.offset - len(rows))
+        self.page = rows
+        return rows
+
+    def show(self, title: str) -> None:
+        global _LAST_RESULT, _LAST_STREAM_QUERY, _LAST_QUERY, _LAST_PARAMS
+
+        _print_rows(title, self.page, max_rows=self.page_size, more=self.estimate_after(), number_from=self.offset + 1)
+        # saving/exporting after browsing still covers the whole (projected) table
+        _LAST_RESULT = QueryResult.empty()
+        _LAST_STREAM_QUERY = _LAST_QUERY = self.full_query()
+        _LAST_PARAMS = None
+
+
+def browse_table(table: str, title: Optional[str] = None, columns: Optional[List[str]] = None,
+                 interactive: Optional[bool] = None) -> QueryResult:
+    """
+    Show the first page of `table`; when interactive (default: stdin is a terminal),
+    keep paging with n(ext) / p(rev), change the projection with c(olumns), q to go back.
+    Returns the page shown last.
+    """
+    title = title or table.upper()
+    browser = TableBrowser(table, columns)
+    browser.first()
+    browser.show(title)
+    if interactive is None:
+        interactive = sys.stdin.isatty()
+
+    while interactive:
+        cmd = input("\n[n]ext, [p]rev, [c]olumns, [q]uit: ").strip().lower()
+        if cmd in ("", "n", "next"):
+            if browser.next() is None:
+                print("(end of table)")
+                continue
+        elif cmd in ("p", "prev"):
+            if browser.prev() is None:
+                print("(already on the first page)")
+                continue
+        elif cmd in ("c", "columns"):
+            names = input("Columns (comma separated, empty = all): ").split(",")
+            try:
+                browser.set_columns(names)
+            except ValueError as e:
+                print(f"[ERROR] {e}")
+                continue
+            browser.first()
+        elif cmd in ("q", "quit", "0"):
+            break
+        else:
+            print("Unknown command.")
+            continue
+        browser.show(title)
+    return browser.page
 
 # ---------------------------------------------------------
 # Convenience fetchers (already used by your menu)
+# Whole tables are not read: they show the first page (LIMIT) and return it.
 # ---------------------------------------------------------
 def fetch_actors():
-    rows = _fetch_all("SELECT * FROM public.actors;")
-    _print_rows("ACTORS", rows)
-    return rows
+    return browse_table("actors", "ACTORS", interactive=False)
 
 def fetch_actsin():
-    rows = _fetch_all("SELECT * FROM public.actsin;")
-    _print_rows("ACTSIN", rows)
-    return rows
+    return browse_table("actsin", "ACTSIN", interactive=False)
 
 def fetch_customers():
-    rows = _fetch_all("SELECT * FROM public.customers;")
-    _print_rows("CUSTOMERS", rows)
-    return rows
+    return browse_table("customers", "CUSTOMERS", interactive=False)
 
 def fetch_log_activity():
-    rows = _fetch_all("SELECT * FROM public.log_activity;")
-    _print_rows("LOG_ACTIVITY", rows)
-    return rows
+    return browse_table("log_activity", "LOG_ACTIVITY", interactive=False)
 
 def fetch_movies():
-    rows = _fetch_all("SELECT * FROM public.movies;")
-    _print_rows("MOVIES", rows)
-    return rows
+    return browse_table("movies", "MOVIES", interactive=False)
 
 def fetch_rentings():
-    rows = _fetch_all("SELECT * FROM public.rentings;")
-    _print_rows("RENTINGS", rows)
-    return rows
+    return browse_table("rentings", "RENTINGS", interactive=False)
 
 def fetch_view_actor_summary():
-    rows = _fetch_all("SELECT * FROM public.view_actor_summary;")
-    _print_rows("VIEW_ACTOR_SUMMARY", rows)
-    return rows
+    return browse_table("view_actor_summary", "VIEW_ACTOR_SUMMARY", interactive=False)
 
 # ============================
 # Task 3 – WHERE Clause
 # ============================
-def fetch_task3_movies_after_2015():
-    rows = _fetch_all("SELECT * FROM public.movies WHERE year_of_release > 2015;")
-    _print_rows("TASK3_MOVIES_AFTER_2015", rows)
+def fetch_task3_movies_after_2015(year: int = 2015):
+    rows = _fetch_all(TASK3_MOVIES_RELEASED_AFTER, (year,))
+    _print_rows(f"TASK3_MOVIES_AFTER_{year}", rows)
     return rows
 
-def fetch_task3_customers_from_canada():
-    rows = _fetch_all("SELECT * FROM public.customers WHERE country = 'Canada';")
-    _print_rows("TASK3_CUSTOMERS_FROM_CANADA", rows)
+def fetch_task3_customers_from_canada(country: str = "Canada"):
+    rows = _fetch_all(TASK3_CUSTOMERS_FROM_COUNTRY, (country,))
+    _print_rows(f"TASK3_CUSTOMERS_FROM_{country.upper()}", rows)
     return rows
 
-def fetch_task3_rentings_rating_ge_4():
-    rows = _fetch_all("SELECT * FROM public.rentings WHERE rating >= 4;")
-    _print_rows("TASK3_RENTINGS_RATING_GE_4", rows)
+def fetch_task3_rentings_rating_ge_4(min_rating: int = 4):
+    rows = _fetch_all(TASK3_RENTINGS_RATING_AT_LEAST, (min_rating,))
+    _print_rows(f"TASK3_RENTINGS_RATING_GE_{min_rating}", rows)
     return rows
 
 # ============================
 # Task 4 – Aggregation Functions
 # ============================
 def get_total_movies(cursor):
-    query = """
-    SELECT COUNT(movie_id) AS total_movies
-    FROM movies;
-    """
-    return run_query(cursor, query)
+    return run_query(cursor, TASK4_TOTAL_MOVIES)
 
 
 def get_total_customers(cursor):
-    query = """
-    SELECT COUNT(customer_id) AS total_customers
-    FROM customers;
-    """
-    return run_query(cursor, query)
+    return run_query(cursor, TASK4_TOTAL_CUSTOMERS)
 
 def get_average_movie_rating(cursor):
-    query = """
-    SELECT AVG(rating) AS avg_rating
-    FROM rentings
-    WHERE rating IS NOT NULL;
-    """
-    return run_query(cursor, query)
+    return run_query(cursor, TASK4_AVG_RATING)
 
 # ============================
 # Task 5 – GROUP BY
 # ============================
 def get_number_of_movies_per_genre(cursor):
-    query = """
-    SELECT
-        genre,
-        COUNT(movie_id) AS movie_count
-    FROM movies
-    GROUP BY genre
-    ORDER BY movie_count DESC;
-    """
-    return run_query(cursor, query)
+    return run_query(cursor, TASK5_MOVIES_PER_GENRE)
 
 def get_number_of_customers_per_country(cursor):
-    query = """
-    SELECT
-        country,
-        COUNT(customer_id) AS customer_count
-    FROM customers
-    GROUP BY country
-    ORDER BY customer_count DESC;
-    """
-    return run_query(cursor, query)
+    return run_query(cursor, TASK5_CUSTOMERS_PER_COUNTRY)
 
 def get_number_of_rentings_per_movie(cursor):
-    query = """
-    SELECT
-        m.title,
-        COUNT(r.renting_id) AS renting_count
-    FROM movies m
-    JOIN rentings r
-        ON r.movie_id = m.movie_id
-    GROUP BY m.title
-    ORDER BY renting_count DESC;
-    """
-    return run_query(cursor, query)
+    return run_query(cursor, TASK5_RENTINGS_PER_MOVIE)
 
 # ============================
 # Task 6 – JOIN Queries
 # ============================
 def get_movies_with_avg_rating(cursor):
-    query = """
-    SELECT
-      movie_id,
-      title,
-      avg_rating
-    FROM movies
-    ORDER BY avg_rating DESC NULLS LAST;
-    """
-    return run_query(cursor, query)
+    return run_query(cursor, GET_MOVIES_WITH_AVG_RATING)
 
 
 def get_actors_with_movie_count(cursor):
-    query = """
-    SELECT
-      a.actor_id,
-      a.name AS actor_name,
-      COUNT(ac.movie_id) AS movie_count
-    FROM actors a
-    LEFT JOIN actsin ac ON ac.actor_id = a.actor_id
-    GROUP BY a.actor_id, a.name
-    ORDER BY movie_count DESC;
-    """
-    return run_query(cursor, query)
+    return run_query(cursor, GET_ACTORS_WITH_MOVIE_COUNT)
 
 
 def get_customers_with_rentals_count(cursor):
-    query = """
-    SELECT
-      c.customer_id,
-      c.name AS customer_name,
-      COUNT(r.renting_id) AS rentals_count
-    FROM customers c
-    LEFT JOIN rentings r ON r.customer_id = c.customer_id
-    GROUP BY c.customer_id, c.name
-    ORDER BY rentals_count DESC;
-    """
-    return run_query(cursor, query)
+    return run_query(cursor, GET_CUSTOMERS_WITH_RENTALS_COUNT)
 
 # ============================
 # Task 7 – HAVING Clause
 # ============================
 def get_genres_with_more_than_3_movies(cursor):
-    query = """
-    SELECT
-        genre,
-        COUNT(movie_id) AS total_movies
-    FROM movies
-    GROUP BY genre
-    HAVING COUNT(movie_id) > 3
-    ORDER BY total_movies DESC;
-    """
-    return run_query(cursor, query)
+    return run_query(cursor, TASK7_GENRES_WITH_MORE_THAN, (3,))
 
 def get_movies_with_avg_rating_above_4(cursor):
-    query = """
-    SELECT
-        movie_id,
-        title,
-        genre,
-        avg_rating
-    FROM movies
-    GROUP BY movie_id, title, genre, avg_rating
-    HAVING avg_rating > 4
-    ORDER BY avg_rating DESC;
-    """
-    return run_query(cursor, query)
+    return run_query(cursor, GET_MOVIES_WITH_AVG_RATING_ABOVE, (4,))
 
 def get_customers_with_more_than_5_rentals(cursor):
-    query = """
-    SELECT
-        c.customer_id,
-        COUNT(r.renting_id) AS total_rentals
-    FROM customers c
-    JOIN rentings r
-        ON r.customer_id = c.customer_id
-    GROUP BY c.customer_id
-    HAVING COUNT(r.renting_id) > 5
-    ORDER BY total_rentals DESC;
-    """
-    return run_query(cursor, query)
+    return run_query(cursor, GET_CUSTOMERS_WITH_MORE_THAN, (5,))
 
 
 BASE_DIR = Path(__file__).resolve().parent
 
+# compiled scripts: path -> (mtime_ns, size, code object); recompiled when the file changes
+_SCRIPT_CODE: Dict[Path, Tuple[int, int, Any]] = {}
+
+
+def _script_code(script_path: Path):
+    stat = script_path.stat()
+    cached = _SCRIPT_CODE.get(script_path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    code = compile(script_path.read_bytes(), str(script_path), "exec")
+    _SCRIPT_CODE[script_path] = (stat.st_mtime_ns, stat.st_size, code)
+    return code
+
+
 def _run_script(relative_path: str) -> None:
-    """Run a .py file as a script (safe for circular-import issues)."""
+    """
+    Run a .py file as a script (safe for circular-import issues).
+
+    Like runpy.run_path(..., run_name="__main__"), but the compiled code is kept
+    for the session, and the data comes from the session dataset cache
+    (load_columns / load_rows), so running a task again is close to instant.
+    """
     script_path = BASE_DIR / relative_path
     if not script_path.exists():
         print(f"[ERROR] Script not found: {script_path}")
         return
 
     print(f"\n--- Running: {relative_path} ---\n")
-    runpy.run_path(str(script_path), run_name="__main__")
+    code = _script_code(script_path)
+
+    # a fresh __main__ module per run, as runpy does
+    module = type(sys)("__main__")
+    module.__file__ = str(script_path)
+    module.__builtins__ = __builtins__
+    saved_main, saved_argv0 = sys.modules.get("__main__"), sys.argv[0]
+    sys.modules["__main__"] = module
+    sys.argv[0] = str(script_path)
+    try:
+        exec(code, module.__dict__)
+    finally:
+        sys.argv[0] = saved_argv0
+        if saved_main is not None:
+            sys.modules["__main__"] = saved_main
+        else:
+            sys.modules.pop("__main__", None)
+
+
+# menu choice -> script, for the P and N menus and for run_all_tasks()
+PROBABILITY_SCRIPTS = {
+    "1": "probability/person1_basic_probability.py",
+    "2": "probability/person2_conditional_probability.py",
+    "3": "probability/person3_independent_events.py",
+    "4": "probability/DiscreteRandVar.py",
+    "5": "probability/montecarlo_nelson.py",
+    "6": "probability/person6_bayes_theorem.py",
+}
+NUMPY_SCRIPTS = {
+    "1": "numpy/person1_numpy_task1.py",
+    "2": "numpy/Person2_Conditional_Probability_with_NumPy_Masks.py",
+    "3": "numpy/person3_numpy_task3.py",
+    "4": "numpy/DiscreteVarNumpy.py",
+    "5": "numpy/montecarlonumpyT5_nelson.py",
+    "6": "numpy/person6_numpy_task6.py",
+    "7": "numpy/person7_numpy_task7.py",
+}
 
 
 def show_probability_menu():
@@ -422,18 +3216,8 @@ def handle_probability_menu():
 
         if ch == "0":
             break
-        elif ch == "1":
-            _run_script("probability/person1_basic_probability.py")
-        elif ch == "2":
-            _run_script("probability/person2_conditional_probability.py")
-        elif ch == "3":
-            _run_script("probability/person3_independent_events.py")
-        elif ch == "4":
-            _run_script("probability/DiscreteRandVar.py")
-        elif ch == "5":
-            _run_script("probability/montecarlo_nelson.py")
-        elif ch == "6":
-            _run_script("probability/person6_bayes_theorem.py")
+        elif ch in PROBABILITY_SCRIPTS:
+            _run_script(PROBABILITY_SCRIPTS[ch])
         else:
             print("Invalid option.")
 
@@ -456,23 +3240,158 @@ def handle_numpy_menu():
 
         if ch == "0":
             break
-        elif ch == "1":
-            _run_script("numpy/person1_numpy_task1.py")
-        elif ch == "2":
-            _run_script("numpy/Person2_Conditional_Probability_with_NumPy_Masks.py")
-        elif ch == "3":
-            _run_script("numpy/person3_numpy_task3.py")
-        elif ch == "4":
-            _run_script("numpy/DiscreteVarNumpy.py")
-        elif ch == "5":
-            _run_script("numpy/montecarlonumpyT5_nelson.py")
-        elif ch == "6":
-            _run_script("numpy/person6_numpy_task6.py")
-        elif ch == "7":
-            _run_script("numpy/person7_numpy_task7.py")
+        elif ch in NUMPY_SCRIPTS:
+            _run_script(NUMPY_SCRIPTS[ch])
         else:
             print("Invalid option.")
 
+# ---------------------------------------------------------
+# Run every task headless in a process pool (python server.py tasks)
+# ---------------------------------------------------------
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", str(os.cpu_count() or 2)))
+# stdin for scripts that ask questions (everything else gets an empty stdin, so input() fails fast)
+TASK_INPUTS = {
+    "probability/montecarlo_nelson.py": "1\n2\n3\n4\n5\n6\n7\n0\n",
+}
+
+
+def _try_import_resource():
+    try:
+        import resource
+        return resource
+    except Exception:
+        return None
+
+
+def _run_task_headless(relative_path: str, out_dir: str) -> Dict[str, Any]:
+    """
+    Worker: run one script with stdout and stderr in <out_dir>/<name>.txt and every figure
+    saved as <name>_figN.png instead of shown (figure saving is not part of `seconds`).
+    Runs in its own process.
+    """
+    os.environ["MPLBACKEND"] = "Agg"
+    # scripts do `from server import ...`: give them this module, not a second copy
+    sys.modules.setdefault("server", sys.modules[__name__])
+
+    name = Path(relative_path).stem
+    out = Path(out_dir)
+    log_path = out / f"{name}.txt"
+    figures: List[str] = []
+
+    # with the Agg backend plt.show() is a no-op, so every figure is still open at the end
+    import warnings
+
+    warnings.filterwarnings("ignore", message=".*non-interactive.*cannot be shown")
+
+    error = None
+    start = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        saved_stdin = sys.stdin
+        sys.stdin = io.StringIO(TASK_INPUTS.get(relative_path, ""))
+        try:
+            with redirect_stdout(log), redirect_stderr(log):
+                _run_script(relative_path)
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                error = f"exit code {e.code}"
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            log.write(f"\n[ERROR] {error}\n")
+        finally:
+            sys.stdin = saved_stdin
+    wall = time.perf_counter() - start
+
+    plt = sys.modules.get("matplotlib.pyplot")   # only loaded if the task plotted
+    if plt is not None:
+        for num in plt.get_fignums():
+            path = out / f"{name}_fig{len(figures) + 1}.png"
+            plt.figure(num).savefig(path, dpi=100)
+            figures.append(path.name)
+
+    resource = _try_import_resource()
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+    if peak_kb is not None and sys.platform == "darwin":
+        peak_kb //= 1024   # bytes on macOS
+    return {
+        "task": relative_path,
+        "ok": error is None,
+        "error": error,
+        "seconds": wall,
+        "peak_rss_mb": None if peak_kb is None else peak_kb / 1024,
+        "output": log_path.name,
+        "figures": figures,
+    }
+
+
+def run_all_tasks(out_dir: str = "task_runs", workers: int = TASK_WORKERS,
+                  tasks: Optional[List[str]] = None) -> int:
+    """
+    Run every probability/ and numpy/ script at once, one fresh process per task
+    (ProcessPoolExecutor, `workers` at a time), and print wall time and peak RSS
+    per task. Outputs and figures go to `out_dir`, with a summary.json.
+    Returns 0 if every task succeeded, else 1.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    import multiprocessing
+
+    tasks = tasks or [*PROBABILITY_SCRIPTS.values(), *NUMPY_SCRIPTS.values()]
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    results = []
+    # spawn + one task per child: no inherited DB connections, and ru_maxrss is that task's own peak.
+    # max_tasks_per_child needs Python 3.11; before that workers are reused and a task's
+    # peak RSS can include an earlier task's in the same worker.
+    one_task_per_child = {"max_tasks_per_child": 1} if sys.version_info >= (3, 11) else {}
+    with ProcessPoolExecutor(
+        max_workers=max(1, workers),
+        mp_context=multiprocessing.get_context("spawn"),
+        **one_task_per_child,
+    ) as pool:
+        futures = [pool.submit(_run_task_headless, task, str(out)) for task in tasks]
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:   # the worker process itself died
+                task = tasks[futures.index(future)]
+                results.append({"task": task, "ok": False, "error": f"{type(e).__name__}: {e}",
+                                "seconds": None, "peak_rss_mb": None, "output": None, "figures": []})
+    wall = time.perf_counter() - start
+
+    results.sort(key=lambda r: tasks.index(r["task"]))
+    print(f"\n{'task':<58} {'status':<7} {'seconds':>8} {'peak MB':>8}  figures")
+    for r in results:
+        seconds = "-" if r["seconds"] is None else f"{r['seconds']:.2f}"
+        peak = "-" if r["peak_rss_mb"] is None else f"{r['peak_rss_mb']:.0f}"
+        print(f"{r['task']:<58} {'ok' if r['ok'] else 'FAILED':<7} {seconds:>8} {peak:>8}  {len(r['figures'])}")
+        if r["error"]:
+            print(f"    {r['error']}")
+    task_total = sum(r["seconds"] or 0 for r in results)
+    failed = sum(not r["ok"] for r in results)
+    print(f"\n{len(results)} tasks, {failed} failed, {wall:.2f} s wall time "
+          f"({task_total:.2f} s of task time, {max(1, workers)} workers). Output in {out}/")
+
+    summary = {"wall_seconds": wall, "workers": max(1, workers), "tasks": results}
+    (out / "summary.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    return 1 if failed else 0
+
+
+def _tasks_main(argv: List[str]) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="server.py tasks",
+        description="Run all probability/ and numpy/ tasks headless and in parallel.",
+    )
+    parser.add_argument("--workers", type=int, default=TASK_WORKERS, help=f"processes (default: {TASK_WORKERS})")
+    parser.add_argument("--out", default="task_runs", help="directory for outputs and figures (default: task_runs)")
+    parser.add_argument("tasks", nargs="*", help="only these scripts (e.g. numpy/person7_numpy_task7.py)")
+    args = parser.parse_args(argv)
+    unknown = [t for t in args.tasks if not (BASE_DIR / t).exists()]
+    if unknown:
+        parser.error(f"no such script: {', '.join(unknown)}")
+    return run_all_tasks(args.out, args.workers, args.tasks or None)
 
 
 # ---------------------------------------------------------
@@ -511,187 +3430,272 @@ def show_menu():
     print("17. Movies with average rating above 4")
     print("18. Customers who rented more than 5 movies")
 
+    print("R. Run all Task 4–7 reports at once (concurrent; RP: one round trip)")
+
     print("\n--- Task 9: Error Handling ---")
     print("19. Run an INVALID query (should not crash)")
 
     print("\n--- Bonus Tasks ---")
     print("20. Save last result as JSON")
     print("21. Save last result as CSV")
+    print("22. Export last query as CSV (COPY, streamed from the database)")
+    print("23. Save last result as gzipped NDJSON")
+
+    print("\n--- Tools ---")
+    print("24. Query cache statistics (24c to clear the cache)")
+    print("25. Query latency metrics (25j: save JSON, 25p: save Prometheus text)")
+    print("26. EXPLAIN capture on/off (26r: report, 26a: capture all menu queries, 26j: save plans)")
 
     print("\n--- Extra ---")
     print("P. Probability Homework (run scripts)")
 
     print("\n--- Extra ---")
     print("N. NumPy Probability Homework")
+    print("T. Run all probability and NumPy tasks headless, in parallel (output in task_runs/)")
 
     print("\n0. Exit")
 
 def fetch_task4_total_movies():
-    rows = _fetch_all("SELECT COUNT(movie_id) AS total_movies FROM public.movies;")
+    rows = _fetch_all(TASK4_TOTAL_MOVIES)
     _print_rows("TASK4_TOTAL_MOVIES", rows)
     return rows
 
 def fetch_task4_avg_renting_price():
-    rows = _fetch_all("""
-        SELECT AVG(renting_price) AS avg_renting_price
-        FROM public.movies
-        WHERE renting_price IS NOT NULL;
-    """)
+    rows = _fetch_all(TASK4_AVG_RENTING_PRICE)
     _print_rows("TASK4_AVG_RENTING_PRICE", rows)
     return rows
 
 def fetch_task4_avg_rating():
-    rows = _fetch_all("SELECT AVG(rating) AS avg_rating FROM public.rentings WHERE rating IS NOT NULL;")
+    rows = _fetch_all(TASK4_AVG_RATING)
     _print_rows("TASK4_AVG_RATING", rows)
     return rows
 
+# ============================
+# Menu choices that are plain queries: choice -> (title, query, params)
+# ============================
+MENU_QUERIES = {
+    "1": ("TASK2_ALL_MOVIES", TASK2_ALL_MOVIES, None),
+    "2": ("TASK2_ALL_CUSTOMERS", TASK2_ALL_CUSTOMERS, None),
+    "3": ("TASK2_ALL_ACTORS", TASK2_ALL_ACTORS, None),
+    "4": ("TASK3_MOVIES_AFTER_2015", TASK3_MOVIES_RELEASED_AFTER, (2015,)),
+    "5": ("TASK3_CUSTOMERS_FROM_CANADA", TASK3_CUSTOMERS_FROM_COUNTRY, ("Canada",)),
+    "6": ("TASK3_RENTINGS_RATING_GE_4", TASK3_RENTINGS_RATING_AT_LEAST, (4,)),
+    "7": ("TASK4_TOTAL_MOVIES", TASK4_TOTAL_MOVIES, None),
+    "8": ("TASK4_AVG_RENTING_PRICE", TASK4_AVG_RENTING_PRICE, None),
+    "9": ("TASK4_AVG_RATING", TASK4_AVG_RATING, None),
+    "10": ("TASK5_MOVIES_PER_GENRE", TASK5_MOVIES_PER_GENRE, None),
+    "11": ("TASK5_CUSTOMERS_PER_COUNTRY", TASK5_CUSTOMERS_PER_COUNTRY, None),
+    "12": ("TASK5_RENTINGS_PER_MOVIE", TASK5_RENTINGS_PER_MOVIE, None),
+    "13": ("TASK6_MOVIES_WITH_AVG_RATING", TASK6_MOVIES_WITH_AVG_RATING, None),
+    "14": ("TASK6_ACTORS_MOVIE_COUNT", TASK6_ACTORS_MOVIE_COUNT, None),
+    "15": ("TASK6_CUSTOMERS_RENTALS_COUNT", TASK6_CUSTOMERS_RENTALS_COUNT, None),
+    "16": ("TASK7_GENRES_GT_3_MOVIES", TASK7_GENRES_WITH_MORE_THAN, (3,)),
+    "17": ("TASK7_MOVIES_AVG_RATING_GT_4", TASK7_MOVIES_AVG_RATING_ABOVE, (4,)),
+    "18": ("TASK7_CUSTOMERS_GT_5_RENTALS", TASK7_CUSTOMERS_WITH_MORE_THAN, (5,)),
+}
+
+# whole-table choices: shown a page at a time (TableBrowser) instead of read completely
+BROWSED_CHOICES = {"1": "movies", "2": "customers", "3": "actors"}
+
+
+def run_menu_query(choice: str, interactive: bool = False):
+    """Run one query menu choice from MENU_QUERIES and print it."""
+    title, query, params = MENU_QUERIES[choice]
+    if choice in BROWSED_CHOICES:
+        return browse_table(BROWSED_CHOICES[choice], title, interactive=interactive and sys.stdin.isatty())
+    rows = _fetch_all(query, params)
+    _print_rows(title, rows)
+    return rows
+
+# ============================
+# Tasks 4–7 together (independent aggregates, run concurrently)
+# ============================
+TASK4_7_REPORTS = {
+    title: (query, params)
+    for choice, (title, query, params) in MENU_QUERIES.items()
+    if 7 <= int(choice) <= 18
+}
+
+
+def run_all_task4_7_reports(pipeline: bool = False) -> Dict[str, QueryResult]:
+    """
+    Run every Task 4–7 report at once and print them in menu order: concurrently through
+    the async engine, or with pipeline=True (or without asyncpg) in one round trip.
+    """
+    start = time.perf_counter()
+    if pipeline or _try_import_asyncpg() is None:
+        results = run_pipeline(TASK4_7_REPORTS)
+    else:
+        results = run_concurrently(TASK4_7_REPORTS)
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    for title, rows in results.items():
+        _print_rows(title, rows, label=query_label(TASK4_7_REPORTS[title][0]))
+
+    print(f"\n[{len(results)} reports in {wall_ms:.2f} ms wall time]")
+    return results
+
+
+# ============================
+# Batch mode: python server.py run 10 11 task5_movies_per_genre --out results/
+# ============================
+BATCH_FORMATS = ("csv", "json", "ndjson")
+
+
+def _batch_jobs(items: List[str]) -> List[Tuple[str, Any, Any]]:
+    """Resolve menu choices / statement names to (file stem, query, params). Unknown items raise ValueError."""
+    jobs = []
+    for item in items:
+        if item in MENU_QUERIES:
+            title, query, params = MENU_QUERIES[item]
+            jobs.append((f"{int(item):02d}_{title.lower()}", query, params))
+        elif item in QUERY_CATALOG:
+            stmt = QUERY_CATALOG[item]
+            if stmt.nparams:
+                raise ValueError(f"{item} needs {stmt.nparams} parameter(s); use its menu number instead.")
+            jobs.append((item, stmt, None))
+        else:
+            raise ValueError(f"Unknown menu choice or query name: {item}")
+    return jobs
+
+
+def _begin_snapshot(cur) -> None:
+    # one consistent, read-only view of the data for every query in the batch
+    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;")
+
+
+def _count_rows(rows: Iterable[Mapping], counter: List[int]) -> Iterator[Mapping]:
+    for row in rows:
+        counter[0] += 1
+        yield row
+
+
+def run_batch(items: List[str], out_dir: str = ".", fmt: str = "csv") -> int:
+    """
+    Run menu choices / catalog statements without the menu, on ONE pooled
+    connection inside one REPEATABLE READ, READ ONLY transaction, writing each
+    result straight to `out_dir` (CSV via COPY, JSON/NDJSON from a server-side cursor).
+    Prints a per-query timing summary and returns the exit code (1 if any query failed).
+    """
+    if fmt not in BATCH_FORMATS:
+        raise ValueError(f"unsupported format {fmt!r} (use one of {', '.join(BATCH_FORMATS)})")
+    jobs = _batch_jobs(items)
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    suffix = f".{fmt}"
+
+    summary = []
+    batch_start = time.perf_counter()
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            _begin_snapshot(cur)
+            for stem, query, params in jobs:
+                label = query_label(query)
+                # COPY and named cursors cannot EXECUTE a prepared statement, so send the SQL text
+                sql = _sql_text(query).strip().rstrip(";").strip()
+                if params is not None:
+                    sql = cur.mogrify(sql, params).decode()
+                path = out / f"{stem}{suffix}"
+                start = time.perf_counter()
+                # a failing job only rolls back to here, so the snapshot stays the same for every job
+                cur.execute("SAVEPOINT batch_job")
+                try:
+                    if fmt == "csv":
+                        with open(path, "wb") as f:
+                            cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH CSV HEADER", f, size=COPY_BUFFER_SIZE)
+                        rows = cur.rowcount
+                    else:
+                        counter = [0]
+                        with conn.cursor(name=f"batch_{next(_STREAM_IDS)}", cursor_factory=RealDictCursor) as named:
+                            named.itersize = STREAM_ITERSIZE
+                            named.execute(sql)
+                            with redirect_stdout(io.StringIO()):
+                                save_last_result_json(str(path), rows=_count_rows(named, counter), ndjson=fmt == "ndjson")
+                        rows = counter[0]
+                        if rows == 0:
+                            path.write_text("[]\n" if fmt == "json" else "", encoding="utf-8")
+                    cur.execute("RELEASE SAVEPOINT batch_job")
+                    elapsed = time.perf_counter() - start
+                    _METRICS.record(label, {"execute": elapsed}, rows=rows)
+                    summary.append((stem, rows, elapsed * 1000, str(path)))
+                except PsycopgError as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT batch_job")
+                    cur.execute("RELEASE SAVEPOINT batch_job")
+                    Path(path).unlink(missing_ok=True)
+                    _METRICS.record(label, error=True)
+                    summary.append((stem, None, (time.perf_counter() - start) * 1000, str(e).strip().splitlines()[0]))
+        conn.rollback()
+
+    total_ms = (time.perf_counter() - batch_start) * 1000
+    width = max((len(stem) for stem, *_ in summary), default=len("query"))
+    print(f"\n{'query':<{width}} {'rows':>9} {'ms':>10}  output")
+    for stem, rows, ms, target in summary:
+        shown = "FAILED" if rows is None else rows
+        print(f"{stem:<{width}} {shown:>9} {ms:>10.2f}  {target}")
+    failed = sum(1 for _, rows, _, _ in summary if rows is None)
+    print(f"\n{len(summary)} queries, {failed} failed, {total_ms:.2f} ms total")
+    return 1 if failed else 0
+
+
+def _batch_main(argv: List[str]) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="server.py run",
+        description="Run menu choices (1-18) or statement names without the menu and save the results.",
+    )
+    parser.add_argument("items", nargs="+", help="menu choices like 10 11 12, or names like task5_movies_per_genre")
+    parser.add_argument("--out", default=".", help="directory for the result files (default: current directory)")
+    parser.add_argument("--format", choices=BATCH_FORMATS, default="csv")
+    args = parser.parse_args(argv)
+    try:
+        return run_batch(args.items, args.out, args.format)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+def _snapshot_main(argv: List[str]) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="server.py snapshot",
+        description="Dump the core tables into a local columnar snapshot (.npy per column) for offline analysis.",
+    )
+    parser.add_argument("--out", default=SNAPSHOT_DIR, help=f"snapshot directory (default: {SNAPSHOT_DIR})")
+    parser.add_argument("--tables", nargs="+", default=list(SNAPSHOT_TABLES), help="tables to dump")
+    parser.add_argument("--refresh", action="store_true",
+                        help="update the existing snapshot with new/changed rows only (see refresh_snapshot)")
+    args = parser.parse_args(argv)
+    try:
+        if args.refresh:
+            refresh_snapshot(args.out)
+        else:
+            take_snapshot(args.out, args.tables)
+    except (ValueError, FileNotFoundError, PsycopgError) as e:
+        print(f"[ERROR] Snapshot failed: {str(e).strip()}")
+        return 1
+    return 0
+
+
 def _task9_invalid_query_demo():
     print("\n=== Task 9 Demo: invalid SQL (should not crash) ===")
-    conn = None
-    try:
-        conn = get_connection()
+    with pooled_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             run_query(cur, "SELECT * FROM this_table_does_not_exist;")
-    finally:
-        if conn:
-            conn.close()
 
 def _handle_choice(choice: str) -> bool:
     """Returns True if program should continue, False to exit."""
-    if choice == "1":
-        # Task 2
-        rows = _fetch_all("SELECT * FROM public.movies;")
-        _print_rows("TASK2_ALL_MOVIES", rows)
-
-    elif choice == "2":
-        # Task 2
-        rows = _fetch_all("SELECT * FROM public.customers;")
-        _print_rows("TASK2_ALL_CUSTOMERS", rows)
-
-    elif choice == "3":
-        # Task 2
-        rows = _fetch_all("SELECT * FROM public.actors;")
-        _print_rows("TASK2_ALL_ACTORS", rows)
-
-    elif choice == "4":
-        fetch_task3_movies_after_2015()
-
-    elif choice == "5":
-        fetch_task3_customers_from_canada()
-
-    elif choice == "6":
-        fetch_task3_rentings_rating_ge_4()
-
-    elif choice == "7":
-        fetch_task4_total_movies()
-
-    elif choice == "8":
-        fetch_task4_avg_renting_price()
-
-    elif choice == "9":
-        fetch_task4_avg_rating()
-
-    elif choice == "10":
-        rows = _fetch_all("""SELECT genre, COUNT(movie_id) AS movie_count
-                            FROM public.movies
-                            GROUP BY genre
-                            ORDER BY movie_count DESC;""")
-        _print_rows("TASK5_MOVIES_PER_GENRE", rows)
-
-    elif choice == "11":
-        rows = _fetch_all("""SELECT country, COUNT(customer_id) AS customer_count
-                            FROM public.customers
-                            GROUP BY country
-                            ORDER BY customer_count DESC;""")
-        _print_rows("TASK5_CUSTOMERS_PER_COUNTRY", rows)
-
-    elif choice == "12":
-        rows = _fetch_all("""SELECT m.title, COUNT(r.renting_id) AS renting_count
-                            FROM public.movies m
-                            JOIN public.rentings r ON r.movie_id = m.movie_id
-                            GROUP BY m.title
-                            ORDER BY renting_count DESC;""")
-        _print_rows("TASK5_RENTINGS_PER_MOVIE", rows)
-
-    elif choice == "13":
-        # Task 6
-        rows = _fetch_all("""
-            SELECT
-              m.title,
-              AVG(r.rating) AS avg_rating
-            FROM public.movies m
-            JOIN public.rentings r ON r.movie_id = m.movie_id
-            WHERE r.rating IS NOT NULL
-            GROUP BY m.title
-            ORDER BY avg_rating DESC;
-        """)
-        _print_rows("TASK6_MOVIES_WITH_AVG_RATING", rows)
-
-    elif choice == "14":
-        # Task 6
-        rows = _fetch_all("""
-            SELECT
-              a.name AS actor_name,
-              COUNT(ac.movie_id) AS movie_count
-            FROM public.actors a
-            LEFT JOIN public.actsin ac ON ac.actor_id = a.actor_id
-            GROUP BY a.name
-            ORDER BY movie_count DESC;
-        """)
-        _print_rows("TASK6_ACTORS_MOVIE_COUNT", rows)
-
-    elif choice == "15":
-        # Task 6
-        rows = _fetch_all("""
-            SELECT
-              c.name AS customer_name,
-              COUNT(r.renting_id) AS rentals_count
-            FROM public.customers c
-            LEFT JOIN public.rentings r ON r.customer_id = c.customer_id
-            GROUP BY c.name
-            ORDER BY rentals_count DESC;
-        """)
-        _print_rows("TASK6_CUSTOMERS_RENTALS_COUNT", rows)
-
-    elif choice == "16":
-        # Task 7
-        rows = _fetch_all("""
-            SELECT genre, COUNT(movie_id) AS total_movies
-            FROM public.movies
-            GROUP BY genre
-            HAVING COUNT(movie_id) > 3
-            ORDER BY total_movies DESC;
-        """)
-        _print_rows("TASK7_GENRES_GT_3_MOVIES", rows)
-
-    elif choice == "17":
-        # Task 7
-        rows = _fetch_all("""
-            SELECT
-              m.title,
-              AVG(r.rating) AS avg_rating
-            FROM public.movies m
-            JOIN public.rentings r ON r.movie_id = m.movie_id
-            WHERE r.rating IS NOT NULL
-            GROUP BY m.title
-            HAVING AVG(r.rating) > 4
-            ORDER BY avg_rating DESC;
-        """)
-        _print_rows("TASK7_MOVIES_AVG_RATING_GT_4", rows)
-
-    elif choice == "18":
-        # Task 7
-        rows = _fetch_all("""
-            SELECT
-              c.name AS customer_name,
-              COUNT(r.renting_id) AS total_rentals
-            FROM public.customers c
-            JOIN public.rentings r ON r.customer_id = c.customer_id
-            GROUP BY c.name
-            HAVING COUNT(r.renting_id) > 5
-            ORDER BY total_rentals DESC;
-        """)
-        _print_rows("TASK7_CUSTOMERS_GT_5_RENTALS", rows)
+    global EXPLAIN_CAPTURE
+
+    if choice in MENU_QUERIES:
+        # Tasks 2–7: one catalog query each
+        run_menu_query(choice, interactive=True)
+
+    elif choice.upper() == "R":
+        run_all_task4_7_reports()
+
+    elif choice.upper() == "RP":
+        run_all_task4_7_reports(pipeline=True)
 
     elif choice == "19":
         _task9_invalid_query_demo()
@@ -702,6 +3706,42 @@ def _handle_choice(choice: str) -> bool:
     elif choice == "21":
         save_last_result_csv()
 
+    elif choice == "22":
+        export_query_csv()
+
+    elif choice == "23":
+        save_last_result_ndjson()
+
+    elif choice == "24":
+        show_query_cache_stats()
+
+    elif choice.lower() == "24c":
+        get_query_cache().clear()
+        get_dataset_cache().clear()
+        print("Query cache and session datasets cleared.")
+
+    elif choice == "25":
+        show_query_metrics()
+
+    elif choice.lower() == "25j":
+        save_query_metrics("query_metrics.json")
+
+    elif choice.lower() == "25p":
+        save_query_metrics("query_metrics.prom")
+
+    elif choice == "26":
+        EXPLAIN_CAPTURE = not EXPLAIN_CAPTURE
+        print(f"EXPLAIN capture is now {'ON' if EXPLAIN_CAPTURE else 'OFF'}.")
+
+    elif choice.lower() == "26r":
+        show_plan_report()
+
+    elif choice.lower() == "26a":
+        capture_all_menu_plans()
+
+    elif choice.lower() == "26j":
+        save_captured_plans()
+
     elif choice == "0":
         print("Exiting...")
         return False
@@ -712,24 +3752,14 @@ def _handle_choice(choice: str) -> bool:
     elif choice.upper() == "N":
         handle_numpy_menu()
 
+    elif choice.upper() == "T":
+        run_all_tasks()
+
     else:
         print("Invalid option, try again.")
 
     return True
 
-if __name__ == "__main__":
-    while True:
-        try:
-            show_menu()
-            choice = input("\nEnter your choice: ").strip()
-            if not _handle_choice(choice):
-                break
-        except KeyboardInterrupt:
-            print("\nExiting...")
-            break
-        except Exception as e:
-            print(f"\n[ERROR] {e}")
-
 def format_probability(p, decimals: int = 2) -> str:
     try:
         if p is None:
@@ -749,3 +3779,27 @@ def format_number(x, decimals: int = 2) -> str:
         return f"{x:.{decimals}f}"
     except Exception:
         return "N/A"
+
+if __name__ == "__main__":
+    # Scripts started from the menu do `from server import ...`; point that at this
+    # module so they share the same connection pool instead of opening their own.
+    sys.modules.setdefault("server", sys.modules[__name__])
+
+    if len(sys.argv) > 1 and sys.argv[1] == "run":
+        sys.exit(_batch_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "snapshot":
+        sys.exit(_snapshot_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "tasks":
+        sys.exit(_tasks_main(sys.argv[2:]))
+
+    while True:
+        try:
+            show_menu()
+            choice = input("\nEnter your choice: ").strip()
+            if not _handle_choice(choice):
+                break
+        except KeyboardInterrupt:
+            print("\nExiting...")
+            break
+        except Exception as e:
+            print(f"\n[ERROR] {e}")